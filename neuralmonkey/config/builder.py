@@ -6,6 +6,7 @@ specified by the experiment configuration.
 
 import collections
 import importlib
+import os
 from argparse import Namespace
 from inspect import signature, isclass, isfunction, Parameter
 from typing import Any, Dict, Set, Tuple
@@ -13,6 +14,7 @@ from typing import Any, Dict, Set, Tuple
 from neuralmonkey.logging import debug, warn
 from neuralmonkey.config.exceptions import (ConfigInvalidValueException,
                                             ConfigBuildException)
+from neuralmonkey.preprocessing_cache import set_cache_key
 
 
 # pylint:disable=too-few-public-methods
@@ -56,6 +58,8 @@ class ClassSymbol(object):
             raise Exception(("Interpretation '{}' as type name, class '{}' "
                              "does not exist. Did you mean file './{}'? \n{}")
                             .format(self.clazz, class_name, self.clazz, exc))
+
+        set_cache_key(clazz, "{}.{}".format(module.__name__, class_name))
         return clazz
 
 
@@ -202,9 +206,58 @@ def instantiate_class(name: str,
     debug("Class {} initialized into object {}".format(clazz, obj),
           "configBuild")
 
+    # readers and preprocessors (the callable objects) are identified by
+    # their configuration in the preprocessing cache, so the cached series
+    # are not used when the configuration changes
+    if callable(obj) and not isinstance(obj, type):
+        set_cache_key(obj, config_key(name, all_dicts))
+
     return obj
 
 
+def config_key(name: str, all_dicts: Dict[str, Any], depth: int = 0) -> str:
+    """Describe the configuration of an object.
+
+    The description consists of the class of the object and its arguments,
+    including the configuration of the objects it refers to. Arguments that
+    are paths to existing files are described with the file sizes and
+    modification times, so the description changes when the files change.
+
+    Arguments:
+        name: The name of the configuration section of the object.
+        all_dicts: Configuration dictionaries of all objects.
+        depth: The current depth of recursion.
+
+    Returns:
+        The description of the object configuration.
+    """
+    if depth > 20:
+        raise AssertionError("Config recursion should not be deeper that 20.")
+
+    def value_key(value: Any) -> str:
+        if isinstance(value, tuple):
+            return "({})".format(", ".join(value_key(val) for val in value))
+        if isinstance(value, list):
+            return "[{}]".format(", ".join(value_key(val) for val in value))
+        if isinstance(value, ObjectRef):
+            return ".".join([config_key(value.name, all_dicts, depth + 1)]
+                            + value.attr_chain)
+        if isinstance(value, ClassSymbol):
+            return value.clazz
+        if isinstance(value, str) and os.path.isfile(value):
+            stat = os.stat(value)
+            return "{!r}@{}:{}".format(value, stat.st_size, stat.st_mtime)
+        return repr(value)
+
+    this_dict = all_dicts.get(name, {})
+    arguments = ["{}={}".format(key, value_key(value))
+                 for key, value in sorted(this_dict.items())
+                 if key != "class"]
+    clazz = this_dict.get("class")
+    return "{}({})".format(clazz.clazz if clazz is not None else name,
+                           ", ".join(arguments))
+
+
 def build_config(config_dicts: Dict[str, Any],
                  ignore_names: Set[str],
                  warn_unused: bool = False) -> Tuple[Dict[str, Any],
@@ -1,19 +1,28 @@
 """Implementation of the dataset class."""
 
+import copy
+import multiprocessing
 import os
+import pickle
 import random
 import re
 import glob
 import collections
 from itertools import islice
 
-from typing import cast, Any, List, Callable, Iterable, Dict, Tuple, Union
+from typing import (cast, Any, List, Callable, Iterable, Dict, Optional,
+                    Tuple, Union)
 
 import numpy as np
 from typeguard import check_argument_types
 
-from neuralmonkey.logging import log, debug
-from neuralmonkey.readers.plain_text_reader import UtfPlainTextReader
+from neuralmonkey.logging import log, debug, warn
+from neuralmonkey.preprocessing_cache import (
+    PreprocessingCache, read_cache_entries, set_cache_key)
+from neuralmonkey.readers.line_index import (count_lines, file_ranges,
+                                             supports_file_ranges)
+from neuralmonkey.readers.plain_text_reader import (UtfPlainTextReader,
+                                                    read_series)
 
 # pylint: disable=invalid-name
 Reader = Callable[[List[str]], Any]
@@ -29,6 +38,164 @@ SERIES_SOURCE = re.compile("s_([^_]*)$")
 SERIES_OUTPUT = re.compile("s_(.*)_out")
 PREPROCESSED_SERIES = re.compile("pre_([^_]*)$")
 
+# maximum number of series items sent to a preprocessing worker at once
+PREPROCESSING_CHUNK_SIZE = 10000
+
+# the default reader is not created by the configuration builder
+set_cache_key(UtfPlainTextReader,
+              "neuralmonkey.readers.plain_text_reader.UtfPlainTextReader")
+
+
+class BatchingScheme(object):
+    """Specification of how a dataset is split into batches.
+
+    By default, batches contain a fixed number of examples. With token-level
+    batching, the batch size is the maximum number of tokens in a batch
+    (including the padding), so there are more examples in batches of short
+    sentences than in batches of long ones. To reduce the padding, the
+    examples can be grouped into buckets by their length, such that every
+    batch is taken from a single bucket.
+    """
+
+    def __init__(self,
+                 batch_size: int,
+                 token_level_batching: bool = False,
+                 bucket_span: int = None,
+                 length_series: List[str] = None) -> None:
+        """Create a new batching scheme.
+
+        Arguments:
+            batch_size: Number of examples in a batch, or the maximum number
+                of tokens in a batch if ``token_level_batching`` is set.
+            token_level_batching: Whether ``batch_size`` means the number of
+                tokens (including padding) instead of number of examples.
+            bucket_span: The span of example lengths that fall into the same
+                bucket. If None, no bucketing is done. Bucketing changes the
+                order of the examples, so it is used for training only.
+            length_series: Names of the series which determine the length of
+                an example. If None, all series with sized items are used.
+        """
+        check_argument_types()
+
+        if batch_size <= 0:
+            raise ValueError("Batch size must be a positive number.")
+        if bucket_span is not None and bucket_span <= 0:
+            raise ValueError("Bucket span must be a positive number.")
+
+        self.batch_size = batch_size
+        self.token_level_batching = token_level_batching
+        self.bucket_span = bucket_span
+        self.length_series = length_series
+
+    def __repr__(self) -> str:
+        return ("BatchingScheme(batch_size={}, token_level_batching={}, "
+                "bucket_span={})".format(self.batch_size,
+                                         self.token_level_batching,
+                                         self.bucket_span))
+
+
+def _map_items(function: Callable, items: List[Any],
+               workers: Optional[int]) -> List[Any]:
+    """Apply a function to all items of a series.
+
+    With more than one worker, the items are split into chunks which are
+    processed by a pool of processes, keeping the order of the items. If the
+    function cannot be pickled (e.g. a lambda function), it is applied
+    serially.
+
+    Arguments:
+        function: The function to apply.
+        items: The series to process.
+        workers: The number of worker processes.
+
+    Returns:
+        The list of the processed items.
+    """
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    try:
+        pickle.dumps(function)
+    except (pickle.PicklingError, AttributeError, TypeError) as exc:
+        warn("Cannot apply '{}' in parallel, it is not picklable ({}). "
+             "Falling back to serial preprocessing.".format(function, exc))
+        return [function(item) for item in items]
+
+    # several chunks per worker balance the load of the workers
+    chunk_size = max(1, min(PREPROCESSING_CHUNK_SIZE,
+                            len(items) // (4 * workers)))
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(function, items, chunksize=chunk_size)
+
+
+def _example_length(items: List[Any]) -> int:
+    """Get the length of an example as the longest of its sized items."""
+    lengths = [len(item) for item in items if hasattr(item, "__len__")]
+    return max(lengths) if lengths else 1
+
+
+def _hashable(item: Any) -> Any:
+    """Convert a series item to a hashable key equal for equal items."""
+    if isinstance(item, np.ndarray):
+        return (item.dtype.str, item.shape, item.tobytes())
+    if isinstance(item, (list, tuple)):
+        return tuple(_hashable(sub_item) for sub_item in item)
+    if isinstance(item, dict):
+        return tuple(sorted((key, _hashable(value))
+                            for key, value in item.items()))
+    return item
+
+
+def _bucketed_batches(lengths: Iterable[Tuple[Any, int]],
+                      scheme: BatchingScheme,
+                      keep_order: bool) -> Iterable[List[Any]]:
+    """Group examples into batches according to a batching scheme.
+
+    The examples are read sequentially and put into buckets by their length.
+    A bucket is emitted as a batch when it is full, i.e. when it has
+    ``batch_size`` examples, or with token-level batching, when the next
+    example would make the padded batch exceed ``batch_size`` tokens. The
+    remaining buckets are emitted at the end.
+
+    Arguments:
+        lengths: Pairs of examples (or their indices) and their lengths.
+        scheme: The batching scheme.
+        keep_order: Use a single bucket regardless of the scheme.
+
+    Returns:
+        Generator yielding lists of examples.
+    """
+    # each bucket is a pair of the list of examples and their max length
+    buckets = {}  # type: Dict[int, Tuple[List[Any], int]]
+
+    for example, length in lengths:
+        if scheme.bucket_span is None or keep_order:
+            bucket_id = 0
+        else:
+            bucket_id = length // scheme.bucket_span
+
+        examples, max_length = buckets.get(bucket_id, ([], 0))
+        max_length = max(max_length, length)
+
+        if (scheme.token_level_batching and examples
+                and (len(examples) + 1) * max_length > scheme.batch_size):
+            yield examples
+            examples, max_length = [], length
+
+        examples.append(example)
+
+        if (not scheme.token_level_batching
+                and len(examples) >= scheme.batch_size):
+            yield examples
+            examples, max_length = [], 0
+
+        buckets[bucket_id] = (examples, max_length)
+
+    for bucket_id in sorted(buckets):
+        examples, _ = buckets[bucket_id]
+        if examples:
+            yield examples
+
 
 class Dataset(collections.Sized):
     """Base Dataset class.
@@ -38,13 +205,18 @@ class Dataset(collections.Sized):
     dataset, it also manages the vocabularies inferred from the data.
 
     A data series is either a list of strings or a numpy array.
+
+    The order of the examples is given by an array of indices to the series.
+    Shuffling permutes the indices only, and batches and subsets are views
+    which share the series with the original dataset and differ only in the
+    indices. The series items are selected when the series is requested.
     """
 
     def __init__(self,
                  name: str, series: Dict[str, List],
                  series_outputs: Dict[str, str],
-                 preprocessors: List[Tuple[str, str, Callable]] = None
-                ) -> None:
+                 preprocessors: List[Tuple[str, str, Callable]] = None,
+                 preprocessing_workers: int = None) -> None:
         """Create a dataset from the provided series of data.
 
         Arguments:
@@ -52,10 +224,19 @@ class Dataset(collections.Sized):
             series: Dictionary from the series name to the actual data.
             series_outputs: Output files for target series.
             preprocessors: The definition of the preprocessors.
+            preprocessing_workers: Number of processes which apply the
+                preprocessors. If None or 1, the preprocessors are applied in
+                the main process.
         """
         self.name = name
         self._series = dict(series)
         self.series_outputs = series_outputs
+        # indices of the examples in the series, None for the original order
+        self._indices = None  # type: Optional[np.ndarray]
+        # series converted to token indices, shared with the views, keyed
+        # by the series names and the ids of the vocabularies, which are kept
+        # alive in the values
+        self._indexed_series = {}  # type: Dict[Tuple[str, int], Tuple]
 
         if preprocessors is not None:
             for src_id, tgt_id, function in preprocessors:
@@ -67,8 +248,8 @@ class Dataset(collections.Sized):
                         ("The source series ({}) of the '{}' preprocessor "
                          "is not defined in the dataset.").format(
                              src_id, str(function)))
-                self._series[tgt_id] = [
-                    function(item) for item in self._series[src_id]]
+                self._series[tgt_id] = _map_items(
+                    function, self._series[src_id], preprocessing_workers)
 
         self._check_series_lengths()
 
@@ -78,8 +259,8 @@ class Dataset(collections.Sized):
         Raises:
             Exception when the lengths in the dataset do not match.
         """
-        lengths = [len(list(v)) for v in self._series.values()
-                   if isinstance(v, (list, np.ndarray))]
+        lengths = [len(v) for v in self._series.values()
+                   if isinstance(v, (list, tuple, np.ndarray))]
 
         if len(set(lengths)) > 1:
             err_str = ["{}: {}".format(s, len(list(self._series[s])))
@@ -87,17 +268,48 @@ class Dataset(collections.Sized):
             raise Exception("Lengths of data series must be equal. Instead: {}"
                             .format(", ".join(err_str)))
 
+    def _view(self, name: str, indices: np.ndarray,
+              series_outputs: Dict[str, str]) -> "Dataset":
+        """Create a dataset sharing the series with this one.
+
+        Arguments:
+            name: The name of the new dataset.
+            indices: Indices of the examples of the new dataset in the series.
+            series_outputs: Output files of the new dataset.
+
+        Returns:
+            The new dataset.
+        """
+        view = Dataset.__new__(Dataset)
+        view.name = name
+        view._series = self._series
+        view._indexed_series = self._indexed_series
+        view.series_outputs = series_outputs
+        view._indices = indices
+        return view
+
+    def _example_indices(self) -> np.ndarray:
+        """Get the indices of the examples in the series."""
+        if self._indices is None:
+            return np.arange(len(self))
+        return self._indices
+
     def __len__(self) -> int:
         """Get the length of the dataset.
 
         Returns:
             The length of the dataset.
         """
+        if self._indices is not None:
+            return len(self._indices)
+
         if not list(self._series.values()):
             return 0
 
         first_series = next(iter(self._series.values()))
-        return len(list(first_series))
+        if not hasattr(first_series, "__len__"):
+            return len(list(first_series))
+        return len(first_series)
 
     def has_series(self, name: str) -> bool:
         """Check if the dataset contains a series of a given name.
@@ -123,22 +335,61 @@ class Dataset(collections.Sized):
         Raises:
             KeyError if the series does not exists and allow_none is False
         """
-        if allow_none:
-            return self._series.get(name)
+        if allow_none and name not in self._series:
+            return None
+
+        series = self._series[name]
+        if self._indices is None:
+            return series
+        if isinstance(series, np.ndarray):
+            return series[self._indices]
+        return [series[i] for i in self._indices]
+
+    def get_indexed_series(self, name: str, vocabulary: Any,
+                           allow_none: bool = False) -> Optional[List]:
+        """Get a series of sentences converted to vocabulary indices.
 
-        return self._series[name]
+        The whole series is converted only once for each vocabulary and the
+        result is shared by all views of the dataset, so the batches of the
+        next epochs do not look up the words again. The returned sentences
+        can be passed to ``Vocabulary.sentences_to_tensor`` instead of the
+        tokenized sentences.
+
+        Arguments:
+            name: The name of the series of tokenized sentences.
+            vocabulary: The vocabulary used for the conversion.
+            allow_none: If True, return None if the series does not exist.
+
+        Returns:
+            The list of the sentences as int32 arrays of indices.
+        """
+        if allow_none and name not in self._series:
+            return None
+
+        key = (name, id(vocabulary))
+        cached = self._indexed_series.get(key)
+        if cached is None:
+            series = self._series[name]
+            if not isinstance(series, list):
+                series = list(series)
+            cached = (vocabulary, vocabulary.sentences_to_indices(series))
+            self._indexed_series[key] = cached
+
+        indexed = cached[1]
+        if self._indices is None:
+            return indexed
+        return [indexed[i] for i in self._indices]
 
     @property
     def series_ids(self) -> Iterable[str]:
         return self._series.keys()
 
     def shuffle(self) -> None:
-        """Shuffle the dataset randomly."""
-        keys = list(self._series.keys())
-        zipped = list(zip(*[self._series[k] for k in keys]))
-        random.shuffle(zipped)
-        for key, serie in zip(keys, list(zip(*zipped))):
-            self._series[key] = serie
+        """Shuffle the dataset randomly.
+
+        Only the indices of the examples are permuted, the series are kept.
+        """
+        self._indices = np.random.permutation(self._example_indices())
 
     def batch_serie(self, serie_name: str,
                     batch_size: int) -> Iterable[Iterable]:
@@ -160,40 +411,116 @@ class Dataset(collections.Sized):
         if buf:
             yield buf
 
-    def batch_dataset(self, batch_size: int) -> Iterable["Dataset"]:
+    def batch_dataset(self, batch_size: Union[int, BatchingScheme],
+                      keep_order: bool = False) -> Iterable["Dataset"]:
         """Split the dataset into a list of batched datasets.
 
+        The batches are views of this dataset, so no series data are copied.
+
         Arguments:
-            batch_size: The size of a batch.
+            batch_size: The size of a batch or a batching scheme.
+            keep_order: If True, the length bucketing of the batching scheme
+                is not applied, so the batches follow the dataset order.
 
         Returns:
             Generator yielding batched datasets.
         """
-        keys = list(self._series.keys())
-        batched_series = [self.batch_serie(key, batch_size) for key in keys]
+        indices = self._example_indices()
+
+        if isinstance(batch_size, BatchingScheme):
+            length_series = [
+                self._series[key] for key in self._series
+                if batch_size.length_series is None
+                or key in batch_size.length_series]
+
+            lengths = ((index, _example_length(
+                [series[index] for series in length_series]))
+                       for index in indices)
+            index_batches = (
+                np.array(batch, dtype=indices.dtype) for batch in
+                _bucketed_batches(lengths, batch_size, keep_order))
+        else:
+            index_batches = (indices[start:start + batch_size]
+                             for start in range(0, len(indices), batch_size))
 
-        batch_index = 0
-        for next_batches in zip(*batched_series):
-            batch_dict = {key: data for key, data in zip(keys, next_batches)}
-            dataset = Dataset(self.name + "-batch-{}".format(batch_index),
-                              batch_dict, {})
-            batch_index += 1
-            yield dataset
+        for batch_index, batch_indices in enumerate(index_batches):
+            yield self._view(self.name + "-batch-{}".format(batch_index),
+                             batch_indices, {})
 
     def add_series(self, name: str, series: List[Any]) -> None:
         if name in self._series:
             raise ValueError(
                 "Can't series that already exist: {}".format(name))
+
+        if self._indices is not None:
+            # the series are shared with other views, the new one would
+            # need to be indexed differently
+            self._series = {key: self.get_series(key) for key in self._series}
+            self._indexed_series = {}
+            self._indices = None
         self._series[name] = series
 
+    def length_sorted(self, length_series: List[str] = None
+                     ) -> Tuple["Dataset", np.ndarray]:
+        """Get a view of the dataset sorted by the example lengths.
+
+        The examples are sorted from the longest, so the batches of similar
+        lengths need less padding. The sort is stable.
+
+        Arguments:
+            length_series: Names of the series which determine the length of
+                an example. If None, all series with sized items are used.
+
+        Returns:
+            A tuple of the sorted dataset and the array of the positions of
+            its examples in this dataset.
+        """
+        series = [self.get_series(key) for key in self.series_ids
+                  if length_series is None or key in length_series]
+        lengths = np.array([_example_length(list(example))
+                            for example in zip(*series)], dtype=np.int64)
+        order = np.argsort(-lengths, kind="mergesort")
+
+        return self._view(self.name, self._example_indices()[order],
+                          self.series_outputs), order
+
+    def deduplicated(self, key_series: List[str] = None
+                     ) -> Tuple["Dataset", np.ndarray]:
+        """Get a view of the dataset with each distinct example only once.
+
+        Arguments:
+            key_series: Names of the series which are compared to find the
+                duplicate examples. If None, all series are compared.
+
+        Returns:
+            A tuple of the view with the first occurrences of the distinct
+            examples and the array which gives the position in the view for
+            each example of this dataset.
+        """
+        series = [self.get_series(key) for key in self.series_ids
+                  if key_series is None or key in key_series]
+
+        first_positions = []  # type: List[int]
+        positions = {}  # type: Dict[Any, int]
+        inverse = np.zeros(len(self), dtype=np.int64)
+        for i, example in enumerate(zip(*series)):
+            key = _hashable(example)
+            if key not in positions:
+                positions[key] = len(first_positions)
+                first_positions.append(i)
+            inverse[i] = positions[key]
+
+        indices = self._example_indices()[np.array(first_positions,
+                                                   dtype=np.int64)]
+        return self._view(self.name, indices, self.series_outputs), inverse
+
     def subset(self, start: int, length: int) -> "Dataset":
         subset_name = "{}.{}.{}".format(self.name, start, length)
         subset_outputs = {k: "{}.{:010}".format(v, start)
                           for k, v in self.series_outputs.items()}
-        subset_series = {k: v[start:start + length]
-                         for k, v in self._series.items()}
+        subset_indices = self._example_indices()[start:start + length]
 
-        return Dataset(subset_name, subset_series, subset_outputs)
+        return self._view(subset_name, subset_indices, subset_outputs)
 
 
 class LazyDataset(Dataset):
@@ -208,8 +535,10 @@ class LazyDataset(Dataset):
     def __init__(self, name: str,
                  series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
                  series_outputs: Dict[str, str],
-                 preprocessors: List[Tuple[str, str, Callable]] = None
-                ) -> None:
+                 preprocessors: List[Tuple[str, str, Callable]] = None,
+                 shuffle_buffer_size: int = None,
+                 shuffle_shards: bool = False,
+                 line_index: bool = False) -> None:
         """Create a new instance of the lazy dataset.
 
         Arguments:
@@ -217,6 +546,18 @@ class LazyDataset(Dataset):
             of series name to its file series_outputs: Dictionary mapping
             series names to their output file preprocess: The preprocessor to
             apply to the read lines
+            shuffle_buffer_size: Size of the buffer from which the examples
+                are randomly drawn when the dataset is shuffled. If None, the
+                examples are not shuffled within the files.
+            shuffle_shards: Whether to shuffle the order of the input files
+                when the dataset is shuffled. All series must have the same
+                number of files.
+            line_index: Whether to use byte-offset indices of the lines of
+                the input files. The indices are built once and stored next
+                to the files. They make getting the length of the dataset,
+                its subsets, and skipping examples fast. The input files must
+                be uncompressed and the readers must produce one example per
+                line.
         """
         parent_series = dict()  # type: Dict[str, Any]
         parent_series.update({s: None for s in series_paths_and_readers})
@@ -232,7 +573,38 @@ class LazyDataset(Dataset):
                         "File not found. Series: {}, Path: {}"
                         .format(series_name, path))
 
-        self.preprocess_series = {}  # type: Dict[str, Tuple[str, Callable]]
+        if shuffle_buffer_size is not None and shuffle_buffer_size < 1:
+            raise ValueError("Shuffle buffer size must be a positive number.")
+        if shuffle_shards and len(set(
+                len(paths) for paths, _ in
+                series_paths_and_readers.values())) > 1:
+            raise ValueError("Cannot shuffle shards of series with different "
+                             "numbers of files.")
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.shuffle_shards = shuffle_shards
+        # seed of the current shuffled pass over the data, None if the data
+        # is read in the file order
+        self._shuffle_seed = None  # type: int
+
+        self.line_index = line_index
+        # number of examples skipped at the beginning of the files
+        self._start_offset = 0
+        self._index_length = None  # type: int
+        if line_index:
+            lengths = {series_name: count_lines(paths)
+                       for series_name, (paths, _)
+                       in series_paths_and_readers.items()}
+            if len(set(lengths.values())) > 1:
+                raise Exception(
+                    "Lengths of data series must be equal. Instead: {}"
+                    .format(", ".join("{}: {}".format(s, l)
+                                      for s, l in lengths.items())))
+            self._index_length = next(iter(lengths.values()), 0)
+
+        # preprocessed series with their source series, the source is None
+        # for dataset-level preprocessors which are given the whole dataset
+        self.preprocess_series = {
+        }  # type: Dict[str, Tuple[Optional[str], Callable]]
         if preprocessors is not None:
             for src_id, tgt_id, func in preprocessors:
                 if src_id == tgt_id:
@@ -245,6 +617,23 @@ class LazyDataset(Dataset):
                              src_id, str(func)))
                 self.preprocess_series[tgt_id] = (src_id, func)
 
+    def __len__(self) -> int:
+        """Get the length of the dataset.
+
+        Without the line index, the length is found by reading a series.
+
+        Returns:
+            The length of the dataset.
+        """
+        if self._index_length is not None:
+            return self._index_length - self._start_offset
+
+        if not self.series_paths_and_readers:
+            return 0
+
+        first_series = next(iter(self.series_paths_and_readers))
+        return sum(1 for _ in self.get_series(first_series))
+
     def has_series(self, name: str) -> bool:
         """Check if the dataset contains a series of a given name.
 
@@ -280,9 +669,16 @@ class LazyDataset(Dataset):
 
         if name in self.series_paths_and_readers:
             paths, reader = self.series_paths_and_readers[name]
+            if self._shuffle_seed is not None:
+                return self._shuffled_series(paths, reader)
+            if self._start_offset:
+                return self._series_from_offset(paths, reader)
             return reader(paths)
         elif name in self.preprocess_series:
             src_id, func = self.preprocess_series[name]
+            if src_id is None:
+                # dataset-level preprocessor reading the lazy series
+                return func(self)
             src_series = self.get_series(src_id, allow_none)
             if src_series is None:
                 return None
@@ -291,11 +687,139 @@ class LazyDataset(Dataset):
             raise Exception("Series '{}' is not in the dataset.".format(name))
 
     def shuffle(self) -> None:
-        """Do nothing, not in-memory shuffle is impossible.
+        """Reshuffle the dataset for the next pass over the data.
+
+        Unless the shuffle buffer or the shard shuffling is enabled, this does
+        nothing. Otherwise, a new random seed is drawn. The seed determines
+        the order of the input files and the draws from the shuffle buffer,
+        so all series of equal lengths are shuffled in the same way.
+        """
+        if self.shuffle_buffer_size is None and not self.shuffle_shards:
+            return
+        self._shuffle_seed = random.getrandbits(32)
+
+    def _shuffled_series(self, paths: List[str],
+                         reader: Reader) -> Iterable[Any]:
+        """Read a series in the order given by the current shuffle seed.
+
+        Arguments:
+            paths: The paths of the input files of the series.
+            reader: The reader of the series.
+
+        Returns:
+            Generator yielding the shuffled items of the series.
+        """
+        rng = random.Random(self._shuffle_seed)
+
+        if self.shuffle_shards:
+            paths = list(paths)
+            rng.shuffle(paths)
 
-        TODO: this is related to the ``__len__`` method.
+        if self.shuffle_buffer_size is None:
+            yield from reader(paths)
+            return
+
+        buffer = []  # type: List[Any]
+        for item in reader(paths):
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(item)
+                continue
+            index = rng.randrange(self.shuffle_buffer_size)
+            yield buffer[index]
+            buffer[index] = item
+
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _series_from_offset(self, paths: List[str], reader: Reader,
+                            start: int = 0,
+                            length: int = None) -> Iterable[Any]:
+        """Read a range of a series using the line index.
+
+        The readers of file ranges seek to the first line of the range in
+        its file, other readers read the series from the beginning.
+
+        Arguments:
+            paths: The paths of the input files of the series.
+            reader: The reader of the series.
+            start: Index of the first example after the start offset.
+            length: Number of examples to read. If None, the series is read
+                to its end.
+
+        Returns:
+            Generator yielding the items of the range.
         """
-        pass
+        start += self._start_offset
+        if supports_file_ranges(reader):
+            yield from reader(file_ranges(paths, start, length))
+            return
+
+        warn("Reader {} cannot read file ranges, the series is read from "
+             "the beginning".format(reader))
+        end = None if length is None else start + length
+        yield from islice(reader(paths), start, end)
+
+    def skip(self, offset: int) -> "LazyDataset":
+        """Get a lazy view of the dataset without its first examples.
+
+        The view reads the files in their original order from the offset.
+        The readers of file ranges seek to the offset found in the line
+        index, so the skipped examples are not read.
+
+        Arguments:
+            offset: The number of examples to skip.
+
+        Returns:
+            A new lazy dataset starting with the example at the offset.
+        """
+        if not self.line_index:
+            raise ValueError("Skipping examples requires the line index.")
+        if offset > len(self):
+            raise ValueError("Trying to skip more instances than "
+                             "the size of the dataset")
+
+        view = copy.copy(self)
+        view._start_offset = self._start_offset + offset
+        view._shuffle_seed = None
+        return view
+
+    def batch_dataset(self, batch_size: Union[int, BatchingScheme],
+                      keep_order: bool = False) -> Iterable[Dataset]:
+        """Split the dataset into a list of batched datasets.
+
+        The series are read sequentially, so only the examples of the current
+        batches are kept in memory.
+
+        Arguments:
+            batch_size: The size of a batch or a batching scheme.
+            keep_order: If True, the length bucketing of the batching scheme
+                is not applied, so the batches follow the dataset order.
+
+        Returns:
+            Generator yielding batched datasets.
+        """
+        keys = list(self.series_ids)
+
+        if isinstance(batch_size, BatchingScheme):
+            length_indices = [
+                i for i, key in enumerate(keys)
+                if batch_size.length_series is None
+                or key in batch_size.length_series]
+            lengths = (
+                (example, _example_length(
+                    [example[i] for i in length_indices]))
+                for example in zip(*[self.get_series(key) for key in keys]))
+            batches = (
+                zip(*examples) for examples in
+                _bucketed_batches(lengths, batch_size, keep_order))
+        else:
+            batches = zip(*[self.batch_serie(key, batch_size)
+                            for key in keys])
+
+        for batch_index, batch in enumerate(batches):
+            batch_dict = {key: list(data) for key, data in zip(keys, batch)}
+            yield Dataset(self.name + "-batch-{}".format(batch_index),
+                          batch_dict, {})
 
     @property
     def series_ids(self) -> Iterable[str]:
@@ -306,22 +830,71 @@ class LazyDataset(Dataset):
         raise NotImplementedError(
             "Lazy dataset does not support adding series.")
 
+    def get_indexed_series(self, name: str, vocabulary: Any,
+                           allow_none: bool = False) -> Optional[List]:
+        """Convert a series to vocabulary indices without caching.
+
+        See ``Dataset.get_indexed_series``.
+        """
+        if allow_none and not self.has_series(name):
+            return None
+        return vocabulary.sentences_to_indices(list(self.get_series(name)))
+
+    def length_sorted(self, length_series: List[str] = None
+                     ) -> Tuple[Dataset, np.ndarray]:
+        """Load the dataset to memory and sort it by the example lengths.
+
+        See ``Dataset.length_sorted``.
+        """
+        return self.subset(0, len(self)).length_sorted(length_series)
+
+    def deduplicated(self, key_series: List[str] = None
+                     ) -> Tuple[Dataset, np.ndarray]:
+        """Load the dataset to memory and remove the duplicate examples.
+
+        See ``Dataset.deduplicated``.
+        """
+        return self.subset(0, len(self)).deduplicated(key_series)
+
     def subset(self, start: int, length: int) -> Dataset:
         subset_name = "{}.{}.{}".format(self.name, start, length)
         subset_outputs = {k: "{}.{:010}".format(v, start)
                           for k, v in self.series_outputs.items()}
 
-        # TODO make this more efficient with large datasets
+        if not self.line_index:
+            subset_series = {
+                s_id: list(islice(self.get_series(s_id),
+                                  start, start + length))
+                for s_id in self.series_ids}
+            return Dataset(subset_name, subset_series, subset_outputs)
+
         subset_series = {
-            s_id: list(islice(self.get_series(s_id), start, start + length))
-            for s_id in self.series_ids}
+            s_id: list(self._series_from_offset(paths, reader, start, length))
+            for s_id, (paths, reader)
+            in self.series_paths_and_readers.items()}
+
+        for s_id, (src_id, func) in self.preprocess_series.items():
+            if src_id is not None:
+                subset_series[s_id] = [func(item)
+                                       for item in subset_series[src_id]]
 
-        return Dataset(subset_name, subset_series, subset_outputs)
+        subset = Dataset(subset_name, subset_series, subset_outputs)
+        for s_id, (src_id, func) in self.preprocess_series.items():
+            if src_id is None:
+                subset.add_series(s_id, list(func(subset)))
+
+        return subset
 
 
 def from_files(
         name: str = None, lazy: bool = False,
         preprocessors: List[Tuple[str, str, Callable]] = None,
+        shuffle_buffer_size: int = None,
+        shuffle_shards: bool = False,
+        line_index: bool = False,
+        preprocessing_workers: int = None,
+        preprocessing_cache: str = None,
+        preprocessing_cache_size: int = None,
         **kwargs) -> Dataset:
     """Load a dataset from the files specified by the provided arguments.
 
@@ -331,9 +904,30 @@ def from_files(
         name: The name of the dataset to use. If None (default), the name will
               be inferred from the file names.
         lazy: Boolean flag specifying whether to use lazy loading (useful for
-              large files). Note that the lazy dataset cannot be shuffled.
+              large files). Note that the lazy dataset is shuffled only if
+              ``shuffle_buffer_size`` or ``shuffle_shards`` is set.
               Defaults to False.
         preprocessor: A callable used for preprocessing of the input sentences.
+        shuffle_buffer_size: The size of the buffer used for shuffling the
+              lazy dataset. The examples are drawn randomly from the buffer
+              which is filled sequentially from the files.
+        shuffle_shards: Whether the lazy dataset shuffles the order of its
+              files (e.g. matched by a wildcard) in each epoch.
+        line_index: Whether the lazy dataset uses line indices of its files,
+              which are cached next to the data. This requires uncompressed
+              files with one example per line.
+        preprocessing_workers: Number of processes used for applying the
+              preprocessors to the in-memory dataset. Functions which cannot
+              be pickled are applied in the main process.
+        preprocessing_cache: A directory where the series created by the
+              preprocessors are cached, so they are reused when the dataset
+              is loaded again with the same files, readers and preprocessors.
+              Only the series of readers and preprocessors with a cache key
+              (see ``preprocessing_cache.set_cache_key``) are cached, which
+              are those created from the configuration.
+        preprocessing_cache_size: Maximum size of the preprocessing cache in
+              megabytes. When exceeded, the least recently used series are
+              removed from the cache.
         kwargs: Dataset keyword argument specs. These parameters should begin
                 with 's_' prefix and may end with '_out' suffix.  For example,
                 a data series 'source' which specify the source sentences
@@ -364,14 +958,50 @@ def from_files(
     log("Initializing dataset with: {}".format(
         ", ".join(series_paths_and_readers)))
 
+    cache = None
+    cache_keys = {}  # type: Dict[str, Optional[str]]
+    if preprocessing_cache is not None:
+        cache = PreprocessingCache(preprocessing_cache,
+                                   preprocessing_cache_size)
+        cache_keys = _series_cache_keys(cache, series_paths_and_readers,
+                                        preprocessors)
+
     if lazy:
+        if preprocessing_workers is not None:
+            warn("Lazy dataset applies the preprocessors on the fly, "
+                 "the preprocessing workers are not used.")
         dataset = LazyDataset(name, series_paths_and_readers, series_outputs,
-                              preprocessors)  # type: Dataset
+                              preprocessors, shuffle_buffer_size,
+                              shuffle_shards, line_index)  # type: Dataset
+        if cache is not None:
+            _use_lazy_cache(cast(LazyDataset, dataset), cache, cache_keys,
+                            preprocessors)
     else:
-        series = {key: list(reader(paths))
-                  for key, (paths, reader) in series_paths_and_readers.items()}
-
-        dataset = Dataset(name, series, series_outputs, preprocessors)
+        if shuffle_buffer_size is not None or shuffle_shards:
+            warn("Shuffle buffer and shard shuffling are used only in lazy "
+                 "datasets, the in-memory dataset is shuffled entirely.")
+        series = read_series(series_paths_and_readers)
+
+        uncached_preprocessors = preprocessors
+        if cache is not None:
+            uncached_preprocessors = []
+            for src_id, tgt_id, function in preprocessors or []:
+                key = cache_keys[tgt_id]
+                cached = cache.load(key, tgt_id) if key else None
+                if cached is None:
+                    uncached_preprocessors.append((src_id, tgt_id, function))
+                else:
+                    series[tgt_id] = list(cached)
+
+        dataset = Dataset(name, series, series_outputs,
+                          uncached_preprocessors or None,
+                          preprocessing_workers)
+
+        if cache is not None:
+            for _, tgt_id, _ in uncached_preprocessors:
+                key = cache_keys[tgt_id]
+                if key is not None:
+                    cache.store(key, tgt_id, dataset.get_series(tgt_id))
         log("Dataset length: {}".format(len(dataset)))
 
     _preprocessed_datasets(dataset, kwargs)
@@ -460,6 +1090,54 @@ def _get_series_outputs(series_config: SeriesConfig) -> Dict[str, str]:
     return outputs
 
 
+def _series_cache_keys(
+        cache: PreprocessingCache,
+        series_paths_and_readers: Dict[str, Tuple[List[str], Reader]],
+        preprocessors: Optional[List[Tuple[str, str, Callable]]]
+) -> Dict[str, Optional[str]]:
+    """Get the preprocessing cache keys of the dataset series.
+
+    The key of a preprocessed series is derived from the key of its source
+    series, so chained preprocessors are cached as well.
+    """
+    keys = {}  # type: Dict[str, Optional[str]]
+    for name, (paths, reader) in series_paths_and_readers.items():
+        keys[name] = cache.file_series_key(paths, reader)
+
+    for src_id, tgt_id, function in preprocessors or []:
+        keys[tgt_id] = cache.preprocessed_key(keys.get(src_id), function)
+
+    return keys
+
+
+def _use_lazy_cache(dataset: LazyDataset,
+                    cache: PreprocessingCache,
+                    cache_keys: Dict[str, Optional[str]],
+                    preprocessors: Optional[List[Tuple[str, str, Callable]]]
+                   ) -> None:
+    """Make the lazy dataset read the preprocessed series from the cache.
+
+    The series which are not in the cache are preprocessed in a single pass
+    over the data and stored. The dataset then reads the cache entries as
+    its input files instead of applying the preprocessors.
+    """
+    if dataset.line_index or dataset.shuffle_shards:
+        warn("Preprocessing cache is not used with line index or shard "
+             "shuffling in a lazy dataset.")
+        return
+
+    for _, tgt_id, _ in preprocessors or []:
+        key = cache_keys[tgt_id]
+        if key is None:
+            continue
+        if not cache.lookup(key, tgt_id):
+            cache.store(key, tgt_id, dataset.get_series(tgt_id))
+
+        dataset.series_paths_and_readers[tgt_id] = (
+            [cache.path(key)], read_cache_entries)
+        del dataset.preprocess_series[tgt_id]
+
+
 def _preprocessed_datasets(
         dataset: Dataset,
         series_config: SeriesConfig) -> None:
@@ -471,8 +1149,9 @@ def _preprocessed_datasets(
         name = PREPROCESSED_SERIES.match(key).group(1)
         preprocessor = cast(DatasetPreprocess, series_config[key])
 
-        if isinstance(dataset, Dataset):
+        if isinstance(dataset, LazyDataset):
+            # the series is generated when requested, streaming the items
+            dataset.preprocess_series[name] = (None, preprocessor)
+        else:
             new_series = list(preprocessor(dataset))
             dataset.add_series(name, new_series)
-        elif isinstance(dataset, LazyDataset):
-            dataset.preprocess_series[name] = (None, preprocessor)
@@ -5,7 +5,7 @@ Either for the recurrent decoder, or for the transformer decoder.
 The autoregressive decoder uses the while loop to get the outputs.
 Descendants should only specify the initial state and the while loop body.
 """
-from typing import (NamedTuple, Callable, Tuple, cast, Iterable, Type,
+from typing import (NamedTuple, Callable, Tuple, cast, Type,
                     List, Optional, Any)
 
 import numpy as np
@@ -406,15 +406,13 @@ class AutoregressiveDecoder(ModelPart):
             dataset: The dataset to use for the decoder.
             train: Boolean flag, telling whether this is a training run.
         """
-        sentences = cast(Iterable[List[str]],
-                         dataset.get_series(self.data_id, allow_none=True))
+        sentences = dataset.get_indexed_series(
+            self.data_id, self.vocabulary, allow_none=True)
 
         if sentences is None and train:
             raise ValueError("When training, you must feed "
                              "reference sentences")
 
-        sentences_list = list(sentences) if sentences is not None else None
-
         fd = {}  # type: FeedDict
         fd[self.train_mode] = train
 
@@ -425,7 +423,7 @@ class AutoregressiveDecoder(ModelPart):
         if sentences is not None:
             # train_mode=False, since we don't want to <unk>ize target words!
             inputs, weights = self.vocabulary.sentences_to_tensor(
-                sentences_list, self.max_output_len, train_mode=False,
+                sentences, self.max_output_len, train_mode=False,
                 add_start_symbol=False, add_end_symbol=True,
                 pad_to_max_len=False)
 
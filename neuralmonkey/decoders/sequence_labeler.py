@@ -1,4 +1,4 @@
-from typing import cast, Iterable, List, Optional, Union
+from typing import Optional, Union
 
 import tensorflow as tf
 
@@ -131,14 +131,14 @@ class SequenceLabeler(ModelPart):
     def feed_dict(self, dataset: Dataset, train: bool = False) -> FeedDict:
         fd = {}  # type: FeedDict
 
-        sentences = cast(Iterable[List[str]],
-                         dataset.get_series(self.data_id, allow_none=True))
+        sentences = dataset.get_indexed_series(
+            self.data_id, self.vocabulary, allow_none=True)
 
         fd[self.train_mode] = train
 
         if sentences is not None:
             vectors, paddings = self.vocabulary.sentences_to_tensor(
-                list(sentences), pad_to_max_len=False, train_mode=train)
+                sentences, pad_to_max_len=False, train_mode=train)
 
             fd[self.train_targets] = vectors.T
             fd[self.train_weights] = paddings.T
@@ -10,6 +10,7 @@ from neuralmonkey.logging import warn
 from neuralmonkey.model.model_part import ModelPart, FeedDict, InitializerSpecs
 from neuralmonkey.model.sequence import Sequence
 from neuralmonkey.decorators import tensor
+from neuralmonkey.processors.alignment import alignments_to_dense
 
 
 class WordAlignmentDecoder(ModelPart):
@@ -103,6 +104,9 @@ class WordAlignmentDecoder(ModelPart):
                                   self.decoder.max_output_len,
                                   self.enc_input.max_length),
                                  np.float32)
+        else:
+            # the alignments are stored sparse, only the batch is densified
+            alignment = alignments_to_dense(list(alignment))
 
         fd[self.ref_alignment] = alignment
 
@@ -5,7 +5,8 @@ import os
 import random
 from shutil import copyfile
 import subprocess
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Tuple,
+                    Union)
 from typing import Set  # pylint: disable=unused-import
 
 import numpy as np
@@ -20,7 +21,7 @@ from neuralmonkey.config.configuration import Configuration
 from neuralmonkey.learning_utils import (training_loop, evaluation,
                                          run_on_dataset,
                                          print_final_evaluation)
-from neuralmonkey.dataset import Dataset
+from neuralmonkey.dataset import Dataset, BatchingScheme
 from neuralmonkey.model.sequence import EmbeddedFactorSequence
 from neuralmonkey.runners.base_runner import ExecutionResult
 from neuralmonkey.tf_manager import get_default_tf_manager
@@ -204,17 +205,24 @@ class Experiment(object):
     def run_model(self,
                   dataset: Dataset,
                   write_out: bool = False,
-                  batch_size: int = None,
-                  log_progress: int = 0) -> Tuple[List[ExecutionResult],
-                                                  Dict[str, List[Any]]]:
+                  batch_size: Union[int, BatchingScheme] = None,
+                  log_progress: int = 0,
+                  sort_by_length: bool = False,
+                  deduplicate: bool = False) -> Tuple[
+                      List[ExecutionResult], Dict[str, List[Any]]]:
         """Run the model on a given dataset.
 
         Args:
             dataset: The dataset on which the model will be executed.
             write_out: Flag whether the outputs should be printed to a file
                 defined in the dataset object.
-            batch_size: size of the minibatch
+            batch_size: size of the minibatch or a batching scheme, the
+                runners batch size from the configuration by default
             log_progress: log progress every X seconds
+            sort_by_length: run the model on batches of examples sorted by
+                length, the outputs are returned in the original order
+            deduplicate: run the model only once for each distinct example
+                of a dataset without targets
 
         Returns:
             A list of `ExecutionResult`s and a dictionary of the output series.
@@ -230,21 +238,29 @@ class Experiment(object):
                 self.model.tf_manager, self.model.runners, dataset,
                 self.model.postprocess,
                 write_out=write_out, log_progress=log_progress,
-                batch_size=batch_size or self.model.runners_batch_size)
+                batch_size=batch_size or self.model.runners_batch_size,
+                sort_by_length=sort_by_length, deduplicate=deduplicate)
 
     def evaluate(self,
                  dataset: Dataset,
                  write_out: bool = False,
-                 batch_size: int = None,
-                 log_progress: int = 0) -> Dict[str, Any]:
+                 batch_size: Union[int, BatchingScheme] = None,
+                 log_progress: int = 0,
+                 sort_by_length: bool = False,
+                 deduplicate: bool = False) -> Dict[str, Any]:
         """Run the model on a given dataset and evaluate the outputs.
 
         Args:
             dataset: The dataset on which the model will be executed.
             write_out: Flag whether the outputs should be printed to a file
                 defined in the dataset object.
-            batch_size: size of the minibatch
+            batch_size: size of the minibatch or a batching scheme, the
+                runners batch size from the configuration by default
             log_progress: log progress every X seconds
+            sort_by_length: run the model on batches of examples sorted by
+                length, see ``run_model``
+            deduplicate: run the model only once for each distinct example,
+                see ``run_model``
 
         Returns:
             Dictionary of evaluation names and their values which includes the
@@ -252,7 +268,8 @@ class Experiment(object):
             run.
         """
         execution_results, output_data = self.run_model(
-            dataset, write_out, batch_size, log_progress)
+            dataset, write_out, batch_size, log_progress, sort_by_length,
+            deduplicate)
 
         evaluators = [(e[0], e[0], e[1]) if len(e) == 2 else e
                       for e in self.model.evaluation]
@@ -312,7 +329,9 @@ class Experiment(object):
 def create_config(train_mode: bool = True) -> Configuration:
     config = Configuration()
     config.add_argument("tf_manager", required=False, default=None)
-    config.add_argument("batch_size", cond=lambda x: x > 0)
+    # batch size can be also a reference to a batching scheme
+    config.add_argument("batch_size",
+                        cond=lambda x: not isinstance(x, int) or x > 0)
     config.add_argument("output")
     config.add_argument("postprocess", required=False, default=None)
     config.add_argument("runners")
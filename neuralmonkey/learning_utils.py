@@ -16,7 +16,7 @@ from termcolor import colored
 from typeguard import check_argument_types, check_type
 
 from neuralmonkey.logging import log, log_print, warn, notice
-from neuralmonkey.dataset import Dataset, LazyDataset
+from neuralmonkey.dataset import Dataset, LazyDataset, BatchingScheme
 from neuralmonkey.tf_manager import TensorFlowManager
 from neuralmonkey.runners.base_runner import BaseRunner, ExecutionResult
 from neuralmonkey.trainers.generic_trainer import GenericTrainer
@@ -35,7 +35,7 @@ Postprocess = Optional[List[Tuple[SeriesName, Callable]]]
 def training_loop(tf_manager: TensorFlowManager,
                   epochs: int,
                   trainer: GenericTrainer,  # TODO better annotate
-                  batch_size: int,
+                  batch_size: Union[int, BatchingScheme],
                   log_directory: str,
                   evaluators: EvalConfiguration,
                   runners: List[BaseRunner],
@@ -48,7 +48,8 @@ def training_loop(tf_manager: TensorFlowManager,
                   val_preview_output_series: Optional[List[str]] = None,
                   val_preview_num_examples: int = 15,
                   train_start_offset: int = 0,
-                  runners_batch_size: Optional[int] = None,
+                  runners_batch_size: Optional[
+                      Union[int, BatchingScheme]] = None,
                   initial_variables: Optional[Union[str, List[str]]] = None,
                   postprocess: Postprocess = None) -> None:
     """Execute the training loop for given graph and data.
@@ -58,7 +59,8 @@ def training_loop(tf_manager: TensorFlowManager,
         epochs: Number of epochs for which the algoritm will learn.
         trainer: The trainer object containg the TensorFlow code for computing
             the loss and optimization operation.
-        batch_size: number of examples in one mini-batch
+        batch_size: number of examples in one mini-batch, or a batching
+            scheme, e.g. for token-level batching with length bucketing
         log_directory: Directory where the TensordBoard log will be generated.
             If None, nothing will be done.
         evaluators: List of evaluators. The last evaluator is used as the main.
@@ -86,7 +88,8 @@ def training_loop(tf_manager: TensorFlowManager,
         train_start_offset: how many lines from the training dataset should be
             skipped. The training starts from the next batch.
         runners_batch_size: batch size of runners. It is the same as batch_size
-            if not specified
+            if not specified. It can be a batching scheme too, its length
+            bucketing is not used in order to keep the order of the outputs.
         initial_variables: variables used for initialization, for example for
             continuation of training
         postprocess: A function which takes the dataset with its output series
@@ -148,6 +151,7 @@ def training_loop(tf_manager: TensorFlowManager,
     log("Starting training")
     last_log_time = time.process_time()
     last_val_time = time.process_time()
+    last_data_wait_time = tf_manager.data_wait_time
     interrupt = None
     try:
         for epoch_n in range(1, epochs + 1):
@@ -161,9 +165,17 @@ def training_loop(tf_manager: TensorFlowManager,
                 if not isinstance(train_dataset, LazyDataset):
                     warn("Not skipping training instances with "
                          "shuffled in-memory dataset")
+                elif train_dataset.line_index:
+                    log("Skipping first {} instances in the dataset using "
+                        "the line index".format(train_start_offset))
+                    train_batched_datasets = train_dataset.skip(
+                        train_start_offset).batch_dataset(batch_size)
                 else:
                     _skip_lines(train_start_offset, train_batched_datasets)
 
+            train_batched_datasets = tf_manager.prefetch(
+                train_batched_datasets, trainer.all_coders, train=True)
+
             for batch_n, batch_dataset in enumerate(train_batched_datasets):
                 step += 1
                 seen_instances += len(batch_dataset)
@@ -273,6 +285,11 @@ def training_loop(tf_manager: TensorFlowManager,
                         "per-instance (train): {:.2f}s, per-instance (val): "
                         "{:.2f}s".format(val_duration, training_duration,
                                          steptime, valtime), color="blue")
+                    if tf_manager.prefetch_depth > 0:
+                        log("Waiting for prefetched data: {:.2f}s".format(
+                            tf_manager.data_wait_time - last_data_wait_time),
+                            color="blue")
+                        last_data_wait_time = tf_manager.data_wait_time
                     if training_duration < 2 * val_duration:
                         notice("Validation period setting is inefficient.")
 
@@ -359,13 +376,48 @@ def _check_series_collisions(runners: List[BaseRunner],
                 runners_outputs.add(series)
 
 
+def _scatter_outputs(result: ExecutionResult,
+                     positions: np.ndarray) -> ExecutionResult:
+    """Put outputs of a reordered or deduplicated dataset back in place.
+
+    Arguments:
+        result: The result of the execution on the modified dataset.
+        positions: For each example of the original dataset, the position
+            of its output in the result.
+
+    Returns:
+        The result with an output for each example of the original dataset.
+
+    Raises:
+        ValueError: If the result does not have an output for each example
+            of the modified dataset, so the outputs cannot be matched with
+            the examples.
+    """
+    outputs = result.outputs
+    expected = positions.max() + 1 if positions.size else 0
+    if len(outputs) != expected:
+        raise ValueError(
+            "Cannot put {} outputs back to their positions in the dataset, "
+            "the runner must produce one output for each of the {} "
+            "examples".format(len(outputs), expected))
+
+    if isinstance(outputs, np.ndarray):
+        outputs = outputs[positions]
+    else:
+        outputs = [outputs[i] for i in positions]
+
+    return result._replace(outputs=outputs)
+
+
 def run_on_dataset(tf_manager: TensorFlowManager,
                    runners: List[BaseRunner],
                    dataset: Dataset,
                    postprocess: Postprocess,
                    write_out: bool = False,
-                   batch_size: Optional[int] = None,
-                   log_progress: int = 0) -> Tuple[
+                   batch_size: Optional[Union[int, BatchingScheme]] = None,
+                   log_progress: int = 0,
+                   sort_by_length: bool = False,
+                   deduplicate: bool = False) -> Tuple[
                        List[ExecutionResult], Dict[str, List[Any]]]:
     """Apply the model on a dataset and optionally write outputs to files.
 
@@ -378,8 +430,19 @@ def run_on_dataset(tf_manager: TensorFlowManager,
         postprocess: an object to use as postprocessing of the
         write_out: Flag whether the outputs should be printed to a file defined
             in the dataset object.
-        batch_size: size of the minibatch
+        batch_size: size of the minibatch or a batching scheme
         log_progress: log progress every X seconds
+        sort_by_length: If True, the examples are sorted by their lengths
+            before batching, so the batches need less padding and decoding
+            of a batch ends sooner. The outputs are returned in the original
+            order. The length is given by the ``length_series`` of the
+            batching scheme if provided, otherwise by all series.
+        deduplicate: If True, the model is run only once for each distinct
+            example and the outputs are copied to the duplicates. The
+            duplicates are kept when the dataset contains targets, because
+            the losses are computed over the whole dataset. If the runners
+            do not produce an output for each distinct example, the model
+            is run again on the whole dataset.
 
         extra_fetches: Extra tensors to evaluate for each batch.
 
@@ -392,11 +455,51 @@ def run_on_dataset(tf_manager: TensorFlowManager,
                            for runner in runners
                            if runner.decoder_data_id is not None)
 
-    all_results = tf_manager.execute(dataset, runners,
+    run_dataset = dataset
+    # the positions of the examples in the run dataset, computed only when
+    # the dataset is reordered, because the length of a lazy dataset may
+    # require reading all its files
+    positions = None  # type: Optional[np.ndarray]
+    if deduplicate and contains_targets:
+        # losses are aggregated over batches, they cannot be scattered to
+        # the duplicates
+        warn("Dataset '{}' contains targets, the duplicate examples are "
+             "not removed".format(dataset.name))
+    elif deduplicate:
+        run_dataset, positions = dataset.deduplicated()
+        log("Running on {} distinct examples of {}".format(
+            len(run_dataset), len(dataset)))
+
+    if sort_by_length:
+        length_series = None
+        if isinstance(batch_size, BatchingScheme):
+            length_series = batch_size.length_series
+        run_dataset, order = run_dataset.length_sorted(length_series)
+        if positions is None:
+            positions = np.argsort(order)
+        else:
+            positions = np.argsort(order)[positions]
+
+    all_results = tf_manager.execute(run_dataset, runners,
                                      compute_losses=contains_targets,
                                      batch_size=batch_size,
                                      log_progress=log_progress)
 
+    if positions is not None:
+        try:
+            all_results = [_scatter_outputs(result, positions)
+                           for result in all_results]
+        except ValueError as exc:
+            if run_dataset is dataset or not deduplicate:
+                raise
+            # the outputs must stay identical to the non-deduplicated run
+            warn("{} Running again with the duplicate examples.".format(exc))
+            return run_on_dataset(
+                tf_manager, runners, dataset, postprocess,
+                write_out=write_out, batch_size=batch_size,
+                log_progress=log_progress, sort_by_length=sort_by_length,
+                deduplicate=False)
+
     result_data = {runner.output_series: result.outputs
                    for runner, result in zip(runners, all_results)}
 
@@ -204,9 +204,9 @@ class EmbeddedFactorSequence(Sequence):
 
         for factor_plc, name, vocabulary in zip(
                 self.input_factors, self.data_ids, self.vocabularies):
-            factors = dataset.get_series(name)
+            factors = dataset.get_indexed_series(name, vocabulary)
             vectors, paddings = vocabulary.sentences_to_tensor(
-                list(factors), self.max_length, pad_to_max_len=False,
+                factors, self.max_length, pad_to_max_len=False,
                 train_mode=train, add_start_symbol=self.add_start_symbol,
                 add_end_symbol=self.add_end_symbol)
 
@@ -0,0 +1,80 @@
+"""Convert dataset series to binary corpora or packed numpy shards.
+
+Series of tokenized sentences are converted to binary corpora of token
+indices, series of numpy arrays are packed into large shard files.
+"""
+
+# pylint: disable=unused-import, wrong-import-order
+import neuralmonkey.checkpython
+# pylint: enable=unused-import, wrong-import-order
+
+import argparse
+import os
+
+from neuralmonkey.config.configuration import Configuration
+from neuralmonkey.logging import log
+from neuralmonkey.readers.binary_corpus_reader import write_binary_corpus
+from neuralmonkey.readers.numpy_reader import (
+    packed_shard_files, remove_packed_shards, write_packed_shards)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("config", metavar="INI-FILE",
+                        help="the configuration of the dataset, the series "
+                        "to convert, their vocabularies and output files, "
+                        "and the series to pack with their output prefixes")
+    args = parser.parse_args()
+
+    config = Configuration()
+    config.add_argument("dataset")
+    config.add_argument("series", required=False, default=[],
+                        cond=lambda x: isinstance(x, list))
+    config.add_argument("vocabularies", required=False, default=[],
+                        cond=lambda x: isinstance(x, list))
+    config.add_argument("outputs", required=False, default=[],
+                        cond=lambda x: isinstance(x, list))
+    config.add_argument("packed_series", required=False, default=[],
+                        cond=lambda x: isinstance(x, list))
+    config.add_argument("packed_outputs", required=False, default=[],
+                        cond=lambda x: isinstance(x, list))
+    config.add_argument("shard_size", required=False, default=1024,
+                        cond=lambda x: isinstance(x, int) and x > 0)
+    config.add_argument("overwrite", required=False, default=False)
+
+    config.load_file(args.config)
+    config.build_model()
+    model = config.model
+
+    if not len(model.series) == len(model.vocabularies) == len(model.outputs):
+        raise ValueError("The lists of series, vocabularies and outputs "
+                         "must have the same length.")
+
+    for series_id, vocabulary, path in zip(model.series, model.vocabularies,
+                                           model.outputs):
+        if os.path.exists(path) and not model.overwrite:
+            raise FileExistsError(
+                "Binary corpus '{}' exists and overwrite is disabled."
+                .format(path))
+
+        log("Converting series '{}' of dataset '{}'"
+            .format(series_id, model.dataset.name))
+        write_binary_corpus(path, model.dataset.get_series(series_id),
+                            vocabulary)
+
+    if len(model.packed_series) != len(model.packed_outputs):
+        raise ValueError("The lists of packed series and their outputs "
+                         "must have the same length.")
+
+    for series_id, prefix in zip(model.packed_series, model.packed_outputs):
+        if packed_shard_files(prefix):
+            if not model.overwrite:
+                raise FileExistsError(
+                    "Packed shards '{}' exist and overwrite is disabled."
+                    .format(prefix))
+            remove_packed_shards(prefix)
+
+        log("Packing series '{}' of dataset '{}'"
+            .format(series_id, model.dataset.name))
+        write_packed_shards(prefix, model.dataset.get_series(series_id),
+                            model.shard_size)
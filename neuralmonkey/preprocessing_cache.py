@@ -0,0 +1,269 @@
+"""Persistent on-disk cache of preprocessed data series.
+
+The cache stores the results of applying preprocessors to data series loaded
+from files, so the next runs on the same data do not need to preprocess it
+again. The cache is content-addressed: the key of a series combines the
+checksums of the input files and the cache keys of the reader and of all
+preprocessors which were applied to get the series. If any of them changes,
+the key changes as well and the series is preprocessed again.
+
+The cache keys of readers and preprocessors are set explicitly with
+``set_cache_key``. The configuration builder sets them to the class names
+and constructor arguments of the callable objects it creates (the readers
+and preprocessors). Series read or preprocessed by objects without a cache
+key are not cached.
+
+A cache entry is a stream of pickled chunks of the series items, so it can be
+both loaded into memory and read lazily. When the cache grows over its size
+limit, the least recently used entries are removed.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import os
+import pickle
+import tempfile
+import weakref
+
+from neuralmonkey.logging import log, debug
+
+CACHE_VERSION = 3
+ENTRY_SUFFIX = ".series.pkl"
+
+# number of series items pickled together
+_CHUNK_SIZE = 1000
+
+# the cache keys of readers and preprocessors, the objects are referenced
+# weakly so the keys do not keep them alive
+_CACHE_KEYS = weakref.WeakKeyDictionary(
+)  # type: weakref.WeakKeyDictionary
+
+# the cache keys of objects which cannot be referenced weakly indexed by the
+# object ids, the objects are kept in the values so the ids are not reused
+_ID_CACHE_KEYS = {}  # type: Dict[int, Tuple[Any, str]]
+
+# checksums of files computed in this process, keys are paths with their
+# sizes and mtimes
+_FILE_CHECKSUMS = {}  # type: Dict[Tuple[str, int, float], str]
+
+
+class PreprocessingCache(object):
+    """Directory with cached preprocessed series."""
+
+    def __init__(self, directory: str, max_size: int = None) -> None:
+        """Open the cache, creating its directory if needed.
+
+        Arguments:
+            directory: The directory where the cached series are stored.
+            max_size: Maximum size of the cache in megabytes. If None, old
+                entries are never removed.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def file_series_key(self, paths: List[str],
+                        reader: Callable) -> Optional[str]:
+        """Get the key of a series read from files.
+
+        Arguments:
+            paths: The input files of the series.
+            reader: The reader of the series.
+
+        Returns:
+            The key, or None if the reader has no cache key.
+        """
+        reader_key = get_cache_key(reader)
+        if reader_key is None:
+            debug("Reader {} has no cache key".format(reader))
+            return None
+
+        return _hash_parts(["files", reader_key]
+                           + [_file_checksum(path) for path in paths])
+
+    def preprocessed_key(self, source_key: Optional[str],
+                         function: Callable) -> Optional[str]:
+        """Get the key of a series created by a preprocessor.
+
+        Arguments:
+            source_key: The key of the source series of the preprocessor.
+            function: The preprocessor.
+
+        Returns:
+            The key, or None if the source series cannot be cached or the
+            preprocessor has no cache key.
+        """
+        if source_key is None:
+            return None
+
+        function_key = get_cache_key(function)
+        if function_key is None:
+            debug("Preprocessor {} has no cache key".format(function))
+            return None
+
+        return _hash_parts(["preprocess", source_key, function_key])
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def lookup(self, key: str, name: str) -> bool:
+        """Check whether a series is cached and mark it as recently used.
+
+        Arguments:
+            key: The key of the series.
+            name: The series name used for logging.
+
+        Returns:
+            True if the series is in the cache.
+        """
+        if not self.contains(key):
+            log("Preprocessing cache miss for series '{}'".format(name))
+            return False
+
+        log("Preprocessing cache hit for series '{}'".format(name))
+        # the modification time marks recently used entries
+        os.utime(self.path(key))
+        return True
+
+    def load(self, key: str, name: str) -> Optional[Iterable[Any]]:
+        """Get a cached series.
+
+        Arguments:
+            key: The key of the series.
+            name: The series name used for logging.
+
+        Returns:
+            A generator of the series items or None if the series is not in
+            the cache.
+        """
+        if not self.lookup(key, name):
+            return None
+        return read_cache_entries([self.path(key)])
+
+    def store(self, key: str, name: str, series: Iterable[Any]) -> None:
+        """Save a series to the cache and evict old entries if needed.
+
+        The series is written to a temporary file which is renamed when it
+        is complete, so an interrupted run does not leave a broken entry.
+
+        Arguments:
+            key: The key of the series.
+            name: The series name used for logging.
+            series: The series items.
+        """
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f_out:
+                chunk = []  # type: List[Any]
+                for item in series:
+                    chunk.append(item)
+                    if len(chunk) >= _CHUNK_SIZE:
+                        pickle.dump(chunk, f_out, pickle.HIGHEST_PROTOCOL)
+                        chunk = []
+                if chunk:
+                    pickle.dump(chunk, f_out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        log("Preprocessed series '{}' saved to cache".format(name))
+        self._evict(keep=self.path(key))
+
+    def _evict(self, keep: str) -> None:
+        """Remove the least recently used entries over the size limit."""
+        if self.max_size is None:
+            return
+
+        entries = []
+        for fname in os.listdir(self.directory):
+            if fname.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.directory, fname)
+                entries.append((os.path.getmtime(path),
+                                os.path.getsize(path), path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size * 1024 * 1024:
+                break
+            if path == keep:
+                continue
+            log("Removing cached series '{}'".format(path))
+            os.remove(path)
+            total_size -= size
+
+
+def set_cache_key(obj: Any, key: str) -> None:
+    """Identify a reader or a preprocessor in the preprocessing cache.
+
+    The key must change whenever the output of the object changes, e.g. it
+    can describe the configuration the object was created with. Values
+    which are not objects (strings, numbers, None) are ignored, because they
+    can be shared by unrelated parts of the program.
+
+    Arguments:
+        obj: The reader or the preprocessor.
+        key: The cache key of the object.
+    """
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return
+    try:
+        _CACHE_KEYS[obj] = key
+    except TypeError:
+        # the object is not hashable or cannot be referenced weakly
+        _ID_CACHE_KEYS[id(obj)] = (obj, key)
+
+
+def get_cache_key(obj: Any) -> Optional[str]:
+    """Get the cache key of a reader or a preprocessor, if it is set."""
+    try:
+        if obj in _CACHE_KEYS:
+            return _CACHE_KEYS[obj]
+    except TypeError:
+        pass
+
+    entry = _ID_CACHE_KEYS.get(id(obj))
+    if entry is None or entry[0] is not obj:
+        return None
+    return entry[1]
+
+
+def read_cache_entries(files: List[str]) -> Iterable[Any]:
+    """Read the items of series stored in cache entries.
+
+    This function has the signature of a reader, so the cache entries can be
+    used as input files of a lazy dataset.
+    """
+    for path in files:
+        with open(path, "rb") as f_data:
+            while True:
+                try:
+                    chunk = pickle.load(f_data)
+                except EOFError:
+                    break
+                yield from chunk
+
+
+def _file_checksum(path: str) -> str:
+    """Compute the SHA-1 checksum of the file contents."""
+    stat = os.stat(path)
+    file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if file_id not in _FILE_CHECKSUMS:
+        sha = hashlib.sha1()
+        with open(path, "rb") as f_data:
+            for block in iter(lambda: f_data.read(1 << 20), b""):
+                sha.update(block)
+        _FILE_CHECKSUMS[file_id] = sha.hexdigest()
+    return _FILE_CHECKSUMS[file_id]
+
+
+def _hash_parts(parts: List[str]) -> str:
+    sha = hashlib.sha1(str(CACHE_VERSION).encode("utf-8"))
+    for part in parts:
+        sha.update(part.encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
@@ -1,5 +1,5 @@
 import re
-from typing import List
+from typing import List, NamedTuple, Tuple, Union
 
 import numpy as np
 
@@ -7,6 +7,22 @@ import numpy as np
 
 ID_SEP = re.compile(r"[-:]")
 
+# pylint: disable=invalid-name
+SparseAlignment = NamedTuple("SparseAlignment", [
+    ("shape", Tuple[int, int]),
+    ("target_ids", np.ndarray),
+    ("source_ids", np.ndarray),
+    ("weights", np.ndarray),
+    ("normalize", bool)])
+# pylint: enable=invalid-name
+SparseAlignment.__doc__ = """Alignment links of a sentence.
+
+The alignment matrix of the given shape (target_len, source_len) has the
+weights at the positions given by the target and source indices and zeros
+elsewhere. If normalize is True, the rows of the matrix are normalized to
+sum to one.
+"""
+
 
 class WordAlignmentPreprocessor(object):
     """A preprocessor for word alignments in a text format.
@@ -22,8 +38,10 @@ class WordAlignmentPreprocessor(object):
     is not given, it is assumend to be 1. The separators `-` and `:` are
     interchangeable.
 
-    The output of the preprocessor is an alignment matrix of the fixed shape
-    (target_len, source_len) for each sentence.
+    The output of the preprocessor is a ``SparseAlignment`` for each sentence
+    which stores only the alignment links. The matrices of the fixed shape
+    (target_len, source_len) are created by ``alignments_to_dense`` for a
+    batch of sentences.
     """
 
     def __init__(self, source_len, target_len, dtype=np.float32,
@@ -34,7 +52,48 @@ class WordAlignmentPreprocessor(object):
         self._normalize = normalize
         self._zero_based = zero_based
 
-    def __call__(self, sentence: List[str]):
+    def __call__(self, sentence: List[str]) -> SparseAlignment:
+        source_ids = []  # type: List[int]
+        target_ids = []  # type: List[int]
+        weights = []  # type: List[float]
+
+        for ali in sentence:
+            ids, _, str_weight = ali.partition("/")
+            i, j = [int(id_str) for id_str in ID_SEP.split(ids)]
+            weight = float(str_weight) if str_weight else 1.
+
+            if not self._zero_based:
+                i -= 1
+                j -= 1
+
+            if i < self._source_len and j < self._target_len:
+                # negative indices count from the end as in numpy
+                if not (-self._source_len <= i and -self._target_len <= j):
+                    raise IndexError(
+                        "Alignment link {} is out of bounds".format(ali))
+                source_ids.append(i % self._source_len)
+                target_ids.append(j % self._target_len)
+                weights.append(weight)
+
+        source_arr = np.array(source_ids, dtype=np.int32)
+        target_arr = np.array(target_ids, dtype=np.int32)
+        weight_arr = np.array(weights, dtype=self._dtype)
+
+        # a repeated link overwrites the previous one
+        positions = target_arr.astype(np.int64) * self._source_len + source_arr
+        _, last = np.unique(positions[::-1], return_index=True)
+        links = len(positions) - 1 - last
+
+        return SparseAlignment(
+            (self._target_len, self._source_len), target_arr[links],
+            source_arr[links], weight_arr[links], self._normalize)
+
+    def _dense_reference(self, sentence: List[str]) -> np.ndarray:
+        """Create the dense alignment matrix of a sentence directly.
+
+        This is the original implementation of the preprocessor which is kept
+        as a reference for tests.
+        """
         result = np.zeros((self._target_len, self._source_len), self._dtype)
 
         for ali in sentence:
@@ -55,3 +114,44 @@ class WordAlignmentPreprocessor(object):
                 result[np.isnan(result)] = 0
 
         return result
+
+
+def alignments_to_dense(
+        alignments: List[Union[SparseAlignment, np.ndarray]]) -> np.ndarray:
+    """Create the alignment matrices of a batch of sentences.
+
+    Arguments:
+        alignments: The alignments of the sentences. Alignments which are
+            already dense matrices are used as they are.
+
+    Returns:
+        An array of shape (batch, target_len, source_len).
+    """
+    if not all(isinstance(ali, SparseAlignment) for ali in alignments):
+        return np.array([
+            alignments_to_dense([ali])[0]
+            if isinstance(ali, SparseAlignment) else ali
+            for ali in alignments])
+
+    if not alignments:
+        return np.zeros((0, 0, 0), np.float32)
+
+    result = np.zeros((len(alignments),) + alignments[0].shape,
+                      alignments[0].weights.dtype)
+
+    sentence_ids = np.repeat(np.arange(len(alignments)),
+                             [len(ali.weights) for ali in alignments])
+    result[sentence_ids,
+           np.concatenate([ali.target_ids for ali in alignments]),
+           np.concatenate([ali.source_ids for ali in alignments])] = (
+               np.concatenate([ali.weights for ali in alignments]))
+
+    normalized = np.array([ali.normalize for ali in alignments])
+    if normalized.any():
+        rows = result[normalized]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rows /= rows.sum(axis=2, keepdims=True)
+            rows[np.isnan(rows)] = 0
+        result[normalized] = rows
+
+    return result
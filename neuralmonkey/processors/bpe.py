@@ -1,11 +1,88 @@
+import heapq
 import re
-from typing import List
+from typing import Dict, List, Tuple
 
 from neuralmonkey.logging import log
-from lib.subword_nmt.apply_bpe import BPE, encode
+from neuralmonkey.processors.helpers import LRUCache
+from lib.subword_nmt.apply_bpe import BPE
 
 # pylint: disable=too-few-public-methods
 
+END_OF_WORD = "</w>"
+
+
+def encode_word(word: str,
+                bpe_codes: Dict[Tuple[str, str], int]) -> Tuple[str, ...]:
+    """Segment a word by applying BPE merges in the order of their ranks.
+
+    The result is the same as of ``encode`` from ``apply_bpe``, which merges
+    all occurrences of the best ranked pair from left to right and then
+    looks for the next best pair. The symbols are kept in a linked list and
+    the pairs in a heap, so each merge only updates the neighboring pairs
+    instead of rebuilding the word.
+
+    Arguments:
+        word: The word to segment.
+        bpe_codes: The ranks of the merges indexed by the symbol pairs.
+
+    Returns:
+        The tuple of the subword units.
+    """
+    symbols = list(word) + [END_OF_WORD]
+    # the symbols are nodes identified by their initial positions
+    next_node = list(range(1, len(symbols))) + [-1]
+    prev_node = list(range(-1, len(symbols) - 1))
+
+    heap = [(bpe_codes[pair], i, pair)
+            for i, pair in enumerate(zip(symbols, symbols[1:]))
+            if pair in bpe_codes]
+    heapq.heapify(heap)
+
+    while heap:
+        rank, _, (first, second) = heap[0]
+        # all pairs of this rank are the same pair, they are merged from
+        # left to right before looking at the new pairs
+        positions = set()
+        while heap and heap[0][0] == rank:
+            positions.add(heapq.heappop(heap)[1])
+
+        merged = []
+        for node in sorted(positions):
+            right = next_node[node]
+            if (symbols[node] != first or right == -1
+                    or symbols[right] != second):
+                # the pair was changed by an earlier merge
+                continue
+
+            symbols[node] = first + second
+            symbols[right] = None
+            next_node[node] = next_node[right]
+            if next_node[node] != -1:
+                prev_node[next_node[node]] = node
+            merged.append(node)
+
+        for node in merged:
+            for left in [prev_node[node], node]:
+                if left == -1 or next_node[left] == -1:
+                    continue
+                pair = (symbols[left], symbols[next_node[left]])
+                if pair in bpe_codes:
+                    heapq.heappush(heap, (bpe_codes[pair], left, pair))
+
+    segmented = []
+    node = 0
+    while node != -1:
+        segmented.append(symbols[node])
+        node = next_node[node]
+
+    # don't print end-of-word symbols
+    if segmented[-1] == END_OF_WORD:
+        segmented.pop()
+    elif segmented[-1].endswith(END_OF_WORD):
+        segmented[-1] = segmented[-1].replace(END_OF_WORD, "")
+
+    return tuple(segmented)
+
 
 class BPEPreprocessor(object):
     """Wrapper class for Byte-Pair Encoding.
@@ -17,12 +94,25 @@ class BPEPreprocessor(object):
     def __init__(self,
                  merge_file: str,
                  separator: str = "@@",
-                 encoding: str = "utf-8") -> None:
+                 encoding: str = "utf-8",
+                 cache_size: int = 100000) -> None:
+        """Load the BPE merges.
+
+        Arguments:
+            merge_file: The file with the merges created by ``learn_bpe``.
+            separator: The suffix of the subword units which are not at the
+                end of a word.
+            encoding: The encoding of the merge file.
+            cache_size: The maximum number of segmented words kept in
+                memory.
+        """
         log("Initializing BPE preprocessor")
 
         with open(merge_file, "r", encoding=encoding) as f_data:
             self.bpe = BPE(f_data, separator)
 
+        self._cache = LRUCache(cache_size)
+
     def __call__(self, sentence: List[str]) -> List[str]:
         """Adapted code from BPE.segment."""
 
@@ -34,7 +124,10 @@ class BPEPreprocessor(object):
                 output.append(word)
                 continue
 
-            new_word = encode(word, self.bpe.bpe_codes)
+            new_word = self._cache.get(word)
+            if new_word is None:
+                new_word = encode_word(word, self.bpe.bpe_codes)
+                self._cache.put(word, new_word)
 
             for item in new_word[:-1]:
                 output.append(item + self.bpe.separator)
@@ -42,6 +135,20 @@ class BPEPreprocessor(object):
 
         return output
 
+    def segment_batch(self, sentences: List[List[str]]) -> List[List[str]]:
+        """Segment a list of sentences.
+
+        Each distinct word of the sentences is segmented only once.
+        """
+        segmented = {}  # type: Dict[str, List[str]]
+        for sentence in sentences:
+            for word in sentence:
+                if word not in segmented:
+                    segmented[word] = self([word])
+
+        return [[unit for word in sentence for unit in segmented[word]]
+                for sentence in sentences]
+
 
 class BPEPostprocessor(object):
 
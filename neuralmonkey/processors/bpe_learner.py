@@ -0,0 +1,187 @@
+"""Learning of byte-pair encoding merges.
+
+This is a faster reimplementation of ``learn_bpe`` from ``subword_nmt``. The
+words of the training data are counted in parallel, each process counting
+words in a shard of a file. The merges are then learned from the word counts.
+The pair counts are kept in a heap and only the words which contain the
+merged pair are updated after each merge.
+
+The merges use the same format as ``learn_bpe``, so they can be applied by
+the ``BPEPreprocessor``.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+from collections import defaultdict
+import collections
+import gzip
+import heapq
+import multiprocessing
+import os
+
+from neuralmonkey.logging import log
+
+END_OF_WORD = "</w>"
+
+# approximate size of a part of a file counted by a single process
+SHARD_SIZE = 1 << 26
+
+
+def count_words(files: List[str], num_workers: int = None,
+                encoding: str = "utf-8",
+                shard_size: int = SHARD_SIZE) -> Dict[str, int]:
+    """Count whitespace-separated words in text files.
+
+    The files are split to shards of whole lines, which are counted in
+    separate processes.
+
+    Arguments:
+        files: The text files. Gzipped files are counted in a single shard.
+        num_workers: Number of processes counting the words. If None or 1,
+            the words are counted in the main process.
+        encoding: The encoding of the files.
+        shard_size: Approximate size of a shard in bytes.
+
+    Returns:
+        The counts of the words.
+    """
+    shards = [(path, start, end, encoding)
+              for path in files for start, end in _shards(path, shard_size)]
+
+    counts = collections.Counter()  # type: collections.Counter
+    if num_workers is None or num_workers <= 1 or len(shards) <= 1:
+        for shard in shards:
+            counts.update(_count_shard(shard))
+    else:
+        with multiprocessing.Pool(num_workers) as pool:
+            for shard_counts in pool.imap_unordered(_count_shard, shards):
+                counts.update(shard_counts)
+
+    log("Counted {} distinct words in {} shards".format(len(counts),
+                                                        len(shards)))
+    return counts
+
+
+def learn_merges(word_counts: Dict[str, int], num_merges: int,
+                 min_frequency: int = 2) -> List[Tuple[str, str]]:
+    """Learn BPE merges from word counts.
+
+    In each step, the most frequent pair of adjacent symbols is merged into a
+    new symbol. Ties are broken by the order of the symbols, so the result
+    does not depend on the order of the words.
+
+    Arguments:
+        word_counts: The counts of the words in the training data.
+        num_merges: The maximum number of merges to learn.
+        min_frequency: Stop when the most frequent pair occurs fewer times.
+
+    Returns:
+        List of the merged pairs of symbols.
+    """
+    words = [list(word) + [END_OF_WORD] for word in word_counts]
+    counts = list(word_counts.values())
+
+    # the pair counts and the indices of words which contain the pairs
+    stats = defaultdict(int)  # type: Dict[Tuple[str, str], int]
+    index = defaultdict(set)  # type: Dict[Tuple[str, str], Set[int]]
+    for i, (symbols, count) in enumerate(zip(words, counts)):
+        for pair in zip(symbols, symbols[1:]):
+            stats[pair] += count
+            index[pair].add(i)
+
+    heap = [(-count, pair) for pair, count in stats.items()]
+    heapq.heapify(heap)
+
+    merges = []  # type: List[Tuple[str, str]]
+    while heap and len(merges) < num_merges:
+        negative_count, pair = heapq.heappop(heap)
+        count = stats.get(pair, 0)
+        if count != -negative_count:
+            # the count has decreased since the pair was pushed
+            if count > 0:
+                heapq.heappush(heap, (-count, pair))
+            continue
+        if count < min_frequency:
+            break
+
+        merges.append(pair)
+        changed = set()  # type: Set[Tuple[str, str]]
+        for i in index.pop(pair):
+            symbols = words[i]
+            new_symbols = _merge_pair(symbols, pair)
+            if len(new_symbols) == len(symbols):
+                # the word lost the pair in an earlier merge
+                continue
+
+            for old_pair in zip(symbols, symbols[1:]):
+                stats[old_pair] -= counts[i]
+            for new_pair in zip(new_symbols, new_symbols[1:]):
+                stats[new_pair] += counts[i]
+                index[new_pair].add(i)
+                changed.add(new_pair)
+            words[i] = new_symbols
+
+        del stats[pair]
+        # only the pairs with the new symbol can be more frequent than
+        # before, the others are updated when they are popped
+        merged = pair[0] + pair[1]
+        for new_pair in changed:
+            if merged in new_pair and stats[new_pair] > 0:
+                heapq.heappush(heap, (-stats[new_pair], new_pair))
+
+    log("Learned {} BPE merges".format(len(merges)))
+    return merges
+
+
+def write_merges(path: str, merges: Iterable[Tuple[str, str]],
+                 encoding: str = "utf-8") -> None:
+    """Save the merges in the format of ``learn_bpe``."""
+    with open(path, "w", encoding=encoding) as f_out:
+        for first, second in merges:
+            f_out.write("{} {}\n".format(first, second))
+
+
+def _merge_pair(symbols: List[str], pair: Tuple[str, str]) -> List[str]:
+    """Merge the occurrences of the pair in a word from left to right."""
+    first, second = pair
+    merged = []  # type: List[str]
+    i = 0
+    while i < len(symbols):
+        if (i < len(symbols) - 1 and symbols[i] == first
+                and symbols[i + 1] == second):
+            merged.append(first + second)
+            i += 2
+        else:
+            merged.append(symbols[i])
+            i += 1
+    return merged
+
+
+def _shards(path: str, shard_size: int) -> List[Tuple[int, int]]:
+    """Split a file to byte ranges of whole lines."""
+    if path.endswith(".gz"):
+        return [(0, -1)]
+
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f_data:
+        while boundaries[-1] + shard_size < size:
+            f_data.seek(boundaries[-1] + shard_size)
+            f_data.readline()
+            boundaries.append(min(f_data.tell(), size))
+
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _count_shard(shard: Tuple[str, int, int, str]) -> Dict[str, int]:
+    path, start, end, encoding = shard
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f_data:
+            data = f_data.read()
+    else:
+        with open(path, "rb") as f_data:
+            f_data.seek(start)
+            data = f_data.read(end - start)
+
+    return collections.Counter(data.decode(encoding).split())
@@ -1,25 +1,59 @@
-from typing import Any, Callable, Dict, Iterable, List
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import Pool
+import atexit
+import multiprocessing
 
 import numpy as np
 
 from neuralmonkey.dataset import Dataset
 
 
-# pylint: disable=too-few-public-methods
 class Preprocess(object):
-    """Preprocessor transorming two series into series of edit operations."""
+    """Preprocessor transorming two series into series of edit operations.
 
-    def __init__(self, source_id: str, target_id: str) -> None:
+    With more than one worker, the edit operations are computed by a pool of
+    processes created on the first call and reused by the next ones. The
+    pool is terminated by ``close``, which is also called when the
+    interpreter exits.
+    """
+
+    def __init__(self, source_id: str, target_id: str,
+                 num_workers: int = None) -> None:
         self._source_id = source_id
         self._target_id = target_id
+        self._num_workers = num_workers
+        self._pool = None  # type: Optional[Pool]
 
     def __call__(self, dataset: Dataset) -> Iterable[List[str]]:
         source_series = dataset.get_series(self._source_id)
         target_series = dataset.get_series(self._target_id)
 
+        if self._num_workers is not None and self._num_workers > 1:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self._num_workers)
+                atexit.register(self.close)
+            yield from convert_to_edits_batch(
+                source_series, target_series, self._num_workers, self._pool)
+            return
+
         for src_seq, tgt_seq in zip(source_series, target_series):
             yield convert_to_edits(src_seq, tgt_seq)
 
+    def close(self) -> None:
+        """Terminate the worker processes, if they were started.
+
+        The preprocessor can still be used, it starts a new pool if needed.
+        """
+        if self._pool is None:
+            return
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+        atexit.unregister(self.close)
+
 
 class Postprocess(object):
     """Proprocessor applying edit operations on a series."""
@@ -70,7 +104,134 @@ KEEP = "<keep>"
 DELETE = "<delete>"
 
 
+# backpointers of the edit operations
+_KEEP_OP = 0
+_DELETE_OP = 1
+_INSERT_OP = 2
+
+# number of sentence pairs sent to a worker process at once
+EDITS_CHUNK_SIZE = 64
+
+
 def convert_to_edits(source: List[str], target: List[str]) -> List[str]:
+    """Find the shortest sequence of edit operations from source to target.
+
+    Only the edit distances and a backpointer to the chosen operation are
+    stored for each pair of prefixes, the operations are collected when
+    tracing the backpointers back from the end. A row of the distances is
+    computed at once: the distances without insertions are minimized with
+    the cumulative minimum over the preceding insertions.
+
+    When there are more shortest sequences, keeping a token is preferred to
+    deleting it and deleting to inserting.
+
+    Arguments:
+        source: The source tokens.
+        target: The target tokens.
+
+    Returns:
+        The list of the edit operations which are either ``KEEP``,
+        ``DELETE`` or the inserted target token.
+    """
+    # the tokens are compared as integers
+    token_ids = {}  # type: Dict[str, int]
+    source_ids = np.array([token_ids.setdefault(tok, len(token_ids))
+                           for tok in source], dtype=np.int64)
+    target_ids = np.array([token_ids.setdefault(tok, len(token_ids))
+                           for tok in target], dtype=np.int64)
+
+    columns = np.arange(len(target) + 1, dtype=np.float64)
+    ops = np.full([len(source) + 1, len(target) + 1], _INSERT_OP,
+                  dtype=np.int8)
+    ops[1:, 0] = _DELETE_OP
+
+    lev = columns
+    for i in range(1, len(source) + 1):
+        keep_cost = np.where(target_ids == source_ids[i - 1], lev[:-1],
+                             np.inf)
+        delete_cost = lev[1:] + 1
+
+        no_insert_cost = np.empty_like(lev)
+        no_insert_cost[0] = i
+        no_insert_cost[1:] = np.minimum(keep_cost, delete_cost)
+        lev = columns + np.minimum.accumulate(no_insert_cost - columns)
+
+        row = ops[i, 1:]
+        row[lev[1:] == delete_cost] = _DELETE_OP
+        row[lev[1:] == keep_cost] = _KEEP_OP
+
+    edits = []  # type: List[str]
+    i, j = len(source), len(target)
+    while i > 0 or j > 0:
+        if ops[i, j] == _KEEP_OP:
+            edits.append(KEEP)
+            i -= 1
+            j -= 1
+        elif ops[i, j] == _DELETE_OP:
+            edits.append(DELETE)
+            i -= 1
+        else:
+            edits.append(target[j - 1])
+            j -= 1
+
+    edits.reverse()
+    return edits
+
+
+def convert_to_edits_batch(
+        sources: Iterable[List[str]], targets: Iterable[List[str]],
+        num_workers: int = None,
+        pool: Pool = None) -> Iterable[List[str]]:
+    """Convert pairs of sentences to edit operations in worker processes.
+
+    The sentences are read in chunks as the workers need them and only a
+    few chunks per worker are processed at once, so the series are streamed
+    instead of being loaded into memory. (``Pool.imap`` would read the whole
+    input in its task feeding thread.)
+
+    Arguments:
+        sources: The source sentences.
+        targets: The target sentences.
+        num_workers: Number of the processes. If None, the number of CPUs
+            is used.
+        pool: A pool of ``num_workers`` processes to use. If None, a new
+            pool is created for the conversion.
+
+    Returns:
+        Generator of the edit operations of each pair, in order.
+    """
+    if pool is None:
+        with multiprocessing.Pool(num_workers) as new_pool:
+            yield from convert_to_edits_batch(
+                sources, targets, num_workers, new_pool)
+        return
+
+    max_pending = 2 * (num_workers or multiprocessing.cpu_count())
+    pairs = zip(sources, targets)
+    pending = deque()  # type: deque
+    while True:
+        chunk = list(islice(pairs, EDITS_CHUNK_SIZE))
+        if chunk:
+            pending.append(pool.apply_async(_convert_pairs, (chunk,)))
+        if pending and (not chunk or len(pending) >= max_pending):
+            yield from pending.popleft().get()
+        elif not chunk:
+            break
+
+
+def _convert_pairs(pairs: List[Tuple[Sequence[str], Sequence[str]]]
+                   ) -> List[List[str]]:
+    return [convert_to_edits(list(source), list(target))
+            for source, target in pairs]
+
+
+def _convert_to_edits_reference(source: List[str],
+                                target: List[str]) -> List[str]:
+    """Find the edit operations keeping them for all pairs of prefixes.
+
+    This is the original implementation of ``convert_to_edits`` which is
+    kept as a reference for tests.
+    """
     lev = np.zeros([len(source) + 1, len(target) + 1])
     edits = [[[] for _ in range(len(target) + 1)]
              for _ in range(len(source) + 1)]  # type: List[List[List[str]]]
@@ -1,4 +1,6 @@
 from typing import Any, Callable, Generator, List
+from collections import OrderedDict
+import threading
 
 
 def preprocess_char_based(sentence: List[str]) -> List[str]:
@@ -35,3 +37,40 @@ def pipeline(processors: List[Callable]) -> Callable:
         return data
 
     return process
+
+
+class LRUCache(object):
+    """A thread-safe dictionary which keeps only recently used items.
+
+    The lock is not pickled, so processors which use the cache can be sent
+    to preprocessing worker processes. A cache unpickled in another process
+    starts empty.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __getstate__(self) -> dict:
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["max_size"])  # type: ignore
@@ -9,15 +9,20 @@ vocabulary object and returns a preprocessor, and a WordpiecePostprocessor.
 Note that the latter is not a higher order function and can be used directly
 without making a new section in the configuration.
 """
-from typing import List, Callable, Set
+from typing import Any, Dict, List, Callable, Optional, Set
 import re
 
 from typeguard import check_argument_types
+from neuralmonkey.processors.helpers import LRUCache
 from neuralmonkey.vocabulary import Vocabulary
 
 
 UNESCAPE_REGEX = re.compile(r"\\u|\\\\|\\([0-9]+);")
 
+# marks a node of the prefix trie where a vocabulary word ends, no character
+# of a word can be the empty string
+_WORD_END = ""
+
 
 def escape_token(token: str, alphabet: Set[str]) -> str:
     """Escapes the token in the t2t fasion.
@@ -95,6 +100,104 @@ def wordpiece_encode(sentence: List[str], vocabulary: Vocabulary) -> List[str]:
     return tokens
 
 
+class WordpieceEncoder(object):
+    """Greedy wordpiece segmentation using a prefix trie of the vocabulary.
+
+    The segmentation is the same as of ``wordpiece_encode``, but the longest
+    subtoken is found by a single walk down the trie of the vocabulary words
+    instead of trying all substrings. The segmentations of the tokens are
+    kept in a cache of the recently used tokens.
+    """
+
+    def __init__(self, vocabulary: Vocabulary,
+                 cache_size: int = 100000) -> None:
+        """Create the encoder.
+
+        Arguments:
+            vocabulary: The vocabulary of the subtokens.
+            cache_size: The maximum number of segmented tokens kept in
+                memory.
+        """
+        check_argument_types()
+        self.vocabulary = vocabulary
+        self._cache = LRUCache(cache_size)
+        self._trie = None  # type: Optional[Dict[str, Any]]
+        self._trie_size = 0
+
+    def __call__(self, sentence: List[str]) -> List[str]:
+        if self._trie is None or self._trie_size != len(self.vocabulary):
+            self._build_trie()
+
+        tokens = []  # type: List[str]
+        for token in sentence:
+            subtokens = self._cache.get(token)
+            if subtokens is None:
+                subtokens = self.encode_token(token)
+                self._cache.put(token, subtokens)
+            tokens.extend(subtokens)
+        return tokens
+
+    def encode_batch(self, sentences: List[List[str]]) -> List[List[str]]:
+        """Segment a list of sentences.
+
+        Each distinct token of the sentences is segmented only once.
+        """
+        segmented = {}  # type: Dict[str, List[str]]
+        for sentence in sentences:
+            for token in sentence:
+                if token not in segmented:
+                    segmented[token] = self([token])
+
+        return [[subtoken for token in sentence
+                 for subtoken in segmented[token]]
+                for sentence in sentences]
+
+    def encode_token(self, token: str) -> List[str]:
+        """Escape a token and split it to the longest subtokens."""
+        if self._trie is None or self._trie_size != len(self.vocabulary):
+            self._build_trie()
+        esc_token = escape_token(token, self.vocabulary.alphabet)
+
+        subtokens = []
+        start = 0
+        while start < len(esc_token):
+            end = self._longest_match(esc_token, start)
+            if end is None:
+                raise AssertionError(
+                    "No token substring found in the vocab ({})."
+                    .format(esc_token[start:]))
+            subtokens.append(esc_token[start:end])
+            start = end
+
+        return subtokens
+
+    def _longest_match(self, text: str, start: int) -> Optional[int]:
+        """Find the end of the longest vocabulary word starting at start."""
+        node = self._trie
+        end = None
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if _WORD_END in node:
+                end = i + 1
+        return end
+
+    def _build_trie(self) -> None:
+        trie = {}  # type: Dict[str, Any]
+        for word in self.vocabulary.word_to_index:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[_WORD_END] = True
+
+        self._trie = trie
+        self._trie_size = len(self.vocabulary)
+
+        # the segmentations may have changed with the vocabulary
+        self._cache = LRUCache(self._cache.max_size)
+
+
 def wordpiece_decode(sentence: List[str]) -> List[str]:
     """Postprocess the wordpieces into a sentence.
 
@@ -111,9 +214,10 @@ def wordpiece_decode_batch(sentences: List[List[str]]) -> List[List[str]]:
 
 
 def get_wordpiece_preprocessor(
-        vocabulary: Vocabulary) -> Callable[[List[str]], List[str]]:
+        vocabulary: Vocabulary,
+        cache_size: int = 100000) -> Callable[[List[str]], List[str]]:
     check_argument_types()
-    return lambda s: wordpiece_encode(s, vocabulary)
+    return WordpieceEncoder(vocabulary, cache_size)
 
 
 # pylint: disable=invalid-name
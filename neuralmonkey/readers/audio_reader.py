@@ -1,5 +1,6 @@
-from typing import Callable, Iterable, List, NamedTuple
+from typing import Callable, Iterable, List, NamedTuple, Optional
 
+import hashlib
 import io
 import os
 import subprocess
@@ -9,17 +10,35 @@ import numpy as np
 
 from scipy.io import wavfile
 
+from neuralmonkey.logging import log, warn
+from neuralmonkey.readers.numpy_reader import (
+    PackedShardWriter, packed_reader, packed_shard_files, remove_packed_shards)
+from neuralmonkey.readers.parallel import ordered_map
+
 
 # pylint: disable=invalid-name
 Audio = NamedTuple("Audio", [("rate", int), ("data", np.ndarray)])
 
 
 def audio_reader(prefix: str = "",
-                 audio_format: str = "wav") -> Callable:
+                 audio_format: str = "wav",
+                 num_workers: int = None,
+                 cache_dir: str = None) -> Callable:
     """Get a reader of audio files loading them from a list of pahts.
 
     Args:
         prefix: Prefix of the paths to the audio files.
+        audio_format: The format of the audio files, "wav" or "sph".
+        num_workers: Number of threads decoding the audio files. With the
+            "sph" format, each thread runs its own ``sph2pipe`` process, so
+            up to this number of files are converted at once. If None, the
+            files are decoded in the reading thread.
+        cache_dir: Directory where the decoded audio from a list file is
+            cached in packed shards (see ``numpy_reader.PackedShardWriter``).
+            The next passes over the list read the memory-mapped samples
+            instead of decoding the files. The files are decoded again when
+            the list file or any of the audio files changes its size or
+            modification time.
 
     Returns:
         The reader function that takes a list of audio file paths (relative to
@@ -37,13 +56,92 @@ def audio_reader(prefix: str = "",
     def load(list_files: List[str]) -> Iterable[Audio]:
         for list_file in list_files:
             with open(list_file) as f_list:
-                for audio_file in f_list:
-                    path = os.path.join(prefix, audio_file.rstrip())
-                    yield load_file(path)
+                paths = [os.path.join(prefix, audio_file.rstrip())
+                         for audio_file in f_list]
+
+            cache_prefix = None
+            if cache_dir is not None:
+                cache_prefix = os.path.join(
+                    cache_dir,
+                    _cache_key(list_file, paths, prefix, audio_format))
+
+            yield from _decoded_audio(paths, load_file, num_workers,
+                                      cache_prefix)
 
     return load
 
 
+def _decoded_audio(paths: List[str], load_file: Callable[[str], Audio],
+                   num_workers: Optional[int],
+                   cache_prefix: Optional[str]) -> Iterable[Audio]:
+    """Decode audio files in order, reading or filling the cache.
+
+    The sampling rates are saved after all files are decoded, so their file
+    marks a complete cache entry. They are saved before the last file is
+    returned, because the consumer may never resume the generator again.
+    """
+    if cache_prefix is None:
+        yield from ordered_map(load_file, paths, num_workers)
+        return
+
+    rates_path = cache_prefix + ".rates.npy"
+    if os.path.isfile(rates_path):
+        log("Reading decoded audio from cache '{}'".format(cache_prefix))
+        rates = np.load(rates_path)
+        shards = packed_shard_files(cache_prefix)
+        for rate, data in zip(rates, packed_reader(shards)):
+            yield Audio(int(rate), data)
+        return
+
+    os.makedirs(os.path.dirname(cache_prefix) or ".", exist_ok=True)
+    remove_packed_shards(cache_prefix)
+
+    writer = PackedShardWriter(cache_prefix)
+    rates = []  # type: List[int]
+    caching = True
+    try:
+        for i, audio in enumerate(
+                ordered_map(load_file, paths, num_workers)):
+            if caching:
+                try:
+                    writer.add(audio.data)
+                    rates.append(audio.rate)
+                except ValueError as exc:
+                    warn("Decoded audio cannot be cached: {}".format(exc))
+                    caching = False
+
+            if caching and i == len(paths) - 1:
+                writer.close()
+                with open(rates_path + ".tmp", "wb") as f_rates:
+                    np.save(f_rates, np.array(rates, dtype=np.int64))
+                os.replace(rates_path + ".tmp", rates_path)
+                log("Decoded audio saved to cache '{}'".format(cache_prefix))
+            yield audio
+    finally:
+        writer.close()
+
+
+def _cache_key(list_file: str, paths: List[str], prefix: str,
+               audio_format: str) -> str:
+    """Identify the list of audio files and the reader configuration.
+
+    The key includes the sizes and modification times of the audio files,
+    so the cache is not used when the files change.
+    """
+    sha = hashlib.sha1()
+    stat = os.stat(list_file)
+    sha.update(repr((os.path.abspath(list_file), stat.st_size, stat.st_mtime,
+                     prefix, audio_format)).encode("utf-8"))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            sha.update(repr((stat.st_size, stat.st_mtime)).encode("utf-8"))
+        except OSError:
+            # missing files are reported when they are decoded
+            sha.update(b"missing")
+    return sha.hexdigest()
+
+
 def _load_wav(path: str) -> Audio:
     """Read a WAV file."""
     return Audio(*wavfile.read(path))
@@ -0,0 +1,176 @@
+"""Binary memory-mapped corpus of token indices.
+
+A binary corpus stores a preprocessed series of tokenized sentences as
+indices to a vocabulary. The file consists of a header, the token indices of
+all sentences as a single int32 array and an int64 array of offsets of the
+sentences in the token array. The header contains the numbers of sentences
+and tokens and a hash of the vocabulary which was used to create the corpus.
+
+The corpus is memory-mapped when read, so the sentences are served as views
+into the file without creating Python strings.
+"""
+
+from typing import Callable, Iterable, List, Union
+from array import array
+import hashlib
+import struct
+
+import numpy as np
+from typeguard import check_argument_types
+
+from neuralmonkey.logging import log
+from neuralmonkey.vocabulary import Vocabulary
+
+MAGIC = b"NMCORPUS"
+VERSION = 1
+
+# magic, version, number of sentences, number of tokens, vocabulary hash
+_HEADER = struct.Struct("<8sIxxxxQQ20s12x")
+
+
+def vocabulary_hash(vocabulary: Vocabulary) -> bytes:
+    """Compute the SHA-1 hash of the ordered list of vocabulary words."""
+    sha = hashlib.sha1()
+    for word in vocabulary.index_to_word:
+        sha.update(word.encode("utf-8"))
+        sha.update(b"\n")
+    return sha.digest()
+
+
+class BinaryCorpus(object):
+    """A memory-mapped corpus of sentences represented by token indices."""
+
+    def __init__(self, path: str) -> None:
+        """Open a binary corpus file.
+
+        Arguments:
+            path: The path to the corpus file.
+        """
+        with open(path, "rb") as f_data:
+            header = f_data.read(_HEADER.size)
+
+        if len(header) < _HEADER.size or not header.startswith(MAGIC):
+            raise ValueError("'{}' is not a binary corpus file".format(path))
+
+        (_, version, num_sentences, num_tokens,
+         self.vocabulary_hash) = _HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError("Unsupported version {} of binary corpus '{}'"
+                             .format(version, path))
+
+        self.path = path
+        if num_tokens:
+            self.tokens = np.memmap(path, dtype=np.int32, mode="r",
+                                    offset=_HEADER.size, shape=(num_tokens,))
+        else:
+            # an empty memory map cannot be created
+            self.tokens = np.zeros([0], dtype=np.int32)
+        self.offsets = np.memmap(path, dtype=np.int64, mode="r",
+                                 offset=_offsets_start(num_tokens),
+                                 shape=(num_sentences + 1,))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Sentence index out of range")
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterable[np.ndarray]:
+        # the offsets are copied to avoid indexing the memory map twice
+        offsets = np.asarray(self.offsets)
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self.tokens[start:end]
+
+    def check_vocabulary(self, vocabulary: Vocabulary) -> None:
+        """Check that the corpus was created with the given vocabulary.
+
+        Raises:
+            ValueError if the hash of the vocabulary does not match.
+        """
+        if vocabulary_hash(vocabulary) != self.vocabulary_hash:
+            raise ValueError(
+                "Binary corpus '{}' was created with a different vocabulary"
+                .format(self.path))
+
+
+def write_binary_corpus(path: str,
+                        sentences: Iterable[List[str]],
+                        vocabulary: Vocabulary) -> int:
+    """Convert tokenized sentences to indices and save them as a corpus.
+
+    Arguments:
+        path: The path of the corpus file to write.
+        sentences: The tokenized sentences, e.g. a dataset series.
+        vocabulary: The vocabulary used for conversion of tokens to indices.
+
+    Returns:
+        The number of written sentences.
+    """
+    check_argument_types()
+
+    offsets = array("q", [0])
+    num_tokens = 0
+    with open(path, "wb") as f_out:
+        f_out.write(b"\0" * _HEADER.size)
+        for sentence in sentences:
+            indices = array("i", [vocabulary.get_word_index(token)
+                                  for token in sentence])
+            indices.tofile(f_out)
+            num_tokens += len(indices)
+            offsets.append(num_tokens)
+
+        f_out.write(b"\0" * (_offsets_start(num_tokens) - f_out.tell()))
+        offsets.tofile(f_out)
+
+        f_out.seek(0)
+        f_out.write(_HEADER.pack(MAGIC, VERSION, len(offsets) - 1, num_tokens,
+                                 vocabulary_hash(vocabulary)))
+
+    log("Binary corpus with {} sentences and {} tokens written to '{}'"
+        .format(len(offsets) - 1, num_tokens, path))
+    return len(offsets) - 1
+
+
+def binary_corpus_reader(vocabulary: Vocabulary = None,
+                         decode: bool = False) -> Callable:
+    """Get a reader of binary corpora.
+
+    Arguments:
+        vocabulary: If provided, the reader checks that the corpora were
+            created with this vocabulary.
+        decode: If True, the reader converts the indices back to tokens.
+            This is needed e.g. for references used in evaluation. Otherwise,
+            the sentences are int32 arrays which can be fed to the model
+            directly.
+
+    Returns:
+        The reader function that takes a list of corpus files and yields
+        their sentences.
+    """
+    check_argument_types()
+    if decode and vocabulary is None:
+        raise ValueError("Decoding a binary corpus requires a vocabulary.")
+
+    def reader(files: List[str]) -> Iterable[Union[np.ndarray, List[str]]]:
+        for path in files:
+            corpus = BinaryCorpus(path)
+            if vocabulary is not None:
+                corpus.check_vocabulary(vocabulary)
+
+            if decode:
+                for sentence in corpus:
+                    yield [vocabulary.index_to_word[i] for i in sentence]
+            else:
+                yield from corpus
+
+    return reader
+
+
+def _offsets_start(num_tokens: int) -> int:
+    """Get the position of the offsets array aligned to 8 bytes."""
+    end = _HEADER.size + 4 * num_tokens
+    return end + (-end) % 8
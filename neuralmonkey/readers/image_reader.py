@@ -1,8 +1,14 @@
-from typing import Callable, Iterable, List, Optional
+from typing import Callable, Iterable, List, Optional, Tuple
+import hashlib
 import os
+import tempfile
 from typeguard import check_argument_types
 import numpy as np
 from PIL import Image, ImageFile
+
+from neuralmonkey.logging import log
+from neuralmonkey.readers.parallel import ordered_map
+
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 
@@ -12,7 +18,9 @@ def image_reader(prefix="",
                  rescale_w: bool = False,
                  rescale_h: bool = False,
                  keep_aspect_ratio: bool = False,
-                 mode: str = "RGB") -> Callable:
+                 mode: str = "RGB",
+                 num_workers: int = None,
+                 cache_dir: str = None) -> Callable:
     """Get a reader of images loading them from a list of pahts.
 
     Args:
@@ -27,6 +35,14 @@ def image_reader(prefix="",
             rescaling. Can only be used if both width and height are rescaled.
         mode: Scipy image loading mode, see scipy documentation for more
             details.
+        num_workers: Number of threads decoding the images. If None, the
+            images are decoded in the reading thread.
+        cache_dir: Directory where the decoded and resized images are cached.
+            The images from a list file are stored as a single array which is
+            memory-mapped when the list is read again, so the images are not
+            decoded in the next epochs or runs. The images are decoded again
+            when the list file or any of the image files changes its size or
+            modification time.
 
     Returns:
         The reader function that takes a list of image paths (relative to
@@ -44,39 +60,39 @@ def image_reader(prefix="",
             "While rescaling only one side, aspect ratio must be kept, "
             "was set to false.")
 
+    def decode(path: str) -> np.ndarray:
+        try:
+            image = Image.open(path).convert(mode)
+        except IOError:
+            image = Image.new(mode, (pad_w, pad_h))
+
+        image = _rescale_or_crop(image, pad_w, pad_h,
+                                 rescale_w, rescale_h,
+                                 keep_aspect_ratio)
+        image_np = np.array(image)
+
+        if len(image_np.shape) == 2:
+            channels = 1
+            image_np = np.expand_dims(image_np, 2)
+        elif len(image_np.shape) == 3:
+            channels = image_np.shape[2]
+        else:
+            raise ValueError(
+                ("Image should have either 2 (black and white) "
+                 "or three dimensions (color channels), has {} "
+                 "dimension.").format(len(image_np.shape)))
+
+        return _pad(image_np, pad_w, pad_h, channels, image_np.dtype)
+
+    cache_config = ("image", prefix, pad_w, pad_h, rescale_w, rescale_h,
+                    keep_aspect_ratio, mode)
+
     def load(list_files: List[str]) -> Iterable[np.ndarray]:
         for list_file in list_files:
-            with open(list_file) as f_list:
-                for i, image_file in enumerate(f_list):
-                    path = os.path.join(prefix, image_file.rstrip())
-
-                    if not os.path.exists(path):
-                        raise Exception(
-                            ("Image file '{}' no."
-                             "{}  does not exist.").format(path, i + 1))
-
-                    try:
-                        image = Image.open(path).convert(mode)
-                    except IOError:
-                        image = Image.new(mode, (pad_w, pad_h))
-
-                    image = _rescale_or_crop(image, pad_w, pad_h,
-                                             rescale_w, rescale_h,
-                                             keep_aspect_ratio)
-                    image_np = np.array(image)
-
-                    if len(image_np.shape) == 2:
-                        channels = 1
-                        image_np = np.expand_dims(image_np, 2)
-                    elif len(image_np.shape) == 3:
-                        channels = image_np.shape[2]
-                    else:
-                        raise ValueError(
-                            ("Image should have either 2 (black and white) "
-                             "or three dimensions (color channels), has {} "
-                             "dimension.").format(len(image_np.shape)))
-
-                    yield _pad(image_np, pad_w, pad_h, channels)
+            for image_np in _decoded_images(list_file, prefix, decode,
+                                            num_workers, cache_dir,
+                                            cache_config):
+                yield image_np.astype(np.float64)
 
     return load
 
@@ -89,7 +105,9 @@ def imagenet_reader(prefix: str,
                     target_width: int = 227,
                     target_height: int = 227,
                     vgg_normalization: bool = False,
-                    zero_one_normalization: bool = False) -> Callable:
+                    zero_one_normalization: bool = False,
+                    num_workers: int = None,
+                    cache_dir: str = None) -> Callable:
     """Load and prepare image the same way as Caffe scripts.
 
     The image preprocessing first rescales the image such that smaller edge has
@@ -104,6 +122,10 @@ def imagenet_reader(prefix: str,
             from all pixels. This is used for VGG nets.
         zero_one_normalization: If true, all pixel values are divided by 255
             such that they are in [0, 1] range. This is used for ResNet.
+        num_workers: Number of threads decoding the images. If None, the
+            images are decoded in the reading thread.
+        cache_dir: Directory where the resized and cropped images are cached
+            before normalization, see ``image_reader``.
 
     Yield:
         An numpy array with the resized and cropped image for every image file
@@ -111,28 +133,32 @@ def imagenet_reader(prefix: str,
     """
     check_argument_types()
 
-    def load(list_files: List[str]) -> Iterable[np.ndarray]:
-        for list_file in list_files:
-            with open(list_file) as f_list:
-                for i, image_file in enumerate(f_list):
-                    path = os.path.join(prefix, image_file.rstrip())
-
-                    if not os.path.exists(path):
-                        raise Exception(
-                            "Image file '{}' no. {} does not exist."
-                            .format(path, i + 1))
+    def decode(path: str) -> np.ndarray:
+        return _imagenet_pixels(path, target_height, target_width)
 
-                    res = single_image_for_imagenet(
-                        path, target_height, target_width,
-                        vgg_normalization, zero_one_normalization)
+    cache_config = ("imagenet", prefix, target_width, target_height)
 
-                    yield res
+    def load(list_files: List[str]) -> Iterable[np.ndarray]:
+        for list_file in list_files:
+            for pixels in _decoded_images(list_file, prefix, decode,
+                                          num_workers, cache_dir,
+                                          cache_config):
+                yield _imagenet_normalize(pixels, vgg_normalization,
+                                          zero_one_normalization)
     return load
 
 
 def single_image_for_imagenet(
         path: str, target_height: int, target_width: int,
         vgg_normalization: bool, zero_one_normalization: bool) -> np.ndarray:
+    return _imagenet_normalize(
+        _imagenet_pixels(path, target_height, target_width),
+        vgg_normalization, zero_one_normalization)
+
+
+def _imagenet_pixels(path: str, target_height: int,
+                     target_width: int) -> np.ndarray:
+    """Load the resized and cropped image as an array of pixels."""
     image = Image.open(path).convert("RGB")
 
     width, height = image.size
@@ -152,8 +178,14 @@ def single_image_for_imagenet(
     cropped_image = _crop(image, target_width, target_height)
 
     res = _pad(np.array(cropped_image),
-               target_width, target_height, 3)
+               target_width, target_height, 3, np.uint8)
     assert res.shape == (target_width, target_height, 3)
+    return res
+
+
+def _imagenet_normalize(pixels: np.ndarray, vgg_normalization: bool,
+                        zero_one_normalization: bool) -> np.ndarray:
+    res = pixels.astype(np.float64)
 
     if vgg_normalization:
         res -= VGG_RGB_MEANS
@@ -163,6 +195,98 @@ def single_image_for_imagenet(
     return res
 
 
+def _decoded_images(list_file: str, prefix: str,
+                    decode: Callable[[str], np.ndarray],
+                    num_workers: Optional[int],
+                    cache_dir: Optional[str],
+                    cache_config: Tuple) -> Iterable[np.ndarray]:
+    """Decode the images listed in a file, possibly using the cache.
+
+    Arguments:
+        list_file: The file with the list of image paths.
+        prefix: Prefix of the paths in the list.
+        decode: The function which loads a single image.
+        num_workers: Number of threads decoding the images.
+        cache_dir: Directory with the cached images.
+        cache_config: The reader configuration which determines the decoded
+            images, used for the cache key.
+
+    Returns:
+        Generator of the decoded images in the order of the list.
+    """
+    with open(list_file) as f_list:
+        paths = [os.path.join(prefix, line.rstrip()) for line in f_list]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir, _cache_key(list_file, paths, cache_config) + ".npy")
+        if os.path.isfile(cache_path):
+            log("Reading images listed in '{}' from cache '{}'"
+                .format(list_file, cache_path))
+            yield from np.load(cache_path, mmap_mode="r")
+            return
+
+    def checked_decode(indexed_path: Tuple[int, str]) -> np.ndarray:
+        i, path = indexed_path
+        if not os.path.exists(path):
+            raise Exception(
+                "Image file '{}' no. {} does not exist.".format(path, i + 1))
+        return decode(path)
+
+    images = ordered_map(checked_decode, enumerate(paths), num_workers)
+
+    if cache_path is None:
+        yield from images
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npy.tmp")
+    os.close(handle)
+    cache = None  # type: Optional[np.ndarray]
+    try:
+        for i, image in enumerate(images):
+            if cache is None:
+                cache = np.lib.format.open_memmap(
+                    tmp_path, mode="w+", dtype=image.dtype,
+                    shape=(len(paths),) + image.shape)
+            cache[i] = image
+
+            if i == len(paths) - 1:
+                # the cache is saved before the last image is returned,
+                # because the consumer may never resume the generator
+                cache.flush()
+                cache = None
+                os.replace(tmp_path, cache_path)
+                log("Images listed in '{}' saved to cache '{}'"
+                    .format(list_file, cache_path))
+            yield image
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _cache_key(list_file: str, paths: List[str],
+               cache_config: Tuple) -> str:
+    """Identify the list of images and the reader configuration.
+
+    The key includes the sizes and modification times of the image files,
+    so the cache is not used when the images change.
+    """
+    sha = hashlib.sha1()
+    stat = os.stat(list_file)
+    sha.update(repr((os.path.abspath(list_file), stat.st_size, stat.st_mtime,
+                     cache_config)).encode("utf-8"))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            sha.update(repr((stat.st_size, stat.st_mtime)).encode("utf-8"))
+        except OSError:
+            # missing images are reported when they are decoded
+            sha.update(b"missing")
+    return sha.hexdigest()
+
+
 def _rescale_or_crop(image: Image.Image, pad_w: int, pad_h: int,
                      rescale_w: bool, rescale_h: bool,
                      keep_aspect_ratio: bool) -> Image.Image:
@@ -203,10 +327,10 @@ def _crop(image: Image.Image, pad_w: int, pad_h: int) -> Image.Image:
 
 
 def _pad(image: np.ndarray, pad_w: int, pad_h: int,
-         channels: int) -> np.ndarray:
+         channels: int, dtype: np.dtype = np.float64) -> np.ndarray:
     img_h, img_w = image.shape[:2]
 
-    image_padded = np.zeros((pad_h, pad_w, channels))
+    image_padded = np.zeros((pad_h, pad_w, channels), dtype=dtype)
     image_padded[:img_h, :img_w, :] = image
 
     return image_padded
@@ -0,0 +1,179 @@
+"""Byte-offset index of lines in plain text files.
+
+The index of a file stores the byte offsets of the beginnings of its lines
+followed by the size of the file. It is built in a single pass over the file
+and saved next to it, so the next runs only load it. The index allows to
+count the lines of the file and to read an arbitrary range of lines without
+reading the preceding part of the file.
+
+A range of lines is described by a ``FileRange``. Readers which can read
+file ranges seek to their beginnings; they are marked by the
+``reads_file_ranges`` decorator and accept file ranges in their lists of
+files.
+"""
+
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple, Union
+from itertools import islice
+import io
+import os
+
+import numpy as np
+
+from neuralmonkey.logging import log, warn
+
+
+INDEX_SUFFIX = ".lineidx.npy"
+_CHUNK_SIZE = 1 << 24
+
+# indices loaded in this process, the keys are paths with their mtimes
+_LOADED_INDICES = {}  # type: Dict[Tuple[str, float], np.ndarray]
+
+# pylint: disable=invalid-name
+FileRange = NamedTuple("FileRange", [("path", str), ("begin", int),
+                                     ("end", int), ("lines", int)])
+FileRange.__doc__ = """A range of lines of a file.
+
+The range starts at the byte offset ``begin``, ends before the byte offset
+``end`` and contains ``lines`` lines.
+"""
+# pylint: enable=invalid-name
+
+
+def line_offsets(path: str) -> np.ndarray:
+    """Get the line offsets of a file, building the index if needed.
+
+    Arguments:
+        path: Path to an uncompressed text file.
+
+    Returns:
+        An int64 array with the offsets of the line beginnings and the size
+        of the file as the last element.
+    """
+    if path.endswith(".gz"):
+        raise ValueError(
+            "Cannot index lines of compressed file '{}'".format(path))
+
+    mtime = os.path.getmtime(path)
+    if (path, mtime) in _LOADED_INDICES:
+        return _LOADED_INDICES[(path, mtime)]
+
+    index_path = path + INDEX_SUFFIX
+    offsets = None
+    if (os.path.isfile(index_path)
+            and os.path.getmtime(index_path) >= mtime):
+        offsets = np.load(index_path, mmap_mode="r")
+        if offsets[-1] != os.path.getsize(path):
+            offsets = None
+
+    if offsets is None:
+        offsets = _build_offsets(path)
+        try:
+            np.save(index_path, offsets)
+            log("Line index of '{}' saved to '{}'".format(path, index_path))
+        except OSError as exc:
+            warn("Cannot save line index of '{}': {}".format(path, exc))
+
+    _LOADED_INDICES[(path, mtime)] = offsets
+    return offsets
+
+
+def count_lines(paths: List[str]) -> int:
+    """Count the lines in the files using their indices."""
+    return sum(len(line_offsets(path)) - 1 for path in paths)
+
+
+def file_ranges(paths: List[str], start: int,
+                length: int = None) -> List[Union[str, FileRange]]:
+    """Describe a range of lines of the given files.
+
+    Arguments:
+        paths: The paths of the files which are read as a single sequence of
+            lines.
+        start: Index of the first line in the range.
+        length: Number of lines in the range. If None, the range ends with
+            the end of the last file.
+
+    Returns:
+        The list of files to read. The files completely inside the range are
+        given by their paths, the files covered partially by file ranges.
+    """
+    ranges = []  # type: List[Union[str, FileRange]]
+    file_start = 0
+    for path in paths:
+        offsets = line_offsets(path)
+        file_lines = len(offsets) - 1
+
+        begin = max(start - file_start, 0)
+        end = file_lines
+        if length is not None:
+            end = min(start + length - file_start, file_lines)
+
+        if begin == 0 and end == file_lines:
+            ranges.append(path)
+        elif begin < end:
+            ranges.append(FileRange(path, int(offsets[begin]),
+                                    int(offsets[end]), end - begin))
+
+        file_start += file_lines
+        if length is not None and file_start >= start + length:
+            break
+
+    return ranges
+
+
+def reads_file_ranges(reader: Callable) -> Callable:
+    """Mark a reader which accepts file ranges in its list of files."""
+    reader.reads_file_ranges = True  # type: ignore
+    return reader
+
+
+def supports_file_ranges(reader: Callable) -> bool:
+    """Check whether a reader accepts file ranges in its list of files."""
+    return getattr(reader, "reads_file_ranges", False)
+
+
+def open_lines(file_range: FileRange,
+               encoding: str = None) -> Iterator[Union[str, bytes]]:
+    """Read the lines of a file range.
+
+    Arguments:
+        file_range: The range of lines.
+        encoding: The encoding of the file. If None, the lines are bytes.
+
+    Returns:
+        Generator yielding the lines of the range. The lines are split only
+        on ``\\n`` as in the index, other line breaks such as ``\\r`` are
+        kept inside the lines.
+    """
+    with open(file_range.path, "rb") as f_data:
+        f_data.seek(file_range.begin)
+        lines = f_data  # type: Iterator
+        if encoding is not None:
+            lines = io.TextIOWrapper(f_data, encoding=encoding, newline="\n")
+        yield from islice(lines, file_range.lines)
+
+
+def _build_offsets(path: str) -> np.ndarray:
+    """Find the offsets of the lines in a single pass over the file."""
+    log("Building line index of '{}'".format(path))
+
+    newlines = []  # type: List[np.ndarray]
+    position = 0
+    with open(path, "rb") as f_data:
+        while True:
+            chunk = f_data.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            newlines.append(np.flatnonzero(data == ord("\n")) + position + 1)
+            position += len(chunk)
+
+    offsets = np.concatenate([np.zeros(1, dtype=np.int64)] + newlines
+                             + [np.array([position], dtype=np.int64)])
+    offsets = offsets.astype(np.int64)
+
+    # the last line may or may not end with a newline
+    if len(offsets) > 1 and offsets[-2] == position:
+        offsets = offsets[:-1]
+
+    return offsets
@@ -1,9 +1,18 @@
-from typing import List, Callable, Iterable
+from typing import BinaryIO, List, Callable, Iterable, Optional, Tuple
+import glob
 import os
 
 from typeguard import check_argument_types
 import numpy as np
 
+from neuralmonkey.logging import log
+
+PACKED_INDEX_SUFFIX = ".index.npz"
+# the suffix of the data files following the prefix, as a glob pattern
+_PACKED_DATA_PATTERN = ".[0-9][0-9][0-9][0-9][0-9].data"
+# offsets of the arrays in packed shards are aligned to this number of bytes
+_PACKED_ALIGNMENT = 64
+
 
 def single_tensor(files: List[str]) -> np.ndarray:
     """Load a single tensor from a numpy file."""
@@ -38,5 +47,156 @@ def from_file_list(prefix: str,
     return load
 
 
+class PackedShardWriter(object):
+    """Writer of numpy arrays into packed shard files.
+
+    Each shard consists of a data file with the contents of the arrays
+    stored one after another and an index file with their offsets and
+    shapes. The arrays can have different shapes but must have the same
+    data type.
+    """
+
+    def __init__(self, prefix: str, shard_size: int = 1024) -> None:
+        """Create a new writer.
+
+        Arguments:
+            prefix: Prefix of the shard files. The data files are named
+                ``{prefix}.{shard number:05d}.data``, their indices have the
+                suffix ``.index.npz`` appended.
+            shard_size: Approximate maximum size of a data file in megabytes.
+        """
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard_paths = []  # type: List[str]
+        self.dtype = None  # type: Optional[np.dtype]
+        self._f_data = None  # type: Optional[BinaryIO]
+        self._offsets = []  # type: List[int]
+        self._shapes = []  # type: List[Tuple[int, ...]]
+
+    def add(self, array: np.ndarray) -> None:
+        """Append an array to the current shard."""
+        array = np.asarray(array)
+        if self.dtype is None:
+            self.dtype = array.dtype
+        elif array.dtype != self.dtype:
+            raise ValueError(
+                "Packed arrays must have the same dtype, got {} and {}"
+                .format(self.dtype, array.dtype))
+
+        if self._f_data is not None and (
+                self._f_data.tell() + array.nbytes
+                > self.shard_size * 1024 * 1024):
+            self._close_shard()
+
+        if self._f_data is None:
+            self.shard_paths.append("{}.{:05d}.data".format(
+                self.prefix, len(self.shard_paths)))
+            self._f_data = open(self.shard_paths[-1], "wb")
+            self._offsets, self._shapes = [], []
+
+        self._f_data.write(b"\0" * (-self._f_data.tell() % _PACKED_ALIGNMENT))
+        self._offsets.append(self._f_data.tell())
+        self._shapes.append(array.shape)
+        self._f_data.write(array.tobytes())
+
+    def close(self) -> List[str]:
+        """Finish the last shard.
+
+        Returns:
+            The list of the data files.
+        """
+        if self._f_data is not None:
+            self._close_shard()
+        return self.shard_paths
+
+    def _close_shard(self) -> None:
+        self._f_data.close()
+        self._f_data = None
+        np.savez(self.shard_paths[-1] + PACKED_INDEX_SUFFIX,
+                 dtype=np.array(self.dtype.str),
+                 offsets=np.array(self._offsets, dtype=np.int64),
+                 ndims=np.array([len(shape) for shape in self._shapes],
+                                dtype=np.int64),
+                 shapes=np.array([dim for shape in self._shapes
+                                  for dim in shape], dtype=np.int64))
+
+
+def write_packed_shards(prefix: str, arrays: Iterable[np.ndarray],
+                        shard_size: int = 1024) -> List[str]:
+    """Pack a series of numpy arrays into large shard files.
+
+    Arguments:
+        prefix: Prefix of the shard files, see ``PackedShardWriter``.
+        arrays: The arrays to pack, e.g. a dataset series.
+        shard_size: Approximate maximum size of a data file in megabytes.
+
+    Returns:
+        The list of the data files.
+    """
+    check_argument_types()
+
+    writer = PackedShardWriter(prefix, shard_size)
+    try:
+        for array in arrays:
+            writer.add(array)
+    finally:
+        shard_paths = writer.close()
+
+    log("Arrays packed to {} shards with prefix '{}'"
+        .format(len(shard_paths), prefix))
+    return shard_paths
+
+
+def packed_shard_files(prefix: str) -> List[str]:
+    """List the data files of the packed shards with the given prefix."""
+    return sorted(glob.glob(glob.escape(prefix) + _PACKED_DATA_PATTERN))
+
+
+def remove_packed_shards(prefix: str) -> None:
+    """Remove the data and index files of the packed shards with a prefix.
+
+    Only the files named as by ``PackedShardWriter`` are removed, other files
+    starting with the prefix are kept.
+    """
+    pattern = glob.escape(prefix) + _PACKED_DATA_PATTERN
+    for path in glob.glob(pattern) + glob.glob(pattern + PACKED_INDEX_SUFFIX):
+        os.remove(path)
+
+
+def packed_reader(files: List[str]) -> Iterable[np.ndarray]:
+    """Read arrays from packed shards created by ``write_packed_shards``.
+
+    The data files are memory-mapped and the arrays are read-only views
+    into them, so no data are copied until the arrays are used.
+
+    Arguments:
+        files: The data files of the shards.
+
+    Returns:
+        Generator yielding the packed arrays.
+    """
+    for path in files:
+        with np.load(path + PACKED_INDEX_SUFFIX) as index:
+            dtype = np.dtype(str(index["dtype"]))
+            offsets = index["offsets"]
+            ndims = index["ndims"]
+            shapes = index["shapes"]
+
+        if not offsets.size:
+            continue
+
+        if os.path.getsize(path):
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            # an empty memory map cannot be created
+            data = np.zeros([0], dtype=np.uint8)
+        shape_starts = np.concatenate([[0], np.cumsum(ndims)])
+
+        for i, offset in enumerate(offsets):
+            shape = tuple(shapes[shape_starts[i]:shape_starts[i + 1]])
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            yield data[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
 # pylint: disable=invalid-name
 numpy_file_list_reader = from_file_list(prefix="")
@@ -0,0 +1,35 @@
+"""Helpers for loading data in parallel."""
+
+from typing import Callable, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
+import collections
+
+
+def ordered_map(function: Callable, items: Iterable,
+                num_workers: Optional[int]) -> Iterable:
+    """Apply a function to items in a thread pool, keeping their order.
+
+    The items are submitted lazily, at most a few items per worker are
+    processed ahead of the consumer of the results.
+
+    Arguments:
+        function: The function to apply.
+        items: The items to process.
+        num_workers: Number of threads. If None or 1, the function is applied
+            in the calling thread.
+
+    Returns:
+        Generator of the results in the order of the items.
+    """
+    if num_workers is None or num_workers <= 1:
+        yield from map(function, items)
+        return
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        pending = collections.deque()  # type: collections.deque
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 4 * num_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
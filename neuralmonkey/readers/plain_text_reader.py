@@ -1,11 +1,16 @@
-from typing import List, Iterable, Callable
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Set,
+                    Tuple)
+from itertools import islice
+import collections
 import gzip
 import csv
-import io
+import re
 import sys
-import unicodedata
+import weakref
 
 from neuralmonkey.logging import warn
+from neuralmonkey.readers.line_index import (FileRange, open_lines,
+                                             reads_file_ranges)
 
 
 # pylint: disable=invalid-name
@@ -14,12 +19,23 @@ PlainTextFileReader = Callable[[List[str]], Iterable[List[str]]]
 
 csv.field_size_limit(sys.maxsize)
 
+# Groups of consecutive alphanumeric or non-alphanumeric characters. The
+# characters matched by [^\W_] are exactly those in the Unicode letter and
+# number categories (L* and N*).
+T2T_TOKEN_GROUP = re.compile(r"[^\W_]+|[\W_]+")
+
+# number of rows split to the columns at once when all columns are read
+_ROWS_BLOCK_SIZE = 10000
+
 
 def string_reader(
         encoding: str = "utf-8") -> Callable[[List[str]], Iterable[str]]:
+    @reads_file_ranges
     def reader(files: List[str]) -> Iterable[str]:
         for path in files:
-            if path.endswith(".gz"):
+            if isinstance(path, FileRange):
+                yield from open_lines(path, encoding)
+            elif path.endswith(".gz"):
                 with gzip.open(path, "r") as f_data:
                     for line in f_data:
                         yield str(line, "utf-8")
@@ -33,6 +49,7 @@ def string_reader(
 
 def tokenized_text_reader(encoding: str = "utf-8") -> PlainTextFileReader:
     """Get reader for space-separated tokenized text."""
+    @reads_file_ranges
     def reader(files: List[str]) -> Iterable[List[str]]:
         lines = string_reader(encoding)
         for line in lines(files):
@@ -51,37 +68,20 @@ def t2t_tokenized_text_reader(encoding: str = "utf-8") -> PlainTextFileReader:
     tokens, dropping single spaces inside the text. Basically the goal here is
     to preserve the whitespace around weird characters and whitespace on weird
     positions (beginning and end of the text).
-    """
-    alphanumeric_charset = set(
-        chr(i) for i in range(sys.maxunicode)
-        if (unicodedata.category(chr(i)).startswith("L")
-            or unicodedata.category(chr(i)).startswith("N")))
 
+    The character groups are found by a precompiled regular expression, so
+    creating the reader does not require looking up the character classes.
+    """
+    @reads_file_ranges
     def reader(files: List[str]) -> Iterable[List[str]]:
         lines = string_reader(encoding)
         for line in lines(files):
-            if not line:
-                yield []
-            line = line.rstrip("\n")
-
-            tokens = []
-            is_alnum = [ch in alphanumeric_charset for ch in line]
-            current_token_start = 0
-
-            for pos in range(1, len(line)):
-                # Boundary of alnum and non-alnum character groups
-                if is_alnum[pos] != is_alnum[pos - 1]:
-                    token = line[current_token_start:pos]
+            groups = T2T_TOKEN_GROUP.findall(line.rstrip("\n")) or [""]
 
-                    # Drop single space if it's not on the beginning
-                    if token != " " or current_token_start == 0:
-                        tokens.append(token)
-
-                    current_token_start = pos
-
-            # Add a final token (even if it's a single space)
-            final_token = line[current_token_start:]
-            tokens.append(final_token)
+            # Drop single spaces which are not on the beginning or the end
+            tokens = groups[:1]
+            tokens.extend(token for token in groups[1:-1] if token != " ")
+            tokens.extend(groups[1:][-1:])
 
             yield tokens
 
@@ -96,35 +96,233 @@ def column_separated_reader(
     Args:
         column: number of column to be returned. It starts with 1 for the first
     """
+    @reads_file_ranges
     def reader(files: List[str]) -> Iterable[List[str]]:
-        column_count = None
-        text_reader = string_reader(encoding)
-        for line in text_reader(files):
-            io_line = io.StringIO(line.strip())
-            if quotechar is not None:
-                parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
-                                             quotechar=quotechar,
-                                             skipinitialspace=True))
-            else:
-                parsed_csv = list(csv.reader(io_line, delimiter=delimiter,
-                                             quoting=csv.QUOTE_NONE,
-                                             skipinitialspace=True))
-            columns = len(parsed_csv[0])
-            if column_count is None:
-                column_count = columns
-            elif column_count != columns:
-                warn("A mismatch in number of columns. Expected {} got {}"
-                     .format(column_count, columns))
-            if columns < column:
-                warn("There is a missing column number {} in the dataset."
-                     .format(column))
-                yield []
-            else:
-                yield parsed_csv[0][column - 1].split()
+        for row in _delimited_rows(files, delimiter, quotechar, encoding):
+            yield _column_tokens(row, column)
 
     return reader
 
 
+class SharedColumnReader(object):
+    """Reader of several columns of delimiter-separated files.
+
+    Every column is read into a separate series using a reader obtained by
+    the ``column`` method (or the ``shared_column`` function in
+    configuration files). The readers of all columns share a single pass
+    over the files: the rows are parsed once and the column values are
+    buffered until the reader of the column consumes them. When the series
+    are read in parallel (as in the lazy dataset), the buffers hold only
+    a few rows. The in-memory dataset reads all columns at once with
+    ``read_columns`` (see ``read_series``). A column which falls too far
+    behind the others, or starts reading after all readers of the pass are
+    finished, parses the files again.
+    """
+
+    def __init__(self, delimiter: str = "\t", quotechar: str = None,
+                 encoding: str = "utf-8",
+                 max_pending_rows: int = 5000) -> None:
+        """Create a reader of delimiter-separated files.
+
+        Arguments:
+            delimiter: The column delimiter.
+            quotechar: The quoting character, None for no quoting.
+            encoding: The encoding of the files.
+            max_pending_rows: Maximum number of rows buffered for a column
+                which has not started reading yet. A column with more rows
+                parses the files again when it starts reading.
+        """
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.encoding = encoding
+        self.max_pending_rows = max_pending_rows
+        self._columns = set()  # type: Set[int]
+        # the passes are kept only while a column reader iterates over them
+        self._passes = weakref.WeakValueDictionary(
+        )  # type: weakref.WeakValueDictionary
+
+    def column(self, column: int) -> PlainTextFileReader:
+        """Get the reader of tokenized text in a column.
+
+        Arguments:
+            column: The number of the column, starting with 1.
+        """
+        self._columns.add(column)
+
+        @reads_file_ranges
+        def reader(files: List[str]) -> Iterable[List[str]]:
+            key = tuple(files)
+            column_pass = self._passes.get(key)
+            if (column_pass is None or column in column_pass.started
+                    or column not in column_pass.buffers):
+                column_pass = _ColumnPass(
+                    _delimited_rows(files, self.delimiter, self.quotechar,
+                                    self.encoding),
+                    self._columns, self.max_pending_rows)
+                self._passes[key] = column_pass
+
+            column_pass.started.add(column)
+            buffer = column_pass.buffers[column]
+            try:
+                while buffer or column_pass.read_row():
+                    yield buffer.popleft()
+            finally:
+                # runs also when the generator is closed or collected
+                column_pass.buffers.pop(column, None)
+                # the pass is finished when no column is waiting for it
+                if not column_pass.buffers:
+                    column_pass.close()
+                    if self._passes.get(key) is column_pass:
+                        del self._passes[key]
+
+        reader.shared_column = (self, column)  # type: ignore
+        return reader
+
+    def read_columns(self, files: List[str],
+                     columns: Iterable[int]) -> Dict[int, List[List[str]]]:
+        """Read whole columns in a single pass over the files.
+
+        The rows are parsed in blocks and each block is split to all the
+        columns at once, so no rows are buffered.
+
+        Arguments:
+            files: The delimited files.
+            columns: The numbers of the columns to read.
+
+        Returns:
+            The lists of the tokenized column values indexed by the columns.
+        """
+        result = {
+            column: [] for column in columns
+        }  # type: Dict[int, List[List[str]]]
+        rows = _delimited_rows(files, self.delimiter, self.quotechar,
+                               self.encoding)
+        while True:
+            block = list(islice(rows, _ROWS_BLOCK_SIZE))
+            if not block:
+                break
+            for column, values in result.items():
+                values.extend(_column_tokens(row, column) for row in block)
+        return result
+
+
+def read_series(
+        series_paths_and_readers: Dict[str, Tuple[List[str], Callable]]
+) -> Dict[str, List[Any]]:
+    """Read whole series into memory.
+
+    The columns of the same files read by the same ``SharedColumnReader``
+    are read together in a single pass, other series by their readers.
+
+    Arguments:
+        series_paths_and_readers: The paths and readers of the series.
+
+    Returns:
+        The lists of the series items indexed by the series names.
+    """
+    series = {}  # type: Dict[str, List[Any]]
+    # the series read by shared column readers, grouped by the readers (by
+    # their ids) and the files
+    shared_groups = collections.OrderedDict(
+    )  # type: Dict[Tuple[int, Tuple[str, ...]], List[Tuple[str, int]]]
+    shared_readers = {}  # type: Dict[int, SharedColumnReader]
+
+    for name, (paths, reader) in series_paths_and_readers.items():
+        shared_column_info = getattr(reader, "shared_column", None)
+        if shared_column_info is None:
+            series[name] = list(reader(paths))
+            continue
+        shared, column = shared_column_info
+        shared_readers[id(shared)] = shared
+        shared_groups.setdefault((id(shared), tuple(paths)), []).append(
+            (name, column))
+
+    for (shared_id, paths), names_and_columns in shared_groups.items():
+        columns = shared_readers[shared_id].read_columns(
+            list(paths), [column for _, column in names_and_columns])
+        for name, column in names_and_columns:
+            # a column read by several series is not shared between them
+            series[name] = list(columns[column])
+
+    return {name: series[name] for name in series_paths_and_readers}
+
+
+def shared_column(reader: SharedColumnReader,
+                  column: int) -> PlainTextFileReader:
+    """Get the reader of a column of a shared column reader."""
+    return reader.column(column)
+
+
+class _ColumnPass(object):
+    """A single pass over delimited files shared by the column readers."""
+
+    def __init__(self, rows: Iterator[List[str]], columns: Iterable[int],
+                 max_pending_rows: int) -> None:
+        self.rows = rows
+        self.max_pending_rows = max_pending_rows
+        self.buffers = {
+            column: collections.deque() for column in columns
+        }  # type: Dict[int, collections.deque]
+        self.started = set()  # type: Set[int]
+
+    def read_row(self) -> bool:
+        """Parse the next row and add its columns to the buffers.
+
+        Returns:
+            False if there are no more rows.
+        """
+        row = next(self.rows, None)
+        if row is None:
+            return False
+
+        for column, buffer in list(self.buffers.items()):
+            if (column not in self.started
+                    and len(buffer) >= self.max_pending_rows):
+                # the column will be read by a new pass
+                del self.buffers[column]
+            else:
+                buffer.append(_column_tokens(row, column))
+        return True
+
+    def close(self) -> None:
+        """Close the files of the pass."""
+        self.rows.close()  # type: ignore
+
+
+def _delimited_rows(files: List[str], delimiter: str, quotechar: str,
+                    encoding: str) -> Iterator[List[str]]:
+    """Parse the rows of delimiter-separated files.
+
+    Every line is parsed separately, so an unbalanced quote does not merge
+    the following lines into a single row and the rows stay aligned with the
+    lines of the files.
+    """
+    if quotechar is not None:
+        csv_args = {"delimiter": delimiter, "quotechar": quotechar,
+                    "skipinitialspace": True}  # type: Dict[str, Any]
+    else:
+        csv_args = {"delimiter": delimiter, "quoting": csv.QUOTE_NONE,
+                    "skipinitialspace": True}
+
+    column_count = None
+    for line in string_reader(encoding)(files):
+        row = next(csv.reader([line.strip()], **csv_args), [])
+        if column_count is None:
+            column_count = len(row)
+        elif column_count != len(row):
+            warn("A mismatch in number of columns. Expected {} got {}"
+                 .format(column_count, len(row)))
+        yield row
+
+
+def _column_tokens(row: List[str], column: int) -> List[str]:
+    if len(row) < column:
+        warn("There is a missing column number {} in the dataset."
+             .format(column))
+        return []
+    return row[column - 1].split()
+
+
 def csv_reader(column: int):
     return column_separated_reader(column, delimiter=",", quotechar='"')
 
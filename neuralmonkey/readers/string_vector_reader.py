@@ -1,38 +1,121 @@
-from typing import List, Iterable, Type
+from typing import List, Iterable, Tuple, Type, Union
 import gzip
+import warnings
+
 import numpy as np
 
+from neuralmonkey.readers.line_index import FileRange, reads_file_ranges
 
-def get_string_vector_reader(dtype: Type = np.float32, columns: int = None):
-    """Get a reader for vectors encoded as whitespace-separated numbers."""
-    def process_line(line: str, lineno: int, path: str) -> np.ndarray:
-        numbers = line.strip().split()
-        if columns is not None and len(numbers) != columns:
-            raise ValueError("Wrong number of columns ({}) on line {}, file {}"
-                             .format(len(numbers), lineno, path))
+# the files are parsed in blocks of this size
+_CHUNK_SIZE = 1 << 24
 
-        return np.array(numbers, dtype=dtype)
 
+def get_string_vector_reader(dtype: Type = np.float32, columns: int = None):
+    """Get a reader for vectors encoded as whitespace-separated numbers.
+
+    The files are read in large blocks. All numbers in a block are converted
+    at once and the vectors are views into the resulting array.
+    """
+    @reads_file_ranges
     def reader(files: List[str])-> Iterable[List[np.ndarray]]:
         for path in files:
             current_line = 0
+            for chunk in _line_chunks(path):
+                values, counts = _parse_chunk(chunk, dtype)
+                ends = np.cumsum(counts).tolist()
+                counts = counts.tolist()
 
-            if path.endswith(".gz"):
-                with gzip.open(path, "r") as f_data:
-                    for line in f_data:
-                        current_line += 1
-                        if line.strip():
-                            yield process_line(str(line), current_line, path)
-            else:
-                with open(path) as f_data:
-                    for line in f_data:
-                        current_line += 1
-                        if line.strip():
-                            yield process_line(line, current_line, path)
+                for i, (count, end) in enumerate(zip(counts, ends)):
+                    if not count:
+                        continue
+                    if columns is not None and count != columns:
+                        raise ValueError(
+                            "Wrong number of columns ({}) on line {}, file {}"
+                            .format(count, current_line + i + 1, path))
+                    yield values[end - count:end]
+
+                current_line += len(counts)
 
     return reader
 
 
+def _line_chunks(path: Union[str, FileRange]) -> Iterable[bytes]:
+    """Read a possibly gzipped file or a file range in blocks of lines."""
+    remaining = None
+    if isinstance(path, FileRange):
+        f_data = open(path.path, "rb")
+        f_data.seek(path.begin)
+        remaining = path.end - path.begin
+    elif path.endswith(".gz"):
+        f_data = gzip.open(path, "rb")
+    else:
+        f_data = open(path, "rb")
+
+    with f_data:
+        remainder = b""
+        while True:
+            if remaining is None:
+                block = f_data.read(_CHUNK_SIZE)
+            else:
+                block = f_data.read(min(_CHUNK_SIZE, remaining))
+                remaining -= len(block)
+            if not block:
+                break
+            last_newline = block.rfind(b"\n")
+            if last_newline == -1:
+                remainder += block
+                continue
+            yield remainder + block[:last_newline + 1]
+            remainder = block[last_newline + 1:]
+
+        if remainder:
+            yield remainder
+
+
+def _parse_chunk(chunk: bytes, dtype: Type) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse all numbers in a block of lines.
+
+    Returns:
+        A tuple of the array with all the numbers in the block and the
+        array with the number of numbers on each line.
+    """
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    # the same bytes as in bytes.split: space, \t, \n, \v, \f and \r
+    spaces = (data == 32) | ((data >= 9) & (data <= 13))
+
+    # a number starts with a non-space byte after a space or at the start
+    starts = ~spaces
+    starts[1:] &= spaces[:-1]
+
+    # the numbers on a line are those starting between its boundaries
+    line_ends = np.flatnonzero(data == ord("\n"))
+    if not chunk.endswith(b"\n"):
+        line_ends = np.append(line_ends, len(data))
+    number_ends = np.searchsorted(np.flatnonzero(starts), line_ends)
+    counts = np.diff(np.concatenate([[0], number_ends]))
+
+    try:
+        with warnings.catch_warnings():
+            # invalid data are reported by a warning in older versions
+            warnings.simplefilter("error")
+            values = np.fromstring(chunk, dtype=dtype, sep=" ")
+    except (DeprecationWarning, ValueError):
+        values = None
+
+    if values is not None and np.issubdtype(dtype, np.integer):
+        # a sign which is not followed by a digit is parsed as zero
+        signs = starts & ((data == ord("-")) | (data == ord("+")))
+        digits = np.append((data >= ord("0")) & (data <= ord("9")), False)
+        if np.any(signs & ~digits[1:]):
+            values = None
+
+    if values is None or len(values) != counts.sum():
+        # the parsing stopped at an invalid number, this raises an error
+        values = np.array(chunk.split(), dtype=dtype)
+
+    return values, counts
+
+
 # pylint: disable=invalid-name
 FloatVectorReader = get_string_vector_reader(np.float32)
 IntVectorReader = get_string_vector_reader(np.int32)
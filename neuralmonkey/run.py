@@ -26,8 +26,12 @@ def main() -> None:
 
     test_datasets = Configuration()
     test_datasets.add_argument("test_datasets")
-    test_datasets.add_argument("batch_size", cond=lambda x: x > 0)
+    test_datasets.add_argument(
+        "batch_size", cond=lambda x: not isinstance(x, int) or x > 0)
     test_datasets.add_argument("variables", cond=lambda x: isinstance(x, list))
+    test_datasets.add_argument("sort_by_length", required=False,
+                               default=False)
+    test_datasets.add_argument("deduplicate", required=False, default=False)
 
     test_datasets.load_file(args.datasets)
     test_datasets.build_model()
@@ -65,11 +69,15 @@ def main() -> None:
         if exp.config.args.evaluation is None:
             exp.run_model(dataset,
                           write_out=True,
-                          batch_size=datasets_model.batch_size)
+                          batch_size=datasets_model.batch_size,
+                          sort_by_length=datasets_model.sort_by_length,
+                          deduplicate=datasets_model.deduplicate)
         else:
-            eval_result = exp.evaluate(dataset,
-                                       write_out=True,
-                                       batch_size=datasets_model.batch_size)
+            eval_result = exp.evaluate(
+                dataset, write_out=True,
+                batch_size=datasets_model.batch_size,
+                sort_by_length=datasets_model.sort_by_length,
+                deduplicate=datasets_model.deduplicate)
             results.append(eval_result)
 
     if args.json:
@@ -77,5 +85,4 @@ def main() -> None:
             json.dump(results, f_out)
             f_out.write("\n")
 
-    for session in exp.config.model.tf_manager.sessions:
-        session.close()
+    exp.config.model.tf_manager.close()
@@ -11,7 +11,7 @@ from neuralmonkey.runners.base_runner import (
 # pylint: disable=unused-import
 from neuralmonkey.runners.base_runner import FeedDict
 # pylint: enable=unused-import
-from neuralmonkey.vocabulary import PAD_TOKEN_INDEX, END_TOKEN, PAD_TOKEN
+from neuralmonkey.vocabulary import PAD_TOKEN_INDEX, PAD_TOKEN
 
 
 class BeamSearchExecutable(Executable):
@@ -152,33 +152,27 @@ class BeamSearchExecutable(Executable):
     def prepare_results(self):
         max_time = self._step
 
-        decoded_tokens = []
-        bs_scores = []
         # We extract last hyp_idx for each sentence in the batch
         hyp_indices = np.argpartition(
             -self._scores[-1], self._rank - 1)[:, self._rank - 1]
-
-        for batch_idx, hyp_idx in enumerate(hyp_indices):
-            output_tokens = []
-            bs_scores.append(self._scores[-1][batch_idx][hyp_idx])
-            for time in reversed(range(max_time)):
-                token_id = self._token_ids[time][batch_idx][hyp_idx]
-                token = self._decoder.vocabulary.index_to_word[token_id]
-                output_tokens.append(token)
-                hyp_idx = self._parent_ids[time][batch_idx][hyp_idx]
-
-            output_tokens.reverse()
-
-            before_eos_tokens = []
-            for tok in output_tokens:
-                if tok == END_TOKEN:
-                    break
-                # TODO: investigate why the decoder can start generating
-                # padding before generating the END_TOKEN
-                if tok != PAD_TOKEN:
-                    before_eos_tokens.append(tok)
-
-            decoded_tokens.append(before_eos_tokens)
+        batch_indices = np.arange(len(hyp_indices))
+        bs_scores = self._scores[-1][batch_indices, hyp_indices]
+
+        # follow the hypotheses of all sentences back at once
+        token_ids = np.zeros([max_time, len(hyp_indices)], dtype=np.int64)
+        for time in reversed(range(max_time)):
+            token_ids[time] = self._token_ids[time][batch_indices, hyp_indices]
+            hyp_indices = self._parent_ids[time][batch_indices, hyp_indices]
+
+        # the sentences are cut before the END_TOKEN
+        decoded_tokens = self._decoder.vocabulary.vectors_to_sentences(
+            token_ids)
+
+        # TODO: investigate why the decoder can start generating
+        # padding before generating the END_TOKEN
+        decoded_tokens = [[tok for tok in sent if tok != PAD_TOKEN]
+                          if PAD_TOKEN in sent else sent
+                          for sent in decoded_tokens]
 
         if self._postprocess is not None:
             decoded_tokens = self._postprocess(decoded_tokens)
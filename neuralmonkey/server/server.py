@@ -17,6 +17,8 @@ from neuralmonkey.experiment import Experiment
 APP = Flask(__name__)
 APP.config.from_object(__name__)
 APP.config["experiment"] = None
+APP.config["sort_by_length"] = False
+APP.config["deduplicate"] = False
 
 
 def root_dir():  # pragma: no cover
@@ -32,7 +34,10 @@ def run(data):  # pragma: no cover
     exp = APP.config["experiment"]
     dataset = Dataset("request", data, {})
 
-    _, response_data = exp.run_model(dataset, write_out=False)
+    _, response_data = exp.run_model(
+        dataset, write_out=False,
+        sort_by_length=APP.config["sort_by_length"],
+        deduplicate=APP.config["deduplicate"])
 
     return response_data
 
@@ -85,6 +90,12 @@ def main() -> None:
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--host", type=str, default="127.0.0.1")
     parser.add_argument("--configuration", type=str, required=True)
+    parser.add_argument("--sort-by-length", action="store_true",
+                        help="sort the requested examples by length before "
+                        "batching, the responses keep the request order")
+    parser.add_argument("--deduplicate", action="store_true",
+                        help="decode each distinct example of a request "
+                        "only once")
     args = parser.parse_args()
 
     print("")
@@ -92,4 +103,6 @@ def main() -> None:
     exp = Experiment(config_path=args.configuration)
     exp.build_model()
     APP.config["experiment"] = exp
+    APP.config["sort_by_length"] = args.sort_by_length
+    APP.config["deduplicate"] = args.deduplicate
     APP.run(port=args.port, host=args.host)
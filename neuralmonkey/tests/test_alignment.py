@@ -0,0 +1,49 @@
+#!/usr/bin/env python3.5
+import random
+import unittest
+
+import numpy as np
+
+from neuralmonkey.processors.alignment import (
+    WordAlignmentPreprocessor, alignments_to_dense)
+
+
+class TestWordAlignment(unittest.TestCase):
+
+    def test_preprocess(self):
+        preprocessor = WordAlignmentPreprocessor(4, 3)
+        alignment = preprocessor("0-0 1-0 2:1/0.5 2-1 9-9".split())
+
+        self.assertEqual(alignment.shape, (3, 4))
+        self.assertEqual(len(alignment.weights), 3)
+        self.assertTrue(np.array_equal(
+            alignments_to_dense([alignment])[0],
+            [[0.5, 0.5, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]]))
+
+    def test_reference_dense(self):
+        rng = random.Random(0)
+        sentences = [[]]
+        for _ in range(200):
+            sentences.append([
+                "{}{}{}{}".format(
+                    rng.randint(0, 6), rng.choice("-:"), rng.randint(0, 6),
+                    rng.choice(["", "/0.3", "/0", "/1.7"]))
+                for _ in range(rng.randint(0, 10))])
+
+        # pylint: disable=protected-access
+        for kwargs in [{}, {"normalize": False}, {"zero_based": False},
+                       {"dtype": np.float64}]:
+            preprocessor = WordAlignmentPreprocessor(5, 4, **kwargs)
+            dense = alignments_to_dense([preprocessor(s) for s in sentences])
+            reference = np.array(
+                [preprocessor._dense_reference(s) for s in sentences])
+
+            self.assertEqual(dense.dtype, reference.dtype)
+            self.assertTrue(np.array_equal(dense, reference))
+
+        self.assertTrue(np.array_equal(alignments_to_dense(list(reference)),
+                                       reference))
+
+
+if __name__ == "__main__":
+    unittest.main()
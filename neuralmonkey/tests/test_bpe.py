@@ -0,0 +1,109 @@
+#!/usr/bin/env python3.5
+import os
+import pickle
+import random
+import tempfile
+import unittest
+
+from lib.subword_nmt.apply_bpe import encode
+from neuralmonkey.processors.bpe import BPEPreprocessor, encode_word
+from neuralmonkey.processors.bpe_learner import count_words, learn_merges
+
+CORPUS = [
+    "the colorless ideas slept furiously",
+    "pooh slept all night",
+    "working class hero is something to be",
+    "I am the working class walrus",
+    "walrus for president"
+]
+
+TOKENIZED_CORPUS = [s.split(" ") for s in CORPUS]
+
+MERGES = ["s l", "sl e", "w a", "a l", "wa l", "l </w>", "e s", "r u",
+          "o r", "wor k", "t h", "th e</w>", "e </w>", "i n", "in g</w>"]
+
+
+class TestBPE(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.NamedTemporaryFile("w", suffix=".bpe",
+                                         delete=False) as f_merges:
+            f_merges.write("\n".join(MERGES) + "\n")
+        cls.preprocessor = BPEPreprocessor(f_merges.name, cache_size=10)
+        os.remove(f_merges.name)
+
+    def test_reference_encode(self):
+        bpe_codes = self.preprocessor.bpe.bpe_codes
+        for sentence in TOKENIZED_CORPUS:
+            for word in sentence:
+                self.assertEqual(encode_word(word, bpe_codes),
+                                 encode(word, bpe_codes, cache={}))
+
+    def test_random_merges(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            symbols = list("abc")
+            merges = []
+            for _ in range(rng.randint(1, 20)):
+                pair = (rng.choice(symbols), rng.choice(symbols + ["</w>"]))
+                merges.append(pair)
+                symbols.append(pair[0] + pair[1])
+            bpe_codes = {pair: i for i, pair in reversed(list(
+                enumerate(merges)))}
+
+            for _ in range(20):
+                word = "".join(rng.choice("abc")
+                               for _ in range(rng.randint(1, 12)))
+                self.assertEqual(encode_word(word, bpe_codes),
+                                 encode(word, bpe_codes, cache={}))
+
+    def test_segment_batch(self):
+        segmented = self.preprocessor.segment_batch(TOKENIZED_CORPUS)
+        self.assertEqual(segmented,
+                         [self.preprocessor(s) for s in TOKENIZED_CORPUS])
+        self.assertEqual(segmented[3][-3:], ["wal@@", "ru@@", "s"])
+
+    def test_cache_size(self):
+        # pylint: disable=protected-access
+        for sentence in TOKENIZED_CORPUS:
+            self.preprocessor(sentence)
+        self.assertEqual(len(self.preprocessor._cache), 10)
+
+        unpickled = pickle.loads(pickle.dumps(self.preprocessor))
+        self.assertEqual(len(unpickled._cache), 0)
+        self.assertEqual(unpickled(TOKENIZED_CORPUS[0]),
+                         self.preprocessor(TOKENIZED_CORPUS[0]))
+
+
+class TestBPELearner(unittest.TestCase):
+
+    def test_count_words(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f_text:
+            f_text.write("\n".join(CORPUS * 20) + "\n")
+
+        counts = count_words([f_text.name])
+        sharded_counts = count_words([f_text.name], num_workers=2,
+                                     shard_size=100)
+        os.remove(f_text.name)
+
+        self.assertEqual(counts, sharded_counts)
+        self.assertEqual(counts["walrus"], 40)
+        self.assertEqual(sum(counts.values()),
+                         20 * sum(len(s) for s in TOKENIZED_CORPUS))
+
+    def test_learn_merges(self):
+        counts = {"lower": 2, "lowest": 6, "newer": 3, "wider": 1}
+        merges = learn_merges(counts, 100)
+        self.assertEqual(merges[:4], [("w", "e"), ("l", "o"), ("lo", "we"),
+                                      ("lowe", "s")])
+        # the pairs which occur only once are not merged
+        self.assertEqual(len(merges), len(learn_merges(counts, 1000)))
+        self.assertNotIn(("i", "d"), merges)
+
+        bpe_codes = {pair: i for i, pair in enumerate(merges)}
+        self.assertEqual(encode_word("lowest", bpe_codes), ("lowest",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,43 @@
 #!/usr/bin/env python3.5
 
 from typing import Iterable, List
+import gc
 import os
 import tempfile
 import unittest
+import weakref
 
-from neuralmonkey.dataset import LazyDataset, from_files
-from neuralmonkey.readers.plain_text_reader import UtfPlainTextReader
+import numpy as np
+
+from neuralmonkey.config.builder import build_config, ClassSymbol, ObjectRef
+from neuralmonkey.dataset import (Dataset, LazyDataset, BatchingScheme,
+                                  from_files)
+from neuralmonkey.preprocessing_cache import get_cache_key, set_cache_key
+from neuralmonkey.readers.line_index import FileRange, file_ranges
+from neuralmonkey.readers.plain_text_reader import (UtfPlainTextReader,
+                                                    string_reader)
+
+
+def _reverse(sentence: List[str]) -> List[str]:
+    return list(reversed(sentence))
+
+
+_UPPER_CALLS = []  # type: List[List[str]]
+
+
+def _upper(sentence: List[str]) -> List[str]:
+    _UPPER_CALLS.append(sentence)
+    return [token.upper() for token in sentence]
+
+
+set_cache_key(_upper, "upper")
+
+
+def _numbers_reader(files: List[str]) -> Iterable[int]:
+    for path in files:
+        with open(path) as f_data:
+            for line in f_data:
+                yield int(line.split()[1])
 
 
 class TestDataset(unittest.TestCase):
@@ -39,6 +70,47 @@ class TestDataset(unittest.TestCase):
             self.assertEqual(i, j)
         self.assertEqual(i, 9)
 
+    def test_lazy_dataset_preprocessor(self):
+        consumed = []
+
+        def reader(files: List[str]) -> Iterable[List[str]]:
+            with open(files[0]) as f_data:
+                for line in f_data:
+                    consumed.append(line)
+                    yield line.split()
+
+        def joined(dataset: Dataset) -> Iterable[List[str]]:
+            for src, tgt in zip(dataset.get_series("source"),
+                                dataset.get_series("target")):
+                yield src + ["|"] + tgt
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ["source", "target"]:
+                with open(os.path.join(tmp_dir, name), "w") as f_data:
+                    for i in range(10):
+                        print(name, i, file=f_data)
+
+            dataset = from_files(
+                name="data", lazy=True,
+                s_source=(os.path.join(tmp_dir, "source"), reader),
+                s_target=(os.path.join(tmp_dir, "target"), reader),
+                pre_joined=joined)
+
+            series = dataset.get_series("joined")
+            self.assertEqual(next(series),
+                             ["source", "0", "|", "target", "0"])
+            # the source series are read lazily
+            self.assertEqual(len(consumed), 2)
+
+            batch = next(iter(dataset.batch_dataset(4)))
+            self.assertEqual(batch.get_series("joined")[3],
+                             ["source", "3", "|", "target", "3"])
+
+            subset = dataset.subset(5, 2)
+            self.assertEqual(subset.get_series("joined"),
+                             [["source", "5", "|", "target", "5"],
+                              ["source", "6", "|", "target", "6"]])
+
     def test_glob(self):
         filenames = sorted(["abc1", "abc2", "abcxx", "xyz"])
         contents = ["a", "b", "c", "d"]
@@ -53,6 +125,255 @@ class TestDataset(unittest.TestCase):
 
             self.assertEqual(dataset.get_series("data"), [["a"], ["b"], ["d"]])
 
+    def test_token_level_batching(self):
+        sentences = [["a"] * length for length in [1, 6, 2, 5, 1, 6, 2]]
+        dataset = Dataset("data", {"source": sentences}, {})
+
+        scheme = BatchingScheme(batch_size=12, token_level_batching=True)
+        batches = [batch.get_series("source")
+                   for batch in dataset.batch_dataset(scheme)]
+        self.assertEqual([[len(s) for s in b] for b in batches],
+                         [[1, 6], [2, 5], [1, 6], [2]])
+
+        scheme = BatchingScheme(batch_size=12, token_level_batching=True,
+                                bucket_span=3)
+        batches = [batch.get_series("source")
+                   for batch in dataset.batch_dataset(scheme)]
+        self.assertEqual([[len(s) for s in b] for b in batches],
+                         [[1, 2, 1, 2], [5], [6, 6]])
+
+        # without bucketing, the dataset order is kept
+        batches = [batch.get_series("source")
+                   for batch in dataset.batch_dataset(scheme,
+                                                      keep_order=True)]
+        self.assertEqual([s for b in batches for s in b], sentences)
+
+    def test_shuffle_views(self):
+        sources = [str(i) for i in range(10)]
+        targets = np.arange(10) * 2
+        dataset = Dataset("data", {"source": sources, "target": targets}, {})
+        dataset.shuffle()
+
+        shuffled = dataset.get_series("source")
+        self.assertEqual(sorted(shuffled, key=int), sources)
+        self.assertEqual([int(s) * 2 for s in shuffled],
+                         list(dataset.get_series("target")))
+
+        batches = list(dataset.batch_dataset(4))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+        self.assertEqual(
+            [s for batch in batches for s in batch.get_series("source")],
+            shuffled)
+
+        subset = dataset.subset(2, 3)
+        self.assertEqual(subset.get_series("source"), shuffled[2:5])
+
+        # the series are shared, not copied
+        # pylint: disable=protected-access
+        self.assertIs(subset._series, dataset._series)
+        self.assertEqual(sources, [str(i) for i in range(10)])
+
+    def test_length_sorted(self):
+        sources = [["a"] * length for length in [2, 5, 1, 5, 3]]
+        dataset = Dataset("data", {"source": sources,
+                                   "id": list(range(5))}, {})
+
+        sorted_dataset, order = dataset.length_sorted(["source"])
+        self.assertEqual(sorted_dataset.get_series("id"), [1, 3, 4, 0, 2])
+        self.assertEqual(order.tolist(), [1, 3, 4, 0, 2])
+
+        outputs = sorted_dataset.get_series("source")
+        restored = [outputs[i] for i in np.argsort(order)]
+        self.assertEqual(restored, sources)
+
+    def test_deduplicated(self):
+        sources = [["a", "b"], ["c"], ["a", "b"], ["d"], ["c"]]
+        vectors = [np.ones(2), np.zeros(3), np.ones(2), np.ones(1),
+                   np.zeros(3)]
+        dataset = Dataset("data", {"source": sources, "vector": vectors}, {})
+
+        unique, positions = dataset.deduplicated()
+        self.assertEqual(unique.get_series("source"),
+                         [["a", "b"], ["c"], ["d"]])
+        self.assertEqual(positions.tolist(), [0, 1, 0, 2, 1])
+
+        outputs = unique.get_series("source")
+        self.assertEqual([outputs[i] for i in positions], sources)
+
+        vectors[2] = np.zeros(2)
+        dataset = Dataset("data", {"source": sources, "vector": vectors}, {})
+        unique, _ = dataset.deduplicated()
+        self.assertEqual(len(unique), 4)
+        unique, _ = dataset.deduplicated(["source"])
+        self.assertEqual(len(unique), 3)
+
+    def test_parallel_preprocessing(self):
+        sentences = [[str(j) for j in range(i % 7)] for i in range(100)]
+
+        for function in [_reverse, lambda x: list(reversed(x))]:
+            dataset = Dataset("data", {"source": sentences}, {},
+                              [("source", "reversed", function)],
+                              preprocessing_workers=2)
+            self.assertEqual(dataset.get_series("reversed"),
+                             [list(reversed(s)) for s in sentences])
+
+    def test_preprocessing_cache(self):
+        del _UPPER_CALLS[:]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.txt")
+            with open(path, "w") as f_data:
+                print("a b\nc\nd e f", file=f_data)
+            cache_dir = os.path.join(tmp_dir, "cache")
+
+            for lazy in [False, True, False, True]:
+                dataset = from_files(
+                    lazy=lazy, s_source=path,
+                    preprocessors=[("source", "upper", _upper)],
+                    preprocessing_cache=cache_dir)
+                self.assertEqual(list(dataset.get_series("upper")),
+                                 [["A", "B"], ["C"], ["D", "E", "F"]])
+
+            # the series was preprocessed only once
+            self.assertEqual(len(_UPPER_CALLS), 3)
+
+            with open(path, "w") as f_data:
+                print("g", file=f_data)
+            dataset = from_files(
+                s_source=path, preprocessors=[("source", "upper", _upper)],
+                preprocessing_cache=cache_dir, preprocessing_cache_size=0)
+            self.assertEqual(dataset.get_series("upper"), [["G"]])
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_preprocessing_cache_config(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "alignment.txt")
+            with open(path, "w") as f_data:
+                print("0-0 1-1", file=f_data)
+
+            config = {
+                "main": {"data": ObjectRef("data")},
+                "data": {
+                    "class": ClassSymbol("dataset.from_files"),
+                    "s_ali": path,
+                    "preprocessors": [("ali", "dense", ObjectRef("ali"))],
+                    "preprocessing_cache": os.path.join(tmp_dir, "cache")},
+                "ali": {
+                    "class": ClassSymbol(
+                        "processors.alignment.WordAlignmentPreprocessor"),
+                    "source_len": 4,
+                    "target_len": 3}}
+
+            # the changed configuration of the preprocessor is a cache miss
+            for source_len in [4, 5, 4]:
+                config["ali"]["source_len"] = source_len
+                objects = build_config(config, set())[1]
+                dataset = objects["data"]
+                alignment = dataset.get_series("dense")[0]
+                self.assertEqual(alignment.shape, (3, source_len))
+
+            self.assertEqual(
+                len(os.listdir(os.path.join(tmp_dir, "cache"))), 2)
+
+            # only the preprocessors and readers get cache keys, which do not
+            # keep them alive
+            self.assertIsNone(get_cache_key(dataset))
+            self.assertIsNotNone(get_cache_key(objects["ali"]))
+            preprocessor_ref = weakref.ref(objects["ali"])
+            del config, objects, dataset
+            gc.collect()
+            self.assertIsNone(preprocessor_ref())
+
+    def test_lazy_shuffle(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for shard in range(3):
+                for series in ["source", "target"]:
+                    path = os.path.join(
+                        tmp_dir, "{}.{}".format(series, shard))
+                    with open(path, "w") as file:
+                        for i in range(10):
+                            print("{} {}".format(series, shard * 10 + i),
+                                  file=file)
+
+            dataset = from_files(
+                lazy=True, shuffle_buffer_size=4, shuffle_shards=True,
+                s_source=os.path.join(tmp_dir, "source.*"),
+                s_target=os.path.join(tmp_dir, "target.*"))
+
+            unshuffled = list(dataset.get_series("source"))
+            self.assertEqual([int(s[1]) for s in unshuffled], list(range(30)))
+
+            dataset.shuffle()
+            source = list(dataset.get_series("source"))
+            target = list(dataset.get_series("target"))
+
+            self.assertNotEqual(source, unshuffled)
+            self.assertEqual(sorted(source, key=lambda s: int(s[1])),
+                             unshuffled)
+            self.assertEqual([s[1] for s in source], [t[1] for t in target])
+            # the shuffled order stays the same within the epoch
+            self.assertEqual(list(dataset.get_series("source")), source)
+
+    def test_line_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for shard in range(3):
+                for series in ["source", "target"]:
+                    path = os.path.join(
+                        tmp_dir, "{}.{}".format(series, shard))
+                    with open(path, "w") as file:
+                        for i in range(10):
+                            print("{} {}".format(series, shard * 10 + i),
+                                  file=file)
+
+            dataset = from_files(
+                lazy=True, line_index=True,
+                s_source=os.path.join(tmp_dir, "source.*"),
+                s_target=os.path.join(tmp_dir, "target.*"),
+                preprocessors=[("source", "prep", lambda x: x[1:])])
+
+            self.assertEqual(len(dataset), 30)
+            self.assertTrue(os.path.isfile(
+                os.path.join(tmp_dir, "source.0.lineidx.npy")))
+
+            subset = dataset.subset(7, 15)
+            self.assertEqual(len(subset), 15)
+            self.assertEqual(subset.get_series("target"),
+                             [["target", str(i)] for i in range(7, 22)])
+            self.assertEqual(subset.get_series("prep"),
+                             [[str(i)] for i in range(7, 22)])
+
+            skipped = dataset.skip(25)
+            self.assertEqual(len(skipped), 5)
+            self.assertEqual(list(skipped.get_series("source")),
+                             [["source", str(i)] for i in range(25, 30)])
+            self.assertEqual(len(list(dataset.get_series("source"))), 30)
+
+            # the reader gets the ranges of the files, not copies
+            paths = [os.path.join(tmp_dir, "source.{}".format(shard))
+                     for shard in range(3)]
+            ranges = file_ranges(paths, 7, 15)
+            self.assertEqual(ranges[0], FileRange(paths[0], 63, 90, 3))
+            self.assertEqual(ranges[1:], paths[1:2] + [
+                FileRange(paths[2], 0, 20, 2)])
+
+            # readers without file ranges read the series from the beginning
+            numbers = from_files(lazy=True, line_index=True,
+                                 s_number=(paths, _numbers_reader))
+            self.assertEqual(list(numbers.skip(25).get_series("number")),
+                             list(range(25, 30)))
+
+    def test_line_index_carriage_return(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "data.txt")
+            with open(path, "wb") as file:
+                file.write(b"a\rb\nc\nd\n")
+
+            ranges = file_ranges([path], 0, 2)
+            self.assertEqual(ranges, [FileRange(path, 0, 6, 2)])
+            self.assertEqual(list(string_reader()(ranges)),
+                             ["a\rb\n", "c\n"])
+            self.assertEqual(
+                list(string_reader()(file_ranges([path], 1))), ["c\n", "d\n"])
+
 
 if __name__ == "__main__":
     unittest.main()
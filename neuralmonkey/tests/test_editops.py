@@ -0,0 +1,60 @@
+#!/usr/bin/env python3.5
+import random
+import unittest
+
+from neuralmonkey.dataset import Dataset
+from neuralmonkey.processors.editops import (
+    convert_to_edits, convert_to_edits_batch, reconstruct, Preprocess,
+    _convert_to_edits_reference, KEEP, DELETE)
+
+
+class TestEditops(unittest.TestCase):
+
+    def test_example(self):
+        source = "Good afternoon , John ! !".split()
+        target = "Good evening , John !".split()
+
+        edits = convert_to_edits(source, target)
+        self.assertEqual(edits, [KEEP, "evening", DELETE, KEEP, KEEP, DELETE,
+                                 KEEP])
+        self.assertEqual(reconstruct(source, edits), target)
+
+    def test_reference_edits(self):
+        rng = random.Random(0)
+        pairs = [([], []), ([], ["a"]), (["a"], [])]
+        for _ in range(500):
+            pairs.append(tuple([rng.choice("abc")
+                                for _ in range(rng.randint(0, 10))]
+                               for _ in range(2)))
+
+        for source, target in pairs:
+            edits = convert_to_edits(source, target)
+            self.assertEqual(edits,
+                             _convert_to_edits_reference(source, target))
+            self.assertEqual(reconstruct(source, edits), target)
+
+    def test_batch(self):
+        sources = [s.split() for s in ["a b c", "a b", "", "c c a b"]] * 50
+        targets = [s.split() for s in ["a c", "b a b", "c", "c a b b"]] * 50
+
+        gold = [convert_to_edits(s, t) for s, t in zip(sources, targets)]
+        self.assertEqual(
+            list(convert_to_edits_batch(iter(sources), iter(targets),
+                                        num_workers=2)), gold)
+
+        # pylint: disable=protected-access
+        dataset = Dataset("data", {"source": sources, "target": targets}, {})
+        preprocess = Preprocess("source", "target", num_workers=2)
+        self.assertEqual(list(preprocess(dataset)), gold)
+        pool = preprocess._pool
+        self.assertEqual(list(preprocess(dataset)), gold)
+        self.assertIs(preprocess._pool, pool)
+
+        preprocess.close()
+        self.assertIsNone(preprocess._pool)
+        self.assertFalse(any(process.is_alive()
+                             for process in pool._pool))
+
+
+if __name__ == "__main__":
+    unittest.main()
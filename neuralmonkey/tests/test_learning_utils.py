@@ -0,0 +1,65 @@
+#!/usr/bin/env python3.5
+import unittest
+
+import numpy as np
+
+from neuralmonkey.dataset import Dataset
+from neuralmonkey.learning_utils import _scatter_outputs, run_on_dataset
+from neuralmonkey.runners.base_runner import ExecutionResult
+
+
+def _result(outputs) -> ExecutionResult:
+    return ExecutionResult(outputs, [], None, None, None)
+
+
+class _CountingRunner(object):
+    """Runner stub with a single output for the whole dataset."""
+    output_series = "count"
+    decoder_data_id = None
+
+
+class _CountingManager(object):
+    """TensorFlow manager stub counting the examples of the datasets."""
+
+    def __init__(self) -> None:
+        self.datasets = []
+
+    def execute(self, dataset, runners, **kwargs):
+        # pylint: disable=unused-argument
+        self.datasets.append(dataset)
+        return [_result([len(dataset)]) for _ in runners]
+
+
+class TestLearningUtils(unittest.TestCase):
+
+    def test_scatter_outputs(self):
+        positions = np.array([2, 0, 1, 0])
+
+        result = _scatter_outputs(_result(["a", "b", "c"]), positions)
+        self.assertEqual(result.outputs, ["c", "a", "b", "a"])
+
+        result = _scatter_outputs(_result(np.arange(3) * 10), positions)
+        self.assertEqual(result.outputs.tolist(), [20, 0, 10, 0])
+
+    def test_scatter_outputs_mismatch(self):
+        positions = np.array([2, 0, 1])
+        with self.assertRaises(ValueError):
+            _scatter_outputs(_result(["a", "b"]), positions)
+        with self.assertRaises(ValueError):
+            _scatter_outputs(_result(["a", "b", "c", "d"]), positions)
+
+    def test_deduplicate_fallback(self):
+        dataset = Dataset("data", {"source": [["a"], ["b"], ["a"]]}, {})
+        manager = _CountingManager()
+
+        _, result_data = run_on_dataset(
+            manager, [_CountingRunner()], dataset, None, deduplicate=True)
+
+        # the duplicates are decoded again, the outputs do not depend on them
+        self.assertEqual([len(d) for d in manager.datasets], [2, 3])
+        self.assertIs(manager.datasets[1], dataset)
+        self.assertEqual(result_data, {"count": [3]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,29 @@
 #!/usr/bin/env python3.5
 """Unit tests for readers"""
 
+import gzip
+import os
+import sys
 import unittest
 import tempfile
-import numpy as np
+import unicodedata
 
+import numpy as np
+from PIL import Image
+from scipy.io import wavfile
+
+from neuralmonkey.readers.audio_reader import audio_reader
+from neuralmonkey.readers.binary_corpus_reader import (
+    binary_corpus_reader, write_binary_corpus)
+from neuralmonkey.readers.image_reader import image_reader, imagenet_reader
+from neuralmonkey.readers.numpy_reader import (
+    packed_reader, packed_shard_files, remove_packed_shards,
+    write_packed_shards)
 from neuralmonkey.readers.string_vector_reader import get_string_vector_reader
-from neuralmonkey.readers.plain_text_reader import T2TReader
+from neuralmonkey.readers.plain_text_reader import (
+    T2TReader, T2T_TOKEN_GROUP, SharedColumnReader, UtfPlainTextReader,
+    csv_reader, read_series, tsv_reader)
+from neuralmonkey.vocabulary import Vocabulary
 
 STRING_INTS = """
 1   2 3
@@ -91,12 +108,283 @@ class TestStringVectorReader(unittest.TestCase):
         for comp in equals:
             self.assertTrue(comp)
 
+    def test_malformed(self):
+        for text in ["1 -\n", "2 +\n3\n", "-5 +\n", "1 2\n3 x\n"]:
+            malformed = _make_file(text)
+            with self.assertRaises(ValueError):
+                list(get_string_vector_reader(np.int32)([malformed.name]))
+            malformed.close()
+
+        signed = _make_file("-1 +2\n")
+        self.assertEqual(
+            [v.tolist() for v in
+             get_string_vector_reader(np.int32)([signed.name])], [[-1, 2]])
+        signed.close()
+
+    def test_gzip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "floats.txt.gz")
+            with gzip.open(path, "wt") as f_data:
+                f_data.write(STRING_FLOATS)
+
+            floats = list(get_string_vector_reader(np.float32)([path]))
+            self.assertEqual(len(floats), len(LIST_FLOATS))
+            for f, g in zip(floats, LIST_FLOATS):
+                self.assertTrue(np.array_equal(f, g))
+
     def tearDown(self):
         self.tmpfile_ints.close()
         self.tmpfile_floats.close()
         self.tmpfile_ints_fine.close()
 
 
+class TestSharedColumnReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpfile = _make_file("a b\tc\td\ne\tf g\th\n")
+        self.columns = [[["a", "b"], ["e"]], [["c"], ["f", "g"]],
+                        [["d"], ["h"]]]
+
+    def test_sequential(self):
+        shared = SharedColumnReader()
+        readers = [shared.column(i) for i in range(1, 4)]
+
+        for _ in range(2):
+            for i, reader in enumerate(readers):
+                self.assertEqual(list(reader([self.tmpfile.name])),
+                                 self.columns[i])
+                self.assertEqual(list(tsv_reader(i + 1)([self.tmpfile.name])),
+                                 self.columns[i])
+
+    def test_parallel(self):
+        shared = SharedColumnReader(max_pending_rows=1)
+        readers = [shared.column(i) for i in range(1, 4)]
+
+        # the last column exceeds the pending rows and reads the file again
+        rows = list(zip(*[reader([self.tmpfile.name])
+                          for reader in readers[:2]]))
+        self.assertEqual(rows, list(zip(*self.columns[:2])))
+        self.assertEqual(list(readers[2]([self.tmpfile.name])),
+                         self.columns[2])
+        # pylint: disable=protected-access
+        self.assertEqual(shared._passes, {})
+
+    def test_single_column(self):
+        tmpfile = _make_file("".join("{}\t{}\n".format(i, -i)
+                                     for i in range(100)))
+        shared = SharedColumnReader(max_pending_rows=10)
+        first, second = shared.column(1), shared.column(2)
+        key = (tmpfile.name,)
+
+        # pylint: disable=protected-access
+        rows = first([tmpfile.name])
+        self.assertEqual([next(rows) for _ in range(5)],
+                         [[str(i)] for i in range(5)])
+        self.assertEqual(len(shared._passes[key].buffers[2]), 5)
+
+        # the rows of the unread column are dropped after the bound
+        self.assertEqual([next(rows) for _ in range(45)],
+                         [[str(i)] for i in range(5, 50)])
+        self.assertEqual(set(shared._passes[key].buffers), {1})
+
+        # an abandoned pass is dropped with its generator
+        del rows
+        self.assertEqual(len(shared._passes), 0)
+
+        rows = first([tmpfile.name])
+        next(rows)
+        del rows
+        self.assertEqual(len(shared._passes), 0)
+
+        self.assertEqual(list(second([tmpfile.name])),
+                         [[str(-i)] for i in range(100)])
+        tmpfile.close()
+
+    def test_unbalanced_quote(self):
+        tmpfile = _make_file('x,"a b\ny,c d\nz,e f\n')
+        columns = [[["x"], ["y"], ["z"]], [["a", "b"], ["c", "d"], ["e", "f"]]]
+
+        self.assertEqual(list(csv_reader(2)([tmpfile.name])), columns[1])
+
+        shared = SharedColumnReader(delimiter=",", quotechar='"')
+        series = read_series({
+            "first": ([tmpfile.name], shared.column(1)),
+            "second": ([tmpfile.name], shared.column(2))})
+        self.assertEqual([series["first"], series["second"]], columns)
+        tmpfile.close()
+
+    def test_read_series(self):
+        shared = SharedColumnReader(max_pending_rows=1)
+        paths = [self.tmpfile.name]
+        series = read_series({
+            "first": (paths, shared.column(1)),
+            "text": (paths, UtfPlainTextReader),
+            "third": (paths, shared.column(3)),
+            "second": (paths, shared.column(2))})
+
+        self.assertEqual(list(series), ["first", "text", "third", "second"])
+        self.assertEqual(
+            [series[name] for name in ["first", "second", "third"]],
+            self.columns)
+        self.assertEqual(series["text"], [["a", "b", "c", "d"],
+                                          ["e", "f", "g", "h"]])
+        # pylint: disable=protected-access
+        self.assertEqual(shared._passes, {})
+
+    def tearDown(self):
+        self.tmpfile.close()
+
+
+class TestImageReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.list_file = os.path.join(self.tmp_dir.name, "images.txt")
+        with open(self.list_file, "w") as f_list:
+            for i, size in enumerate([(30, 20), (8, 12), (16, 16)]):
+                pixels = np.arange(size[0] * size[1] * 3) % 251 + i
+                Image.fromarray(
+                    pixels.reshape(size[1], size[0], 3).astype(np.uint8)
+                ).save(os.path.join(self.tmp_dir.name, "{}.png".format(i)))
+                print("{}.png".format(i), file=f_list)
+
+    def test_workers_and_cache(self):
+        for get_reader, kwargs in [
+                (image_reader, {"pad_w": 16, "pad_h": 16, "rescale_w": True,
+                                "rescale_h": True}),
+                (imagenet_reader, {"target_width": 16, "target_height": 16,
+                                   "vgg_normalization": True})]:
+            gold = list(get_reader(self.tmp_dir.name, **kwargs)(
+                [self.list_file]))
+            self.assertEqual(len(gold), 3)
+
+            cache_dir = os.path.join(self.tmp_dir.name, "cache",
+                                     get_reader.__name__)
+            reader = get_reader(self.tmp_dir.name, num_workers=2,
+                                cache_dir=cache_dir, **kwargs)
+
+            # zipped series are not resumed after their last item, the
+            # cache is complete already
+            images = reader([self.list_file])
+            for _ in range(len(gold)):
+                next(images)
+            self.assertEqual(len([name for name in os.listdir(cache_dir)
+                                  if name.endswith(".npy")]), 1)
+            images.close()
+
+            # the first pass decodes the images, the second reads the cache
+            for _ in range(2):
+                images = list(reader([self.list_file]))
+                self.assertEqual(len(images), len(gold))
+                for image, gold_image in zip(images, gold):
+                    self.assertEqual(image.dtype, gold_image.dtype)
+                    self.assertTrue(np.array_equal(image, gold_image))
+
+    def test_cache_invalidation(self):
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        reader = image_reader(self.tmp_dir.name, pad_w=16, pad_h=16,
+                              rescale_w=True, rescale_h=True,
+                              cache_dir=cache_dir)
+        old_image = list(reader([self.list_file]))[0]
+
+        # the image is edited, the list file stays the same
+        image_path = os.path.join(self.tmp_dir.name, "0.png")
+        Image.fromarray(np.zeros((20, 30, 3), dtype=np.uint8)).save(
+            image_path)
+        stat = os.stat(image_path)
+        os.utime(image_path, (stat.st_atime, stat.st_mtime + 10))
+
+        new_image = list(reader([self.list_file]))[0]
+        self.assertFalse(np.array_equal(new_image, old_image))
+        self.assertEqual(new_image.max(), 0)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class TestPackedShards(unittest.TestCase):
+
+    def test_pack_and_read(self):
+        arrays = [np.random.rand(length, 3).astype(np.float32)
+                  for length in [5, 0, 1000, 17]]
+        arrays.append(np.float32(1.5).reshape(()))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shards = write_packed_shards(os.path.join(tmp_dir, "feats"),
+                                         arrays, shard_size=0)
+            self.assertEqual(len(shards), len(arrays))
+
+            read = list(packed_reader(shards))
+            self.assertEqual(len(read), len(arrays))
+            for array, gold in zip(read, arrays):
+                self.assertEqual(array.dtype, gold.dtype)
+                self.assertTrue(np.array_equal(array, gold))
+
+            with self.assertRaisesRegex(ValueError, "same dtype"):
+                write_packed_shards(os.path.join(tmp_dir, "mixed"),
+                                    [np.zeros(2), np.zeros(2, np.int32)])
+
+    def test_remove(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, "feats")
+            shards = write_packed_shards(prefix, [np.zeros(2)] * 3,
+                                         shard_size=0)
+            self.assertEqual(packed_shard_files(prefix), shards)
+
+            other = prefix + ".old.data.index.npz"
+            open(other, "w").close()
+            remove_packed_shards(prefix)
+            self.assertEqual(os.listdir(tmp_dir), [os.path.basename(other)])
+
+
+class TestAudioReader(unittest.TestCase):
+
+    def test_workers_and_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            list_file = os.path.join(tmp_dir, "audio.txt")
+            gold = []
+            with open(list_file, "w") as f_list:
+                for i, length in enumerate([100, 1, 2000, 30]):
+                    rate = 8000 * (i + 1)
+                    data = np.arange(length, dtype=np.int16)
+                    wavfile.write(os.path.join(tmp_dir, "{}.wav".format(i)),
+                                  rate, data)
+                    print("{}.wav".format(i), file=f_list)
+                    gold.append((rate, data))
+
+            cache_dir = os.path.join(tmp_dir, "cache")
+            reader = audio_reader(tmp_dir, num_workers=3, cache_dir=cache_dir)
+
+            # zipped series are not resumed after their last item, the
+            # cache is complete already
+            audios = reader([list_file])
+            for _ in range(len(gold)):
+                next(audios)
+            self.assertEqual(len([name for name in os.listdir(cache_dir)
+                                  if name.endswith(".rates.npy")]), 1)
+            audios.close()
+
+            # the first pass decodes the files, the second reads the cache
+            for _ in range(2):
+                audios = list(reader([list_file]))
+                self.assertEqual(len(audios), len(gold))
+                for audio, (rate, data) in zip(audios, gold):
+                    self.assertEqual(audio.rate, rate)
+                    self.assertTrue(np.array_equal(audio.data, data))
+
+            # the file is replaced, the list file stays the same
+            audio_path = os.path.join(tmp_dir, "0.wav")
+            wavfile.write(audio_path, 16000, np.ones(50, dtype=np.int16))
+            stat = os.stat(audio_path)
+            os.utime(audio_path, (stat.st_atime, stat.st_mtime + 10))
+
+            audio = list(reader([list_file]))[0]
+            self.assertEqual(audio.rate, 16000)
+            self.assertTrue(np.array_equal(audio.data,
+                                           np.ones(50, dtype=np.int16)))
+
+
 class TestT2TReader(unittest.TestCase):
 
     def setUp(self):
@@ -118,6 +406,47 @@ class TestT2TReader(unittest.TestCase):
         self.assertEqual(len(read), 1)
         self.assertSequenceEqual(read[0], gold_tokens)
 
+    def test_edge_cases(self):
+        tmpfile = _make_file(" a\n\n \nb  \n_x_ 1\n")
+        read = list(self.reader([tmpfile.name]))
+        tmpfile.close()
+
+        self.assertEqual(read, [[" ", "a"], [""], [" "], ["b", "  "],
+                                ["_", "x", "_ ", "1"]])
+
+    def test_alphanumeric_characters(self):
+        alphanumeric = set(
+            i for i in range(sys.maxunicode + 1)
+            if unicodedata.category(chr(i))[0] in "LN")
+        # alphanumeric characters are in the same group as a letter
+        matched = set(
+            i for i in range(sys.maxunicode + 1)
+            if len(T2T_TOKEN_GROUP.findall("a" + chr(i))) == 1)
+        self.assertEqual(alphanumeric, matched)
+
+
+class TestBinaryCorpusReader(unittest.TestCase):
+
+    def test_reader(self):
+        sentences = [["a", "b", "c"], [], ["c", "x", "a"], ["b"]]
+        vocabulary = Vocabulary(["a", "b", "c"])
+
+        with tempfile.NamedTemporaryFile() as tmpfile:
+            write_binary_corpus(tmpfile.name, sentences, vocabulary)
+
+            read = list(binary_corpus_reader(vocabulary)([tmpfile.name]))
+            self.assertEqual(len(read), len(sentences))
+            self.assertEqual(
+                [[vocabulary.index_to_word[i] for i in s] for s in read],
+                [["a", "b", "c"], [], ["c", "<unk>", "a"], ["b"]])
+
+            decoded = binary_corpus_reader(vocabulary, decode=True)
+            self.assertEqual(list(decoded([tmpfile.name]))[0],
+                             ["a", "b", "c"])
+
+            with self.assertRaisesRegex(ValueError, "different vocabulary"):
+                list(binary_corpus_reader(Vocabulary(["a"]))([tmpfile.name]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3.5
+"""Test prefetching of feed dicts in the TensorFlow manager."""
+
+import random
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from neuralmonkey.dataset import Dataset
+from neuralmonkey.runners.base_runner import ExecutionResult
+from neuralmonkey.tf_manager import TensorFlowManager
+
+
+class _NoisyCoder(object):
+    """Coder stub feeding the example ids with random noise in training."""
+
+    def __init__(self) -> None:
+        self.placeholder = tf.placeholder(tf.float32, [None], "ids")
+
+    def feed_dict(self, dataset, train=False):
+        values = [float(i) + (random.random() if train else 0.)
+                  for i in dataset.get_series("id")]
+        return {self.placeholder: np.array(values, dtype=np.float32)}
+
+
+class _Executable(object):
+
+    def __init__(self, coder, tensor) -> None:
+        self.coder = coder
+        self.tensor = tensor
+        self.result = None
+
+    def next_to_execute(self):
+        return {self.coder}, {"fed": self.tensor}, []
+
+    def collect_results(self, results):
+        self.result = ExecutionResult(list(results[0]["fed"]), [],
+                                      None, None, None)
+
+
+class _Script(object):
+    """Runner stub returning the fed values."""
+
+    def __init__(self, coder) -> None:
+        self.coder = coder
+        self.all_coders = {coder}
+        self.tensor = tf.identity(coder.placeholder)
+
+    def get_executable(self, compute_losses, summaries, num_sessions):
+        # pylint: disable=unused-argument
+        return _Executable(self.coder, self.tensor)
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        tf.reset_default_graph()
+        # the saver of the manager needs a variable
+        tf.get_variable("dummy", shape=[1])
+        self.script = _Script(_NoisyCoder())
+        self.dataset = Dataset("data", {"id": list(range(10))}, {})
+
+    def _managers(self):
+        plain = TensorFlowManager(num_sessions=1, num_threads=1)
+        prefetching = TensorFlowManager(num_sessions=1, num_threads=1,
+                                        prefetch_depth=2, prefetch_threads=3)
+        return plain, prefetching
+
+    def test_prefetched_batches(self):
+        plain, prefetching = self._managers()
+
+        for train in [False, True]:
+            random.seed(0)
+            gold = [plain.execute(batch, [self.script], train=train)[0]
+                    for batch in self.dataset.batch_dataset(3)]
+
+            random.seed(0)
+            ids = []
+            results = []
+            for batch in prefetching.prefetch(
+                    self.dataset.batch_dataset(3), self.script.all_coders,
+                    train=train):
+                # pylint: disable=protected-access
+                self.assertIn(batch, prefetching._prefetched)
+                ids.extend(batch.get_series("id"))
+                results.append(
+                    prefetching.execute(batch, [self.script], train=train)[0])
+
+            self.assertEqual(ids, list(range(10)))
+            self.assertEqual(len(results), len(gold))
+            for result, gold_result in zip(results, gold):
+                self.assertTrue(np.array_equal(result.outputs,
+                                               gold_result.outputs))
+
+        plain.close()
+        prefetching.close()
+
+    def test_execute(self):
+        plain, prefetching = self._managers()
+
+        for train in [False, True]:
+            random.seed(0)
+            gold = plain.execute(self.dataset, [self.script], train=train,
+                                 batch_size=3)[0]
+            random.seed(0)
+            result = prefetching.execute(self.dataset, [self.script],
+                                         train=train, batch_size=3)[0]
+            self.assertTrue(np.array_equal(result.outputs, gold.outputs))
+
+        plain.close()
+        prefetching.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
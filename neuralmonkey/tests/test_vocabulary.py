@@ -1,7 +1,11 @@
 #!/usr/bin/env python3.5
 
+import random
 import unittest
 
+import numpy as np
+
+from neuralmonkey.dataset import Dataset
 from neuralmonkey.vocabulary import Vocabulary
 
 CORPUS = [
@@ -46,6 +50,120 @@ class TestVocabulary(unittest.TestCase):
                 zip(TOKENIZED_CORPUS, senteces_again):
             self.assertSequenceEqual(orig_sentence, reconstructed_sentence)
 
+    def test_indexed_sentences(self):
+        indexed = [np.array([VOCABULARY.get_word_index(w) for w in s],
+                            dtype=np.int32) for s in TOKENIZED_CORPUS]
+
+        vectors, weights = VOCABULARY.sentences_to_tensor(
+            TOKENIZED_CORPUS, 20, add_start_symbol=True, add_end_symbol=True)
+        vectors_idx, weights_idx = VOCABULARY.sentences_to_tensor(
+            indexed, 20, add_start_symbol=True, add_end_symbol=True)
+
+        self.assertTrue(np.array_equal(vectors, vectors_idx))
+        self.assertTrue(np.array_equal(weights, weights_idx))
+
+    def test_indexed_series(self):
+        sentences = TOKENIZED_CORPUS + [["jindrisek", "slept"]]
+        dataset = Dataset("data", {"text": sentences}, {})
+        dataset.shuffle()
+
+        indexed = dataset.get_indexed_series("text", VOCABULARY)
+        self.assertEqual(
+            [indices.tolist() for indices in indexed],
+            [[VOCABULARY.get_word_index(w) for w in sentence]
+             for sentence in dataset.get_series("text")])
+        self.assertIsNone(
+            dataset.get_indexed_series("target", VOCABULARY, allow_none=True))
+
+        for batch in dataset.batch_dataset(2):
+            batch_sentences = list(batch.get_series("text"))
+            batch_indexed = batch.get_indexed_series("text", VOCABULARY)
+            for sentence, indices in zip(batch_sentences, batch_indexed):
+                self.assertEqual(
+                    indices.tolist(),
+                    [VOCABULARY.get_word_index(w) for w in sentence])
+
+            vectors, weights = VOCABULARY.sentences_to_tensor(
+                batch_sentences, add_end_symbol=True)
+            vectors_idx, weights_idx = VOCABULARY.sentences_to_tensor(
+                batch_indexed, add_end_symbol=True)
+            self.assertTrue(np.array_equal(vectors, vectors_idx))
+            self.assertTrue(np.array_equal(weights, weights_idx))
+
+        # the indices are computed only once for all views, also when the
+        # series is indexed with another vocabulary in between
+        other_vocabulary = Vocabulary()
+        other_vocabulary.add_word("slept")
+        other_indexed = dataset.get_indexed_series("text", other_vocabulary)
+        self.assertIs(dataset.get_indexed_series("text", VOCABULARY)[0],
+                      indexed[0])
+        self.assertIs(dataset.get_indexed_series("text", other_vocabulary)[0],
+                      other_indexed[0])
+
+    def test_reference_tensor(self):
+        vocabulary = Vocabulary(unk_sample_prob=0.5)
+        vocabulary.correct_counts = True
+        for sentence in TOKENIZED_CORPUS:
+            vocabulary.add_tokenized_text(sentence)
+
+        sentences = TOKENIZED_CORPUS + [["jindrisek", "slept"], []]
+        sentences.append(np.array([vocabulary.get_word_index(w)
+                                   for w in TOKENIZED_CORPUS[2]]))
+
+        for max_len in [None, 3, 20]:
+            for train_mode in [False, True]:
+                for pad in [False, True]:
+                    for start in [False, True]:
+                        for end in [False, True]:
+                            kwargs = dict(max_len=max_len,
+                                          pad_to_max_len=pad,
+                                          train_mode=train_mode,
+                                          add_start_symbol=start,
+                                          add_end_symbol=end)
+                            random.seed(42)
+                            vectors, weights = vocabulary.sentences_to_tensor(
+                                sentences, **kwargs)
+                            random.seed(42)
+                            ref_vectors, ref_weights = (
+                                vocabulary._sentences_to_tensor_reference(
+                                    sentences, **kwargs))
+
+                            self.assertEqual(vectors.dtype, ref_vectors.dtype)
+                            self.assertTrue(
+                                np.array_equal(vectors, ref_vectors))
+                            self.assertEqual(weights.dtype, ref_weights.dtype)
+                            self.assertTrue(
+                                np.array_equal(weights, ref_weights))
+
+    def test_unk_sampling_counts(self):
+        vocabulary = Vocabulary(unk_sample_prob=1.0)
+        for sentence in TOKENIZED_CORPUS:
+            vocabulary.add_tokenized_text(sentence)
+
+        with self.assertRaises(ValueError):
+            vocabulary.sentences_to_tensor(TOKENIZED_CORPUS, train_mode=True)
+
+        vocabulary.correct_counts = True
+        vectors, _ = vocabulary.sentences_to_tensor([["walrus", "pooh"]],
+                                                    train_mode=True)
+        self.assertEqual(vocabulary.vectors_to_sentences(vectors),
+                         [["walrus", "<unk>"]])
+
+    def test_reference_sentences(self):
+        end = VOCABULARY.get_word_index("</s>")
+        rng = np.random.RandomState(0)
+        for shape in [(1, 1), (5, 3), (20, 8), (0, 4), (3, 0)]:
+            vectors = rng.randint(len(VOCABULARY), size=shape)
+            vectors[rng.rand(*shape) < 0.2] = end
+            self.assertEqual(
+                VOCABULARY.vectors_to_sentences(vectors),
+                VOCABULARY._vectors_to_sentences_reference(vectors))
+            if shape[0]:
+                self.assertEqual(
+                    VOCABULARY.vectors_to_sentences(list(vectors)),
+                    VOCABULARY._vectors_to_sentences_reference(
+                        list(vectors)))
+
     def test_min_freq(self):
 
         vocabulary = Vocabulary()
@@ -3,7 +3,7 @@ import unittest
 
 from neuralmonkey.vocabulary import Vocabulary
 from neuralmonkey.processors.wordpiece import (
-    WordpiecePreprocessor, WordpiecePostprocessor)
+    WordpiecePreprocessor, WordpiecePostprocessor, wordpiece_encode)
 
 CORPUS = [
     "the colorless ideas slept furiously",
@@ -82,6 +82,31 @@ class TestWordpieces(unittest.TestCase):
         postprocessed = TestWordpieces.postprocessor([output])
         self.assertSequenceEqual(postprocessed, gold)
 
+    def test_reference_encode(self):
+        vocabulary = TestWordpieces.preprocessor.vocabulary
+        sentences = ["Ich bin der čermák".split(), "walrus_ \\u x".split()]
+        sentences.extend(s.split() for s in CORPUS)
+
+        for sentence in sentences:
+            self.assertSequenceEqual(
+                TestWordpieces.preprocessor(sentence),
+                wordpiece_encode(sentence, vocabulary))
+
+        self.assertEqual(TestWordpieces.preprocessor.encode_batch(sentences),
+                         [wordpiece_encode(s, vocabulary) for s in sentences])
+
+    def test_vocabulary_change(self):
+        vocabulary = Vocabulary()
+        for c in CORPUS_CHARS:
+            vocabulary.add_word(c)
+        preprocessor = WordpiecePreprocessor(vocabulary)
+
+        self.assertSequenceEqual(preprocessor(["walrus"]),
+                                 "w a l r u s_".split())
+        vocabulary.add_word("wal")
+        self.assertSequenceEqual(preprocessor(["walrus"]),
+                                 "wal r u s_".split())
+
     # TODO (#669): implement wordpiece generator
     @unittest.skip("not implemented yet")
     def test_make_wordpieces(self):
@@ -6,11 +6,15 @@ variables.
 
 """
 # pylint: disable=unused-import
-from typing import Any, List, Union, Optional, Set
+from typing import Any, Dict, Iterable, List, Union, Optional, Set, Tuple
 # pylint: enable=unused-import
 
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
+import queue
+import threading
 import time
+import weakref
 
 import numpy as np
 import tensorflow as tf
@@ -20,7 +24,8 @@ from tensorflow.python import debug as tf_debug
 from typeguard import check_argument_types
 
 from neuralmonkey.logging import log
-from neuralmonkey.dataset import Dataset
+from neuralmonkey.dataset import Dataset, BatchingScheme
+from neuralmonkey.model.model_part import ModelPart
 # pylint: disable=unused-import
 from neuralmonkey.runners.base_runner import FeedDict
 # pylint: enable=unused-import
@@ -44,7 +49,9 @@ class TensorFlowManager(object):
                  variable_files: Optional[List[str]] = None,
                  gpu_allow_growth: bool = True,
                  per_process_gpu_memory_fraction: float = 1.0,
-                 enable_tf_debug: bool = False) -> None:
+                 enable_tf_debug: bool = False,
+                 prefetch_depth: int = 0,
+                 prefetch_threads: int = 1) -> None:
         """Initialize a TensorflowManager.
 
         At this moment the graph must already exist. This method initializes
@@ -60,9 +67,32 @@ class TensorFlowManager(object):
             variable_files: List of variable files.
             gpu_allow_growth: TF to allocate incrementally, not all at once.
             per_process_gpu_memory_fraction: Limit TF memory use.
+            prefetch_depth: How many batches with ready feed dicts can wait
+                in the queue while the sessions run. Zero disables the
+                prefetching.
+            prefetch_threads: Number of threads preparing the feed dicts
+                for inference. In the training mode, the feed dicts are
+                prepared by a single thread (see ``prefetch``).
         """
         check_argument_types()
 
+        if prefetch_depth < 0:
+            raise ValueError("prefetch_depth must not be negative")
+        if prefetch_threads < 1:
+            raise ValueError("prefetch_threads must be greater than zero")
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_threads = prefetch_threads
+
+        # total time the sessions waited for the prefetched data
+        self.data_wait_time = 0.0
+        # feed dicts of prefetched batches, the values are pairs of the train
+        # flag and dictionaries from the feedables to their feed dicts
+        self._prefetched = weakref.WeakKeyDictionary() \
+            # type: weakref.WeakKeyDictionary
+        # the worker threads preparing the feed dicts, shared by all
+        # prefetching generators and started with the first one
+        self._prefetch_executor = None  # type: Optional[ThreadPoolExecutor]
+
         session_cfg = tf.ConfigProto()
         session_cfg.inter_op_parallelism_threads = num_threads
         session_cfg.intra_op_parallelism_threads = num_threads
@@ -163,6 +193,100 @@ class TensorFlowManager(object):
             log("Best scores saved so far: {}".format(
                 self.saved_scores))
 
+    def prefetch(self,
+                 batches: Iterable[Dataset],
+                 coders: Set[ModelPart],
+                 train: bool = False) -> Iterable[Dataset]:
+        """Prepare the feed dicts of the upcoming batches in the background.
+
+        A producer thread reads the batches and lets the pool of worker
+        threads of the manager compute the feed dicts of the given coders,
+        while the current batch is executed. At most ``prefetch_depth``
+        batches are prepared in advance. The feed dicts are used by
+        ``execute`` when it is called on the yielded batch with the same
+        ``train`` flag. The time spent waiting for the data is added to
+        ``data_wait_time``.
+
+        In the training mode, the feed dicts may draw random numbers (e.g.
+        for sampling of unknown words), so they are computed by the producer
+        thread in the order of the batches. The numbers are then drawn in
+        the same order as without prefetching and the runs with a fixed seed
+        stay reproducible.
+
+        Arguments:
+            batches: The batches to prefetch.
+            coders: The model parts whose feed dicts are computed.
+            train: Whether the feed dicts are computed in the training mode.
+
+        Returns:
+            Generator yielding the batches in the original order.
+        """
+        if self.prefetch_depth == 0:
+            yield from batches
+            return
+
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(
+                max_workers=self.prefetch_threads)
+        executor = self._prefetch_executor
+
+        ready = queue.Queue(maxsize=self.prefetch_depth)  # type: queue.Queue
+        stop = threading.Event()
+
+        def put(item: Optional[Tuple[Optional[Dataset], Any]]) -> bool:
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce() -> None:
+            try:
+                for batch in batches:
+                    if train:
+                        future = Future()  # type: Future
+                        future.set_result(
+                            _coder_feed_dicts(batch, coders, train))
+                    else:
+                        future = executor.submit(
+                            _coder_feed_dicts, batch, coders, train)
+                    if not put((batch, future)):
+                        return
+            except Exception as exc:  # pylint: disable=broad-except
+                put((None, exc))
+                return
+            put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                wait_start = time.time()
+                item = ready.get()
+                if item is None:
+                    break
+
+                batch, result = item
+                if batch is None:
+                    raise result
+                coder_feed_dicts = result.result()
+                self.data_wait_time += time.time() - wait_start
+
+                self._prefetched[batch] = (train, coder_feed_dicts)
+                yield batch
+        finally:
+            stop.set()
+            # the producer stops after reading at most one more batch, then
+            # the feed dicts which were not started yet are not computed
+            producer.join()
+            while not ready.empty():
+                item = ready.get_nowait()
+                if item is not None and item[0] is not None:
+                    item[1].cancel()
+
     # pylint: disable=too-many-locals
     def _run_executables(self,
                          batch,
@@ -192,7 +316,13 @@ class TensorFlowManager(object):
             else:
                 tensor_list_lengths.append(0)
 
-        feed_dict = _feed_dicts(batch, all_feedables, train=train)
+        prefetched_train, coder_feed_dicts = self._prefetched.get(
+            batch, (train, None))
+        if prefetched_train != train:
+            coder_feed_dicts = None
+
+        feed_dict = _feed_dicts(batch, all_feedables, train=train,
+                                cache=coder_feed_dicts)
 
         for fdict in feed_dicts:
             fdict.update(feed_dict)
@@ -213,20 +343,33 @@ class TensorFlowManager(object):
                 train=False,
                 compute_losses=True,
                 summaries=True,
-                batch_size=None,
+                batch_size: Union[int, BatchingScheme] = None,
                 log_progress: int = 0) -> List[ExecutionResult]:
-        if batch_size is None:
-            batch_size = len(dataset)
-        batched_dataset = dataset.batch_dataset(batch_size)
+        if batch_size is None and dataset in self._prefetched:
+            # the dataset is a batch with prefetched feed dicts
+            batched_dataset = [dataset]  # type: Iterable[Dataset]
+        else:
+            if batch_size is None:
+                batch_size = len(dataset)
+            # The results are concatenated in the order of the batches, so
+            # the batches must not be reordered by bucketing.
+            batched_dataset = self.prefetch(
+                dataset.batch_dataset(batch_size, keep_order=True),
+                set.union(*[s.all_coders for s in execution_scripts]),
+                train=train)
+
+        wait_time_start = self.data_wait_time
         last_log_time = time.process_time()
 
+        processed_examples = 0
         batch_results = [
             [] for _ in execution_scripts]  # type: List[List[ExecutionResult]]
-        for batch_id, batch in enumerate(batched_dataset):
+        for batch in batched_dataset:
             if (time.process_time() - last_log_time > log_progress
                     and log_progress > 0):
-                log("Processed {} examples.".format(batch_id * batch_size))
+                log("Processed {} examples.".format(processed_examples))
                 last_log_time = time.process_time()
+            processed_examples += len(batch)
             executables = [s.get_executable(compute_losses=compute_losses,
                                             summaries=summaries,
                                             num_sessions=len(self.sessions))
@@ -238,12 +381,24 @@ class TensorFlowManager(object):
             for script_list, executable in zip(batch_results, executables):
                 script_list.append(executable.result)
 
+        if log_progress > 0 and self.prefetch_depth > 0:
+            log("Waited {:.2f}s for the prefetched data.".format(
+                self.data_wait_time - wait_time_start))
+
         collected_results = []  # type: List[ExecutionResult]
         for result_list in batch_results:
             collected_results.append(reduce_execution_results(result_list))
 
         return collected_results
 
+    def close(self) -> None:
+        """Stop the prefetching threads and close the sessions."""
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
+        for session in self.sessions:
+            session.close()
+
     def save(self, variable_files: Union[str, List[str]]) -> None:
         if isinstance(variable_files, str) and len(self.sessions) == 1:
             self.saver.save(self.sessions[0], variable_files)
@@ -289,19 +444,30 @@ class TensorFlowManager(object):
             self.save(self.variables_files[0])
 
 
-def _feed_dicts(dataset, coders, train=False):
+def _feed_dicts(dataset, coders, train=False, cache=None):
     """Feed the coders with data from dataset.
 
     This function ensures all encoder and decoder objects feed their the data
-    they need from the dataset.
+    they need from the dataset. Feed dicts of the coders which are present in
+    the optional cache are not computed again.
     """
     res = {}
 
     for coder in coders:
-        res.update(coder.feed_dict(dataset, train=train))
+        if cache is not None and coder in cache:
+            res.update(cache[coder])
+        else:
+            res.update(coder.feed_dict(dataset, train=train))
 
     return res
 
 
+def _coder_feed_dicts(dataset: Dataset,
+                      coders: Set[ModelPart],
+                      train: bool) -> Dict[ModelPart, FeedDict]:
+    """Compute the feed dicts of the coders separately for each coder."""
+    return {coder: coder.feed_dict(dataset, train=train) for coder in coders}
+
+
 def get_default_tf_manager():
     return TensorFlowManager(num_sessions=1, num_threads=4)
@@ -6,12 +6,13 @@ can be used to obtain a Vocabulary instance.
 # pylint: disable=too-many-lines
 
 import collections
+from itertools import chain, repeat
 import json
 import os
 import random
 
 # pylint: disable=unused-import
-from typing import List, Optional, Tuple, Dict, Union
+from typing import Iterable, List, Optional, Sequence, Tuple, Dict, Union
 # pylint: enable=unused-import
 
 import numpy as np
@@ -19,6 +20,8 @@ from typeguard import check_argument_types
 
 from neuralmonkey.logging import log, warn
 from neuralmonkey.dataset import Dataset, LazyDataset
+from neuralmonkey.processors.bpe_learner import (count_words, learn_merges,
+                                                 write_merges)
 
 PAD_TOKEN = "<pad>"
 START_TOKEN = "<s>"
@@ -255,28 +258,104 @@ def from_bpe(path: str, encoding: str = "utf-8") -> "Vocabulary":
     if not os.path.exists(path):
         raise Exception("BPE file does not exist: {}".format(path))
 
-    vocab = Vocabulary()
-
     with open(path, encoding=encoding) as f_bpe:
-        for line in f_bpe:
-            pair = line.split()
-            assert len(pair) == 2
+        vocab = _from_bpe_merges(line.split() for line in f_bpe)
 
-            if pair[1].endswith("</w>"):
-                pair[1] = pair[1][:-4]
-            else:
-                pair[1] += "@@"
+    log("Vocabulary from BPE merges loaded. Size: {} subwords"
+        .format(len(vocab)))
+    vocab.log_sample()
+    return vocab
 
-            vocab.add_word(pair[0] + "@@")
-            vocab.add_word(pair[1])
-            vocab.add_word("".join(pair))
 
-    log("Vocabulary from BPE merges loaded. Size: {} subwords"
+def from_learned_bpe(merge_file: str, num_merges: int,
+                     files: List[str] = None,
+                     datasets: List[Dataset] = None,
+                     series_ids: List[str] = None,
+                     min_frequency: int = 2,
+                     num_workers: int = None,
+                     overwrite: bool = False,
+                     encoding: str = "utf-8") -> "Vocabulary":
+    """Learn BPE merges from data and create the vocabulary of the subwords.
+
+    The words are counted in the text files and in the series of the
+    datasets, the merges are learned and saved to ``merge_file`` and the
+    vocabulary is created from them as in ``from_bpe``. If the merge file
+    already exists, it is only loaded.
+
+    Arguments:
+        merge_file: The file to save the merges to. It can be used by
+            ``BPEPreprocessor``.
+        num_merges: The maximum number of merges to learn.
+        files: Tokenized text files to learn the merges from.
+        datasets: Datasets to learn the merges from.
+        series_ids: The series of the datasets with tokenized sentences.
+        min_frequency: Stop learning when the most frequent pair of symbols
+            occurs fewer times.
+        num_workers: Number of processes counting the words in the files.
+        overwrite: Learn the merges again even if the merge file exists.
+        encoding: The encoding of the text files and the merge file.
+
+    Returns:
+        The vocabulary of the subwords.
+    """
+    check_argument_types()
+
+    if os.path.exists(merge_file) and not overwrite:
+        log("BPE merges already exist in '{}'".format(merge_file))
+        return from_bpe(merge_file, encoding)
+
+    if not files and not (datasets and series_ids):
+        raise ValueError("BPE merges can be learned either from files or "
+                         "from series of datasets.")
+
+    word_counts = collections.Counter()  # type: collections.Counter
+    if files:
+        word_counts.update(count_words(files, num_workers, encoding))
+    for dataset in datasets or []:
+        for series_id in series_ids or []:
+            series = dataset.get_series(series_id, allow_none=True)
+            if series is None:
+                warn("Data series '{}' not present in the dataset"
+                     .format(series_id))
+                continue
+            for sentence in series:
+                word_counts.update(sentence)
+
+    merges = learn_merges(word_counts, num_merges, min_frequency)
+
+    directory = os.path.dirname(merge_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    write_merges(merge_file, merges, encoding)
+    log("BPE merges saved to '{}'".format(merge_file))
+
+    vocab = _from_bpe_merges(merges)
+    log("Vocabulary from learned BPE merges created. Size: {} subwords"
         .format(len(vocab)))
     vocab.log_sample()
     return vocab
 
 
+def _from_bpe_merges(merges: Iterable[Sequence[str]]) -> "Vocabulary":
+    """Create a vocabulary of the subwords created by the BPE merges."""
+    vocab = Vocabulary()
+
+    for merge in merges:
+        pair = list(merge)
+        assert len(pair) == 2
+
+        if pair[1].endswith("</w>"):
+            pair[1] = pair[1][:-4]
+        else:
+            pair[1] += "@@"
+
+        vocab.add_word(pair[0] + "@@")
+        vocab.add_word(pair[1])
+        vocab.add_word("".join(pair))
+
+    return vocab
+
+
 def initialize_vocabulary(directory: str, name: str,
                           datasets: List[Dataset] = None,
                           series_ids: List[str] = None,
@@ -339,6 +418,11 @@ class Vocabulary(collections.Sized):
 
         self.unk_sample_prob = unk_sample_prob
 
+        # word counts indexed by word indices, used for unk sampling
+        self._frequencies = None  # type: Optional[np.ndarray]
+        # index_to_word as an array for vectorized lookups
+        self._word_array = None  # type: Optional[np.ndarray]
+
         self.add_word(PAD_TOKEN)
         self.add_word(START_TOKEN)
         self.add_word(END_TOKEN)
@@ -380,6 +464,8 @@ class Vocabulary(collections.Sized):
             if word not in _SPECIAL_TOKENS:
                 self.add_characters(word)
         self.word_count[word] += occurences
+        self._frequencies = None
+        self._word_array = None
 
     def add_characters(self, word: str) -> None:
         self.alphabet |= {c for c in word}
@@ -476,6 +562,8 @@ class Vocabulary(collections.Sized):
         self.word_to_index = {}
         for index, word in enumerate(self.index_to_word):
             self.word_to_index[word] = index
+        self._frequencies = None
+        self._word_array = None
 
     def truncate_by_min_freq(self, min_freq: int) -> None:
         """Truncate the vocabulary only keeping words with a minimum frequency.
@@ -494,6 +582,36 @@ class Vocabulary(collections.Sized):
             new_size = len(self) - infreq_word_count
             self.truncate(new_size)
 
+    def sentences_to_indices(
+            self, sentences: List[List[str]]) -> List[np.ndarray]:
+        """Convert tokenized sentences to arrays of vocabulary indices.
+
+        The indices of all sentences are stored in a single array and the
+        sentences are its slices. Words missing in the vocabulary are
+        converted to the index of the unknown token.
+
+        Arguments:
+            sentences: List of sentences as lists of tokens. Sentences which
+                are already arrays of indices are kept.
+
+        Returns:
+            List of int32 arrays of indices.
+        """
+        lengths = [len(sent) for sent in sentences]
+        ends = np.cumsum(lengths, dtype=np.int64).tolist()
+
+        lookup = self.word_to_index.get
+        unk_index = self.get_word_index(UNK_TOKEN)
+        flat_indices = np.fromiter(
+            chain.from_iterable(
+                sent.tolist() if isinstance(sent, np.ndarray)
+                else map(lookup, sent, repeat(unk_index))
+                for sent in sentences),
+            dtype=np.int32, count=ends[-1] if ends else 0)
+
+        return [flat_indices[end - length:end]
+                for length, end in zip(lengths, ends)]
+
     def sentences_to_tensor(
             self,
             sentences: List[List[str]],
@@ -505,7 +623,8 @@ class Vocabulary(collections.Sized):
         """Generate the tensor representation for the provided sentences.
 
         Arguments:
-            sentences: List of sentences as lists of tokens.
+            sentences: List of sentences as lists of tokens. A sentence can
+                also be an array of token indices, e.g. from a binary corpus.
             max_len: If specified, all sentences will be truncated to this
                 length.
             pad_to_max_len: If True, the tensor will be padded to `max_len`,
@@ -536,14 +655,122 @@ class Vocabulary(collections.Sized):
             The shape of the padding vector is the same as of the sentence
             vector.
         """
-        if pad_to_max_len and max_len is not None:
-            batch_max_len = max_len
+        batch_max_len = self._batch_max_len(sentences, max_len,
+                                            pad_to_max_len, add_end_symbol)
+        unk_index = self.get_word_index(UNK_TOKEN)
+
+        # token indices of all sentences truncated to batch_max_len, words
+        # missing in the vocabulary get -1
+        lengths = np.array([min(len(sent), batch_max_len)
+                            for sent in sentences], dtype=np.int64)
+        if all(isinstance(sent, np.ndarray) for sent in sentences):
+            # sentences from binary corpora or from get_indexed_series of
+            # a dataset are already indexed
+            flat_indices = np.concatenate(
+                [sent[:batch_max_len] for sent in sentences]).astype(np.int64)
+            # unknown words were converted to the unknown token
+            known = flat_indices != unk_index
         else:
-            batch_max_len = max(len(s) for s in sentences)
-            if add_end_symbol:
-                batch_max_len += 1
-            if max_len is not None:
-                batch_max_len = min(max_len, batch_max_len)
+            lookup = self.word_to_index.get
+            flat_indices = np.fromiter(
+                chain.from_iterable(
+                    sent[:batch_max_len].tolist()
+                    if isinstance(sent, np.ndarray)
+                    else map(lookup, sent[:batch_max_len], repeat(-1))
+                    for sent in sentences),
+                dtype=np.int64, count=int(lengths.sum()))
+            known = flat_indices >= 0
+            flat_indices[~known] = unk_index
+
+        columns = np.repeat(np.arange(len(sentences)), lengths)
+        rows = (np.arange(len(flat_indices))
+                - np.repeat(np.cumsum(lengths) - lengths, lengths))
+
+        if train_mode:
+            self._sample_unks(flat_indices, known, rows, columns)
+
+        start = 1 if add_start_symbol else 0
+        word_indices = np.full(
+            [batch_max_len + start, len(sentences)],
+            self.get_word_index(PAD_TOKEN), dtype=np.int32)
+        weights = np.zeros([batch_max_len + start, len(sentences)])
+
+        word_indices[rows + start, columns] = flat_indices
+        weights[rows + start, columns] = 1
+
+        if add_end_symbol:
+            ended = np.flatnonzero(np.array(
+                [len(sent) for sent in sentences]) < batch_max_len)
+            word_indices[lengths[ended] + start, ended] = self.get_word_index(
+                END_TOKEN)
+            weights[lengths[ended] + start, ended] = 1
+
+        if add_start_symbol:
+            word_indices[0] = self.get_word_index(START_TOKEN)
+            weights[0] = 1
+
+        return word_indices, weights
+
+    def _sample_unks(self, indices: np.ndarray, known: np.ndarray,
+                     rows: np.ndarray, columns: np.ndarray) -> None:
+        """Replace words seen at most once by the unknown token in place.
+
+        The random numbers are drawn in the same order as by
+        ``get_unk_sampled_word_index`` called for every token of the batch
+        tensor, i.e. by positions and then by sentences, so the result for a
+        given state of the random generator does not change.
+
+        Arguments:
+            indices: The flat array of token indices in the sentences.
+            known: Mask of the tokens present in the vocabulary.
+            rows: Positions of the tokens in their sentences.
+            columns: Indices of the sentences of the tokens.
+        """
+        if self._frequencies is None:
+            self._frequencies = np.array(
+                [self.word_count[word] for word in self.index_to_word],
+                dtype=np.int64)
+
+        frequencies = np.where(known, self._frequencies[indices], 0)
+        candidates = np.flatnonzero(frequencies <= 1)
+        candidates = candidates[np.lexsort((columns[candidates],
+                                            rows[candidates]))]
+
+        draws = np.array([random.random() for _ in candidates])
+        sampled = candidates[draws < self.unk_sample_prob]
+        if sampled.size and not self.correct_counts:
+            raise ValueError("The vocabulary does not have correct "
+                             "word_counts to use with unknown sampling")
+        indices[sampled] = self.get_word_index(UNK_TOKEN)
+
+    @staticmethod
+    def _batch_max_len(sentences: List[List[str]], max_len: Optional[int],
+                       pad_to_max_len: bool, add_end_symbol: bool) -> int:
+        if pad_to_max_len and max_len is not None:
+            return max_len
+
+        batch_max_len = max(len(s) for s in sentences)
+        if add_end_symbol:
+            batch_max_len += 1
+        if max_len is not None:
+            batch_max_len = min(max_len, batch_max_len)
+        return batch_max_len
+
+    def _sentences_to_tensor_reference(
+            self,
+            sentences: List[List[str]],
+            max_len: int = None,
+            pad_to_max_len: bool = True,
+            train_mode: bool = False,
+            add_start_symbol: bool = False,
+            add_end_symbol: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate the sentence tensor token by token.
+
+        This is the original implementation of ``sentences_to_tensor`` which
+        is kept as a reference for tests.
+        """
+        batch_max_len = self._batch_max_len(sentences, max_len,
+                                            pad_to_max_len, add_end_symbol)
 
         word_indices = np.full(
             [batch_max_len, len(sentences)], self.get_word_index(PAD_TOKEN),
@@ -553,8 +780,15 @@ class Vocabulary(collections.Sized):
         for i in range(batch_max_len):
             for j, sent in enumerate(sentences):
                 if i < len(sent):
-                    w_idx = (self.get_unk_sampled_word_index(sent[i])
-                             if train_mode else self.get_word_index(sent[i]))
+                    # sentences from binary corpora are already indexed
+                    word = (self.index_to_word[sent[i]]
+                            if isinstance(sent, np.ndarray) else sent[i])
+                    if train_mode:
+                        w_idx = self.get_unk_sampled_word_index(word)
+                    elif isinstance(sent, np.ndarray):
+                        w_idx = sent[i]
+                    else:
+                        w_idx = self.get_word_index(word)
                     word_indices[i, j] = w_idx
                     weights[i, j] = 1
 
@@ -592,6 +826,36 @@ class Vocabulary(collections.Sized):
             raise TypeError(
                 "Unexpected type of decoder output: {}".format(type(vectors)))
 
+        if not len(vectors) or not batch_size:
+            return [[] for _ in range(batch_size)]
+
+        # time-major matrix of the indices
+        matrix = np.stack(vectors) if isinstance(vectors, list) else vectors
+
+        # the sentences end before the first end token
+        is_end = matrix == self.get_word_index(END_TOKEN)
+        lengths = np.where(is_end.any(axis=0), is_end.argmax(axis=0),
+                           matrix.shape[0])
+
+        if self._word_array is None:
+            self._word_array = np.array(self.index_to_word, dtype=object)
+        words = self._word_array[matrix[:lengths.max()].T]
+
+        return [row[:length].tolist() for row, length in zip(words, lengths)]
+
+    def _vectors_to_sentences_reference(
+            self,
+            vectors: Union[List[np.ndarray], np.ndarray]) -> List[List[str]]:
+        """Convert the vectors to words one by one.
+
+        This is the original implementation of ``vectors_to_sentences``
+        which is kept as a reference for tests.
+        """
+        if isinstance(vectors, list):
+            batch_size = vectors[0].shape[0]
+        else:
+            batch_size = vectors.shape[1]
+
         sentences = [[] for _ in range(batch_size)]  # type: List[List[str]]
 
         for vec in vectors:
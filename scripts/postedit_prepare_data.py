@@ -18,7 +18,8 @@ The inverse to this script is 'postedit_reconstruct_data.py'.
 
 import argparse
 import re
-import numpy as np
+from neuralmonkey.processors.editops import (convert_to_edits,
+                                             convert_to_edits_batch)
 from neuralmonkey.processors.german import GermanPreprocessor
 
 
@@ -28,47 +29,6 @@ def load_tokenized(text_file, preprocess=None):
     return [preprocess(re.split(r"[ ]", l.rstrip())) for l in text_file]
 
 
-def convert_to_edits(source, target):
-    keep = '<keep>'
-    delete = '<delete>'
-
-    lev = np.zeros([len(source) + 1, len(target) + 1])
-    edits = [[[] for _ in range(len(target) + 1)]
-             for _ in range(len(source) + 1)]
-
-    for i in range(len(source) + 1):
-        lev[i, 0] = i
-        edits[i][0] = [delete for _ in range(i)]
-
-    for j in range(len(target) + 1):
-        lev[0, j] = j
-        edits[0][j] = target[:j]
-
-    for j in range(1, len(target) + 1):
-        for i in range(1, len(source) + 1):
-
-            if source[i - 1] == target[j - 1]:
-                keep_cost = lev[i - 1, j - 1]
-            else:
-                keep_cost = np.inf
-
-            delete_cost = lev[i - 1, j] + 1
-            insert_cost = lev[i, j - 1] + 1
-
-            lev[i, j] = min(keep_cost, delete_cost, insert_cost)
-
-            if lev[i, j] == keep_cost:
-                edits[i][j] = edits[i - 1][j - 1] + [keep]
-
-            elif lev[i, j] == delete_cost:
-                edits[i][j] = edits[i - 1][j] + [delete]
-
-            else:
-                edits[i][j] = edits[i][j - 1] + [target[j - 1]]
-
-    return edits[-1][-1]
-
-
 def main():
     # print convert_to_edits(["hello", "john"], ["hi", "john", "how"])
 
@@ -79,6 +39,8 @@ def main():
     parser.add_argument("--target-sentences",
                         type=argparse.FileType('r'), required=True)
     parser.add_argument("--target-german", type=bool, default=False)
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="number of processes computing the edits")
 
     args = parser.parse_args()
 
@@ -91,8 +53,14 @@ def main():
     tgt_sentences = load_tokenized(
         args.target_sentences, preprocess=preprocess)
 
-    for trans, tgt in zip(trans_sentences, tgt_sentences):
-        edits = convert_to_edits(trans, tgt)
+    if args.num_workers > 1:
+        all_edits = convert_to_edits_batch(
+            trans_sentences, tgt_sentences, args.num_workers)
+    else:
+        all_edits = [convert_to_edits(trans, tgt) for trans, tgt
+                     in zip(trans_sentences, tgt_sentences)]
+
+    for edits in all_edits:
         print(" ".join(edits))
 
 if __name__ == '__main__':
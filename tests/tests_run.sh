@@ -6,6 +6,7 @@ export NEURALMONKEY_STRICT=1
 export PYTHONFAULTHANDLER=1
 
 bin/neuralmonkey-train tests/vocab.ini
+bin/neuralmonkey-preprocess tests/preprocess.ini
 bin/neuralmonkey-train tests/bahdanau.ini
 NEURALMONKEY_STRICT= bin/neuralmonkey-train tests/bpe.ini
 bin/neuralmonkey-train tests/bpe.ini -s 'decoder.encoders=[<encoder_frozen>]' -s 'main.initial_variables=["tests/outputs/bpe/variables.data"]'
@@ -41,7 +42,7 @@ if (( `echo "$score_single != $score_ensemble" | bc` )); then
 fi
 bin/neuralmonkey-run tests/beamsearch_ensembles.ini tests/test_data_ensembles_all.ini
 
-NM_EXPERIMENT_NAME=small bin/neuralmonkey-server --configuration=tests/small.ini --port=5000 &
+NM_EXPERIMENT_NAME=small bin/neuralmonkey-server --configuration=tests/small.ini --port=5000 --sort-by-length --deduplicate &
 SERVER_PID=$!
 sleep 20
 